@@ -1,17 +1,23 @@
-from flask import Flask, render_template, send_from_directory, jsonify, request, redirect
+from flask import Flask, render_template, jsonify, request, redirect, abort
 from werkzeug.exceptions import RequestEntityTooLarge
 from dotenv import load_dotenv
 import os
+import tempfile
 import bcrypt
+from contextlib import contextmanager
 from extensions import db
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
 # Load environment variables
 load_dotenv()
 
 # Initialize Flask app
+# No Flask static route: the frontend build is served by serve_react_app below
 app = Flask(__name__, 
            template_folder='templates',
-           static_folder='dist',
-           static_url_path='')
+           static_folder=None)
 
 # Configuration
 app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', 'simple-secret-key-for-development')
@@ -35,11 +41,15 @@ app.config['SQLALCHEMY_DATABASE_URI'] = database_url
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 app.config['UPLOAD_FOLDER'] = 'static/uploads'
 app.config['MAX_CONTENT_LENGTH'] = 50 * 1024 * 1024  # 50MB max file size
+# Chunked uploads send parts below MAX_CONTENT_LENGTH, so whole files can be larger
+app.config['MAX_CHUNKED_UPLOAD_SIZE'] = int(os.getenv('MAX_CHUNKED_UPLOAD_SIZE', 2 * 1024 * 1024 * 1024))
 
 # Initialize extensions
-from extensions import db, login_manager, cors
+from extensions import db, login_manager, cors, migrate
 
 db.init_app(app)
+# Schema changes live in migrations/; batch mode lets SQLite apply ALTERs
+migrate.init_app(app, db, directory=os.path.join(app.root_path, 'migrations'), render_as_batch=True)
 login_manager.init_app(app)
 login_manager.login_view = 'auth.login'
 login_manager.login_message = 'Please log in to access this page.'
@@ -71,6 +81,10 @@ from routes.annotations import annotations_bp
 from routes.qa import qa_bp
 from routes.discussions import discussions_bp
 from routes.ai_design import ai_design_bp
+from routes.search import search_bp
+from routes.sheets import sheets_bp
+from routes.pages import pages_bp
+from services import storage, static_assets
 
 app.register_blueprint(auth_bp, url_prefix='/api/auth')
 app.register_blueprint(projects_bp, url_prefix='/api/projects')
@@ -78,65 +92,40 @@ app.register_blueprint(annotations_bp, url_prefix='/api/annotations')
 app.register_blueprint(qa_bp, url_prefix='/api/qa')
 app.register_blueprint(discussions_bp, url_prefix='/api/discussions')
 app.register_blueprint(ai_design_bp, url_prefix='/api/ai-design')
+app.register_blueprint(search_bp, url_prefix='/api/search')
+app.register_blueprint(sheets_bp, url_prefix='/api/projects')
+app.register_blueprint(pages_bp, url_prefix='/api/projects')
 
-# Serve uploaded files
+# Serve uploaded files from the storage backend (see services/storage.py)
 @app.route('/static/uploads/<path:filename>')
 def serve_uploads(filename):
-    return send_from_directory(app.config['UPLOAD_FOLDER'], filename)
+    return storage.backend().send(filename)
 
 # Login page for web requests
 @app.route('/login')
 def login_page():
-    return send_from_directory(app.static_folder, 'index.html')
+    return serve_index()
+
+# Serve React App (from the manifest built at startup; see services/static_assets.py)
+FRONTEND_DIST = os.path.join(app.root_path, 'dist')
+static_assets.load(FRONTEND_DIST)
+
+def serve_index():
+    response = static_assets.send_asset('index.html')
+    if response is None:
+        return jsonify({'error': 'Frontend not built', 'static_folder': FRONTEND_DIST}), 500
+    return response
 
-# Serve React App
 @app.route('/')
 def serve_react_app_root():
-    try:
-        # Debug: Check if static folder and index.html exist
-        static_folder_path = app.static_folder
-        index_path = os.path.join(static_folder_path, 'index.html')
-        
-        print(f"Static folder: {static_folder_path}")
-        print(f"Looking for index.html at: {index_path}")
-        print(f"Static folder exists: {os.path.exists(static_folder_path)}")
-        print(f"index.html exists: {os.path.exists(index_path)}")
-        
-        if os.path.exists(index_path):
-            return send_from_directory(app.static_folder, 'index.html')
-        else:
-            # List files in static folder for debugging
-            files = []
-            if os.path.exists(static_folder_path):
-                try:
-                    files = os.listdir(static_folder_path)
-                    print(f"Files in static folder: {files}")
-                except Exception as e:
-                    print(f"Error listing static folder: {e}")
-                    files = [f"Error: {e}"]
-            else:
-                print(f"Static folder does not exist: {static_folder_path}")
-                
-            return jsonify({
-                'error': 'Frontend not built',
-                'static_folder': static_folder_path,
-                'index_exists': os.path.exists(index_path),
-                'files': files,
-                'current_working_directory': os.getcwd(),
-                'all_files_in_root': os.listdir('.') if os.path.exists('.') else []
-            }), 500
-    except Exception as e:
-        print(f"Error serving React app: {e}")
-        return jsonify({'error': f'Static file error: {str(e)}'}), 500
+    return serve_index()
 
 @app.route('/<path:path>')
 def serve_react_app(path):
-    # Check if it's a static file that exists
-    if os.path.exists(os.path.join(app.static_folder, path)):
-        return send_from_directory(app.static_folder, path)
-    else:
-        # For any other path, serve the React app (for client-side routing)
-        return send_from_directory(app.static_folder, 'index.html')
+    # Build files are served from memory; any other path is client-side routing
+    if path.startswith('api/'):
+        abort(404)
+    return static_assets.send_asset(path) or serve_index()
 
 # Health check endpoint
 @app.route('/api/health')
@@ -179,7 +168,7 @@ def not_found(error):
     if request.path.startswith('/api/'):
         return jsonify(error='Resource not found'), 404
     # For non-API requests, serve the React app
-    return send_from_directory(app.static_folder, 'index.html')
+    return serve_index()
 
 @app.errorhandler(500)
 def internal_error(error):
@@ -195,22 +184,61 @@ def file_too_large(e):
     return jsonify(error="File is larger than the maximum allowed size (50MB)."), 413
 
 
+# Revision matching the schema that db.create_all() used to produce
+INITIAL_SCHEMA_REVISION = '45bbc7a7738b'
+# Key of the PostgreSQL advisory lock held while the schema is upgraded
+MIGRATION_LOCK_KEY = 7263015
+MIGRATION_LOCK_FILE = os.path.join(tempfile.gettempdir(), 'interior_design_migrations.lock')
+
+@contextmanager
+def migration_lock():
+    """Let one process at a time upgrade the schema.
+    
+    Every server process (each gunicorn worker, unless the app is preloaded)
+    runs the startup below; the others wait here and then find the schema
+    already up to date. PostgreSQL serialises with an advisory lock, which
+    covers processes on other hosts too; SQLite is local, so a lock file is
+    enough.
+    """
+    if db.engine.dialect.name == 'postgresql':
+        with db.engine.connect() as connection:
+            connection.execute(db.text('SELECT pg_advisory_lock(:key)'), {'key': MIGRATION_LOCK_KEY})
+            try:
+                yield
+            finally:
+                connection.execute(db.text('SELECT pg_advisory_unlock(:key)'), {'key': MIGRATION_LOCK_KEY})
+                connection.commit()
+    elif fcntl is not None:
+        with open(MIGRATION_LOCK_FILE, 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+    else:
+        # No flock (Windows): a single waitress process starts the app anyway
+        yield
+
 # Create database tables
-with app.app_context():
+with app.app_context(), migration_lock():
     print("Starting database initialization...")
     print(f"Database URL: {app.config['SQLALCHEMY_DATABASE_URI']}")
     
     try:
-        # Check if tables exist before creating
+        # Bring the schema up to date with the migrations in migrations/
         from sqlalchemy import inspect
+        from flask_migrate import upgrade, stamp
         inspector = inspect(db.engine)
         existing_tables = inspector.get_table_names()
         
-        if not existing_tables:
-            db.create_all()
-            print("Database tables created successfully")
-        else:
-            print(f"Database tables already exist: {existing_tables}")
+        if existing_tables and 'alembic_version' not in existing_tables:
+            # Databases created by db.create_all() before migrations existed
+            # already have the initial schema; only apply what came after it
+            stamp(revision=INITIAL_SCHEMA_REVISION)
+            print("Existing database stamped at the initial schema revision")
+        
+        upgrade()
+        print("Database schema is up to date")
     except Exception as e:
         print(f"Error checking/creating database tables: {e}")
         # Fallback: try to create tables anyway
@@ -245,6 +273,17 @@ with app.app_context():
         print(f"Error creating default user: {e}")
         print("Continuing without default user - users can register normally")
 
+# Background job workers (Q&A answers, PDF text extraction); JOB_WORKERS=0 disables.
+# Not started at import: gunicorn imports the app in the master and forks,
+# and threads do not survive fork. Gunicorn workers start theirs from the
+# post_fork hook in gunicorn.conf.py, waitress before it serves; any other
+# server starts them on its first request.
+from services import jobs
+
+@app.before_request
+def start_job_workers():
+    jobs.start_workers(app)
+
 print("Flask app initialization completed successfully!")
 
 if __name__ == '__main__':
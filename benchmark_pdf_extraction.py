@@ -0,0 +1,93 @@
+"""
+Benchmark PDF text extraction: one process vs the extraction pool.
+
+Generates a multi-hundred-page sample PDF (or uses the one given) and
+times services.pdf_extraction against plain sequential PyPDF2 extraction.
+
+Usage:
+    python benchmark_pdf_extraction.py [--pages 400] [--pdf path/to/file.pdf]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+from services import pdf_extraction
+
+LINES_PER_PAGE = 45
+
+
+def make_sample_pdf(path, num_pages):
+    """Write a text-heavy PDF with num_pages pages"""
+    objects = [b'<< /Type /Catalog /Pages 2 0 R >>', None]
+    font_id = 3 + 2 * num_pages
+    kids = []
+    for page in range(num_pages):
+        page_id = 3 + 2 * page
+        kids.append(f'{page_id} 0 R')
+        objects.append((
+            f'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] '
+            f'/Resources << /Font << /F1 {font_id} 0 R >> >> /Contents {page_id + 1} 0 R >>'
+        ).encode())
+        lines = [
+            f'({page + 1}.{line} Room schedule: oak flooring, 2400mm ceiling, LED downlights x{line}) Tj 0 -15 Td'
+            for line in range(LINES_PER_PAGE)
+        ]
+        stream = ('BT /F1 10 Tf 40 760 Td ' + ' '.join(lines) + ' ET').encode()
+        objects.append(b'<< /Length %d >>\nstream\n' % len(stream) + stream + b'\nendstream')
+    objects[1] = f'<< /Type /Pages /Kids [{" ".join(kids)}] /Count {num_pages} >>'.encode()
+    objects.append(b'<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>')
+
+    with open(path, 'wb') as out:
+        out.write(b'%PDF-1.4\n')
+        offsets = []
+        for number, body in enumerate(objects, start=1):
+            offsets.append(out.tell())
+            out.write(f'{number} 0 obj\n'.encode() + body + b'\nendobj\n')
+        xref = out.tell()
+        out.write(f'xref\n0 {len(objects) + 1}\n0000000000 65535 f \n'.encode())
+        for offset in offsets:
+            out.write(f'{offset:010d} 00000 n \n'.encode())
+        out.write(f'trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n'.encode())
+
+
+def timed(label, func):
+    start = time.perf_counter()
+    result = func()
+    elapsed = time.perf_counter() - start
+    print(f"{label:<28} {elapsed:8.2f}s")
+    return result, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--pages', type=int, default=400, help='pages in the generated sample')
+    parser.add_argument('--pdf', help='benchmark an existing PDF instead')
+    args = parser.parse_args()
+
+    path = args.pdf
+    if not path:
+        path = os.path.join(tempfile.gettempdir(), f'benchmark_{args.pages}_pages.pdf')
+        make_sample_pdf(path, args.pages)
+
+    num_pages = min(pdf_extraction.page_count(path), pdf_extraction.MAX_PAGES)
+    print(f"PDF: {path} ({num_pages} pages, {os.path.getsize(path) / 1024:.0f} KB)")
+    print(f"Workers: {pdf_extraction.WORKERS}")
+    print("-" * 50)
+
+    sequential, sequential_time = timed(
+        'Sequential (one process)', lambda: pdf_extraction.extract_range(path, 0, num_pages))
+    # The first pooled call also pays for starting the worker processes
+    timed('Pool (cold)', lambda: pdf_extraction.extract_pages(path))
+    pooled, pooled_time = timed('Pool (warm)', lambda: pdf_extraction.extract_pages(path))
+
+    print("-" * 50)
+    if pooled != sequential:
+        print("❌ Pooled output differs from sequential output")
+        sys.exit(1)
+    print(f"✓ Identical output, speedup {sequential_time / pooled_time:.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -5,9 +5,11 @@ This file prevents circular imports by centralizing extension instances
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import LoginManager
 from flask_cors import CORS
+from flask_migrate import Migrate
 
 # Initialize extensions (without app)
 db = SQLAlchemy()
 login_manager = LoginManager()
 cors = CORS()
+migrate = Migrate()
 
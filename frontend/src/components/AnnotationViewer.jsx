@@ -1,5 +1,8 @@
 import React, { useState, useEffect, useRef } from 'react';
-import { annotationsAPI } from '../services/api';
+import { annotationsAPI, pagesAPI } from '../services/api';
+
+// Width of a rendered page on the canvas before zooming
+const PAGE_WIDTH = 1200;
 
 const AnnotationViewer = ({ file, projectId }) => {
   const canvasRef = useRef(null);
@@ -15,6 +18,8 @@ const AnnotationViewer = ({ file, projectId }) => {
   const [showColorPicker, setShowColorPicker] = useState(false);
   const [scale, setScale] = useState(1);
   const [error, setError] = useState(null);
+  const [pages, setPages] = useState(null);
+  const [currentPage, setCurrentPage] = useState(1);
 
   if (!file || !projectId) {
     return (
@@ -48,11 +53,40 @@ const AnnotationViewer = ({ file, projectId }) => {
     }
   }, [file]);
 
+  useEffect(() => {
+    setPages(null);
+    setCurrentPage(1);
+    if (!file || file.type !== 'pdf') return;
+
+    // Pages show up as the server renders them; poll until all are there
+    let timer = null;
+    let cancelled = false;
+    const loadPages = async () => {
+      try {
+        const response = await pagesAPI.list(projectId, file.id);
+        if (cancelled) return;
+        setPages(response.data);
+        if (response.data.status === 'pending') {
+          timer = setTimeout(loadPages, 1000);
+        }
+      } catch (error) {
+        console.error('Failed to load rendered pages:', error);
+        // Fall back to showing the PDF itself
+        if (!cancelled) setPages({ status: null, pages: [] });
+      }
+    };
+    loadPages();
+    return () => {
+      cancelled = true;
+      clearTimeout(timer);
+    };
+  }, [file, projectId]);
+
   useEffect(() => {
     if (canvasRef.current) {
       drawCanvas();
     }
-  }, [annotations, tempAnnotation, scale]);
+  }, [annotations, tempAnnotation, scale, currentPage, pages]);
 
   const loadAnnotations = async () => {
     try {
@@ -88,9 +122,11 @@ const AnnotationViewer = ({ file, projectId }) => {
     ctx.clearRect(0, 0, canvas.width, canvas.height);
 
     // Draw all saved annotations
-    annotations.forEach((annotation) => {
-      drawAnnotation(ctx, annotation);
-    });
+    annotations
+      .filter((annotation) => (annotation.page || 1) === currentPage)
+      .forEach((annotation) => {
+        drawAnnotation(ctx, annotation);
+      });
 
     // Draw temporary annotation being created
     if (tempAnnotation) {
@@ -267,7 +303,7 @@ const AnnotationViewer = ({ file, projectId }) => {
         height: annotationData.height || 0,
         text: annotationData.text || '',
         color: annotationData.color,
-        page: 1,
+        page: currentPage,
       };
 
       // For pencil tool, encode points as JSON string in text field
@@ -313,6 +349,38 @@ const AnnotationViewer = ({ file, projectId }) => {
     setScale((prev) => Math.max(0.5, Math.min(3, prev + delta)));
   };
 
+  const renderedPage = pages?.pages.find((entry) => entry.page === currentPage);
+  const pageHeight = renderedPage ? Math.round(PAGE_WIDTH * renderedPage.height / renderedPage.width) : 800;
+
+  const renderTiles = (entry) => {
+    // Smallest zoom level with enough pixels for the zoom and screen density
+    const needed = (PAGE_WIDTH / entry.width) * scale * (window.devicePixelRatio || 1);
+    const level = entry.levels.find((l) => l.scale >= needed) || entry.levels[entry.levels.length - 1];
+    const size = pages.tile_size;
+    const tiles = [];
+    for (let y = 0; y * size < level.height; y++) {
+      for (let x = 0; x * size < level.width; x++) {
+        tiles.push(
+          <img
+            key={`${level.level}-${x}-${y}`}
+            src={pagesAPI.tileUrl(projectId, file.id, entry.page, level.level, x, y)}
+            alt=""
+            loading="lazy"
+            draggable={false}
+            className="absolute"
+            style={{
+              left: `${(x * size / level.width) * 100}%`,
+              top: `${(y * size / level.height) * 100}%`,
+              width: `${(Math.min(size, level.width - x * size) / level.width) * 100}%`,
+              height: `${(Math.min(size, level.height - y * size) / level.height) * 100}%`,
+            }}
+          />
+        );
+      }
+    }
+    return tiles;
+  };
+
   return (
     <div className="flex flex-col h-full">
       {/* Error Message */}
@@ -451,6 +519,30 @@ const AnnotationViewer = ({ file, projectId }) => {
         </div>
       </div>
 
+      {/* Page Thumbnails */}
+      {pages?.page_count > 1 && (
+        <div className="bg-white border-b border-gray-200 px-4 py-2 flex gap-2 overflow-x-auto">
+          {pages.pages.map((entry) => (
+            <button
+              key={entry.page}
+              onClick={() => setCurrentPage(entry.page)}
+              className={`flex-shrink-0 flex flex-col items-center p-1 rounded ${
+                currentPage === entry.page ? 'ring-2 ring-blue-500' : 'hover:bg-gray-100'
+              }`}
+              title={`Page ${entry.page}`}
+            >
+              <img
+                src={pagesAPI.thumbnailUrl(projectId, file.id, entry.page)}
+                alt={`Page ${entry.page}`}
+                loading="lazy"
+                className="h-20 border border-gray-200"
+              />
+              <span className="text-xs text-gray-600 mt-1">{entry.page}</span>
+            </button>
+          ))}
+        </div>
+      )}
+
       {/* Canvas Container */}
       <div 
         ref={containerRef}
@@ -458,7 +550,26 @@ const AnnotationViewer = ({ file, projectId }) => {
       >
         {/* PDF Background */}
         <div className="relative inline-block min-w-full">
-          {file.type === 'pdf' ? (
+          {file.type === 'pdf' && renderedPage ? (
+            <div
+              className="relative bg-white"
+              style={{
+                width: `${PAGE_WIDTH}px`,
+                height: `${pageHeight}px`,
+                backgroundImage: `url(${pagesAPI.thumbnailUrl(projectId, file.id, currentPage)})`,
+                backgroundSize: '100% 100%',
+                transform: `scale(${scale})`,
+                transformOrigin: 'top left',
+              }}
+            >
+              {renderTiles(renderedPage)}
+            </div>
+          ) : file.type === 'pdf' && (!pages || pages.status === 'pending') ? (
+            <div className="flex items-center justify-center text-gray-500" style={{ height: '800px' }}>
+              <i className="fas fa-spinner fa-spin mr-2"></i>
+              Rendering pages...
+            </div>
+          ) : file.type === 'pdf' ? (
             <iframe
               src={file.url}
               className="w-full border-0"
@@ -485,8 +596,8 @@ const AnnotationViewer = ({ file, projectId }) => {
           {/* Drawing Canvas Overlay */}
           <canvas
             ref={canvasRef}
-            width={1200}
-            height={800}
+            width={PAGE_WIDTH}
+            height={pageHeight}
             onMouseDown={handleMouseDown}
             onMouseMove={handleMouseMove}
             onMouseUp={handleMouseUp}
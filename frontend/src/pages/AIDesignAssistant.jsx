@@ -3,6 +3,7 @@ import { useParams } from 'react-router-dom';
 import axios from 'axios';
 import LoadingSpinner from '../components/LoadingSpinner';
 import Toast from '../components/Toast';
+import { aiDesignAPI } from '../services/api';
 
 const AIDesignAssistant = () => {
   const { projectId } = useParams();
@@ -40,20 +41,14 @@ const AIDesignAssistant = () => {
     setLoading(true);
     setAnalysis('');
     try {
-      const token = localStorage.getItem('token');
-      const headers = token ? { Authorization: `Bearer ${token}` } : {};
-      
-      const response = await axios.post(
-        `${API_BASE}/ai-design/analyze/${projectId}`,
-        {},
-        { headers }
-      );
-      
-      setAnalysis(response.data.analysis);
+      // Streamed, so the analysis appears as it is written
+      await aiDesignAPI.stream(`/ai-design/analyze/${projectId}`, {}, (text) => {
+        setAnalysis((current) => current + text);
+      });
       setToast({ type: 'success', message: 'Analysis complete!' });
     } catch (error) {
       console.error('Error:', error);
-      const message = error.response?.data?.message || error.response?.data?.error || 'Analysis failed';
+      const message = error.message || 'Analysis failed';
       setToast({ type: 'error', message });
     } finally {
       setLoading(false);
@@ -562,8 +562,8 @@ const AnnotationEditor = () => {
     if (!window.confirm('Delete all annotations? This cannot be undone.')) return;
 
     try {
-      for (const annotation of annotations) {
-        await annotationsAPI.delete(annotation.id);
+      if (annotations.length > 0) {
+        await annotationsAPI.batch(annotations.map((a) => ({ op: 'delete', id: a.id })));
       }
       setAnnotations([]);
       setSelectedAnnotation(null);
@@ -7,6 +7,9 @@ import Modal from '../components/Modal';
 import LoadingSpinner from '../components/LoadingSpinner';
 import Toast from '../components/Toast';
 
+// Files above this size go through the resumable chunked upload API
+const CHUNKED_UPLOAD_THRESHOLD = 16 * 1024 * 1024;
+
 const ProjectDetail = () => {
   const { id } = useParams();
   const navigate = useNavigate();
@@ -40,6 +43,20 @@ const ProjectDetail = () => {
     }
   }, [activeTab]);
 
+  // Answers are pushed by the server while any question is still waiting
+  const awaitingAnswers = activeTab === 'qa' && questions.some((q) => !q.answered);
+  useEffect(() => {
+    if (!awaitingAnswers) return undefined;
+    const source = qaAPI.subscribe(id, {
+      // Picks up anything answered before the stream opened
+      onReady: () => loadQuestions(true),
+      onAnswer: (answered) => {
+        setQuestions((current) => current.map((q) => (q.id === answered.id ? answered : q)));
+      },
+    });
+    return () => source.close();
+  }, [id, awaitingAnswers]);
+
   const loadProject = async () => {
     try {
       setLoading(true);
@@ -53,9 +70,9 @@ const ProjectDetail = () => {
     }
   };
 
-  const loadQuestions = async () => {
+  const loadQuestions = async (quiet = false) => {
     try {
-      setLoadingQuestions(true);
+      if (!quiet) setLoadingQuestions(true);
       const response = await qaAPI.getByProject(id);
       setQuestions(response.data);
     } catch (error) {
@@ -85,9 +102,8 @@ const ProjectDetail = () => {
       await qaAPI.create({ project_id: parseInt(id), question: newQuestion });
       setNewQuestion('');
       showToast('Question submitted! AI is processing...', 'success');
-      setTimeout(loadQuestions, 500);
-      // Reload after AI response (3 seconds)
-      setTimeout(loadQuestions, 3000);
+      // The answer arrives over the Q&A stream once it is ready
+      loadQuestions(true);
     } catch (error) {
       showToast('Failed to submit question', 'error');
     }
@@ -122,7 +138,11 @@ const ProjectDetail = () => {
 
     try {
       setUploading(true);
-      await projectsAPI.uploadFile(id, formData);
+      if (selectedFile.size > CHUNKED_UPLOAD_THRESHOLD) {
+        await projectsAPI.uploadFileChunked(id, selectedFile);
+      } else {
+        await projectsAPI.uploadFile(id, formData);
+      }
       showToast('File uploaded successfully!', 'success');
       setIsUploadModalOpen(false);
       setSelectedFile(null);
@@ -24,6 +24,19 @@ api.interceptors.response.use(
   }
 );
 
+// Chunked uploads: part size when resuming (the server's recommendation when starting),
+// and the largest file hashed in the browser (WebCrypto digests a whole buffer at once)
+const UPLOAD_PART_SIZE = 8 * 1024 * 1024;
+const HASH_SIZE_LIMIT = 512 * 1024 * 1024;
+
+// Hex SHA-256 of a file or slice, or null where it cannot be computed here
+// (too large, or WebCrypto unavailable outside secure contexts)
+const sha256Hex = async (blob) => {
+  if (!window.crypto?.subtle || blob.size > HASH_SIZE_LIMIT) return null;
+  const digest = await window.crypto.subtle.digest('SHA-256', await blob.arrayBuffer());
+  return Array.from(new Uint8Array(digest), (byte) => byte.toString(16).padStart(2, '0')).join('');
+};
+
 // Auth API
 export const authAPI = {
   login: (credentials) => api.post('/auth/login', credentials),
@@ -45,6 +58,51 @@ export const projectsAPI = {
       headers: { 'Content-Type': 'multipart/form-data' },
     });
   },
+  // Resumable upload: sends the file in parts and skips parts the server already has.
+  // An interrupted upload of the same file to the same project picks up its session
+  // again, and content the server already stores is not sent at all.
+  uploadFileChunked: async (id, file) => {
+    const resumeKey = `upload:${id}:${file.name}:${file.size}:${file.lastModified}`;
+    let session = null;
+    const savedId = localStorage.getItem(resumeKey);
+    if (savedId) {
+      try {
+        ({ data: session } = await api.get(`/projects/${id}/uploads/${savedId}`));
+      } catch (error) {
+        // Gone, or staged on another server instance: start over
+        if (![404, 409].includes(error.response?.status)) throw error;
+        localStorage.removeItem(resumeKey);
+      }
+    }
+    if (!session) {
+      const response = await api.post(`/projects/${id}/uploads`, {
+        filename: file.name,
+        size: file.size,
+        sha256: await sha256Hex(file),
+      });
+      if (response.data.file) return response; // deduplicated
+      session = response.data;
+      localStorage.setItem(resumeKey, session.upload_id);
+    }
+    const partSize = session.part_size || UPLOAD_PART_SIZE;
+    const received = session.received || [];
+    const hasRange = (start, end) => received.some(([s, e]) => s <= start && end <= e);
+    for (let offset = 0; offset < file.size; offset += partSize) {
+      const end = Math.min(offset + partSize, file.size);
+      if (hasRange(offset, end)) continue;
+      const part = file.slice(offset, end);
+      const checksum = await sha256Hex(part);
+      await api.put(`/projects/${id}/uploads/${session.upload_id}?offset=${offset}`, part, {
+        headers: {
+          'Content-Type': 'application/octet-stream',
+          ...(checksum && { 'X-Content-SHA256': checksum }),
+        },
+      });
+    }
+    const response = await api.post(`/projects/${id}/uploads/${session.upload_id}/complete`);
+    localStorage.removeItem(resumeKey);
+    return response;
+  },
 };
 
 // Annotations API
@@ -54,6 +112,16 @@ export const annotationsAPI = {
   create: (annotationData) => api.post('/annotations', annotationData),
   update: (id, annotationData) => api.put(`/annotations/${id}`, annotationData),
   delete: (id) => api.delete(`/annotations/${id}`),
+  batch: (operations) => api.post('/annotations/batch', { operations }),
+};
+
+// Rendered PDF pages (thumbnails and zoom tiles)
+export const pagesAPI = {
+  list: (projectId, fileId) => api.get(`/projects/${projectId}/files/${fileId}/pages`),
+  thumbnailUrl: (projectId, fileId, page) =>
+    `${API_BASE_URL}/projects/${projectId}/files/${fileId}/pages/${page}/thumbnail`,
+  tileUrl: (projectId, fileId, page, level, x, y) =>
+    `${API_BASE_URL}/projects/${projectId}/files/${fileId}/pages/${page}/tiles/${level}/${x}/${y}`,
 };
 
 // Q&A API
@@ -62,6 +130,15 @@ export const qaAPI = {
   create: (questionData) => api.post('/qa', questionData),
   answer: (id, answerData) => api.put(`/qa/${id}/answer`, answerData),
   delete: (id) => api.delete(`/qa/${id}`),
+  // Pushes answers to the project's questions as they are saved. onReady runs
+  // when the stream (re)opens without a resume point, onAnswer gets each
+  // answered question. Call close() on the result to stop.
+  subscribe: (projectId, { onReady, onAnswer }) => {
+    const source = new EventSource(`${API_BASE_URL}/qa/project/${projectId}/stream`, { withCredentials: true });
+    source.addEventListener('ready', () => onReady && onReady());
+    source.addEventListener('answered', (event) => onAnswer(JSON.parse(event.data)));
+    return source;
+  },
 };
 
 // Discussions API
@@ -78,6 +155,45 @@ export const aiDesignAPI = {
   getMaterialRecommendations: (projectId, data) => api.post(`/ai-design/material-recommendations/${projectId}`, data),
   getCostEstimate: (projectId, data) => api.post(`/ai-design/cost-estimate/${projectId}`, data),
   quickSuggestion: (question) => api.post('/ai-design/quick-suggestion', { question }),
+  // Streams an endpoint over server-sent events, calling onText with each
+  // piece of the answer as it arrives; resolves with the final "done" payload
+  stream: async (path, data, onText) => {
+    const response = await fetch(`${API_BASE_URL}${path}?stream=1`, {
+      method: 'POST',
+      credentials: 'include',
+      headers: { 'Content-Type': 'application/json', Accept: 'text/event-stream' },
+      body: JSON.stringify(data || {}),
+    });
+    if (!response.ok) {
+      const body = await response.json().catch(() => ({}));
+      throw new Error(body.message || body.error || `Request failed (${response.status})`);
+    }
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    for (;;) {
+      const { value, done } = await reader.read();
+      if (done) break;
+      buffer += decoder.decode(value, { stream: true });
+      let boundary;
+      while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+        const frame = buffer.slice(0, boundary);
+        buffer = buffer.slice(boundary + 2);
+        let event = 'message';
+        let payload = '';
+        for (const line of frame.split('\n')) {
+          if (line.startsWith('event: ')) event = line.slice(7);
+          else if (line.startsWith('data: ')) payload += line.slice(6);
+        }
+        if (!payload) continue;
+        const message = JSON.parse(payload);
+        if (event === 'token') onText(message.text);
+        else if (event === 'error') throw new Error(message.error);
+        else if (event === 'done') return message;
+      }
+    }
+    throw new Error('Stream ended before the answer was complete');
+  },
 };
 
 export default api;
@@ -0,0 +1,14 @@
+"""
+Gunicorn settings shared by every way of starting it (start_server.py
+passes the rest on the command line; `gunicorn app:app` in the project
+directory picks this file up by itself).
+"""
+
+
+def post_fork(server, worker):
+    # Each worker runs its own background job threads (see services/jobs.py).
+    # Start them as soon as the worker exists rather than on its first
+    # request, so queued jobs and the recover hooks run on an idle server too.
+    from app import app
+    from services import jobs
+    jobs.start_workers(app)
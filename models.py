@@ -1,6 +1,7 @@
 from extensions import db
 from flask_login import UserMixin
 from datetime import datetime
+import json
 
 class User(UserMixin, db.Model):
     __tablename__ = 'users'
@@ -26,11 +27,16 @@ class User(UserMixin, db.Model):
 
 class Project(db.Model):
     __tablename__ = 'projects'
+    __table_args__ = (
+        db.Index('ix_projects_user_id_updated_at', 'user_id', 'updated_at'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(200), nullable=False)
     description = db.Column(db.Text)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    # Bumped on every change to the project's files and collaboration data
+    version = db.Column(db.Integer, nullable=False, default=0, server_default='0')
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
@@ -39,6 +45,7 @@ class Project(db.Model):
     annotations = db.relationship('Annotation', backref='project', lazy=True, cascade='all, delete-orphan')
     questions = db.relationship('Question', backref='project', lazy=True, cascade='all, delete-orphan')
     discussions = db.relationship('Discussion', backref='project', lazy=True, cascade='all, delete-orphan')
+    upload_sessions = db.relationship('UploadSession', backref='project', lazy=True, cascade='all, delete-orphan')
     
     def to_dict(self):
         return {
@@ -50,6 +57,19 @@ class Project(db.Model):
             'updated_at': self.updated_at.isoformat(),
             'files': [f.to_dict() for f in self.files]
         }
+    
+    def to_summary_dict(self, file_count, last_upload_at):
+        """Lightweight listing representation that does not touch the files relationship"""
+        return {
+            'id': self.id,
+            'name': self.name,
+            'description': self.description,
+            'user_id': self.user_id,
+            'created_at': self.created_at.isoformat(),
+            'updated_at': self.updated_at.isoformat(),
+            'file_count': file_count,
+            'last_upload_at': last_upload_at.isoformat() if last_upload_at else None
+        }
 
 class ProjectFile(db.Model):
     __tablename__ = 'project_files'
@@ -59,11 +79,20 @@ class ProjectFile(db.Model):
     file_type = db.Column(db.String(20), nullable=False)  # pdf, excel
     file_path = db.Column(db.String(500), nullable=False)
     file_size = db.Column(db.Integer)
-    project_id = db.Column(db.Integer, db.ForeignKey('projects.id'), nullable=False)
+    project_id = db.Column(db.Integer, db.ForeignKey('projects.id'), nullable=False, index=True)
+    # Shared content; NULL for files uploaded before content-addressed storage
+    blob_id = db.Column(db.Integer, db.ForeignKey('file_blobs.id'), index=True)
+    # PDF text extraction: pending, ready or failed; NULL if never scheduled
+    text_status = db.Column(db.String(20))
+    # Spreadsheet ingestion into the columnar sheet cache, same states
+    sheet_status = db.Column(db.String(20))
+    # Page thumbnails and zoom tiles (services/page_tiles.py), same states
+    tile_status = db.Column(db.String(20))
     uploaded_at = db.Column(db.DateTime, default=datetime.utcnow)
     
     # Relationships
     annotations = db.relationship('Annotation', backref='file', lazy=True, cascade='all, delete-orphan')
+    blob = db.relationship('FileBlob', lazy=True)
     
     def to_dict(self):
         return {
@@ -72,11 +101,109 @@ class ProjectFile(db.Model):
             'type': self.file_type,
             'url': f'/static/uploads/{self.file_path}',
             'size': self.file_size,
+            'text_status': self.text_status,
+            'sheet_status': self.sheet_status,
+            'tile_status': self.tile_status,
             'uploaded_at': self.uploaded_at.isoformat()
         }
 
+class FileBlob(db.Model):
+    """Uploaded content stored once under its SHA-256 and shared by ProjectFiles"""
+    __tablename__ = 'file_blobs'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    sha256 = db.Column(db.String(64), unique=True, nullable=False)
+    size = db.Column(db.BigInteger, nullable=False)
+    path = db.Column(db.String(500), nullable=False)
+    ref_count = db.Column(db.Integer, nullable=False, default=0)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class FilePageText(db.Model):
+    """Extracted text of one PDF page (see services/pdf_text.py)"""
+    __tablename__ = 'file_page_texts'
+    
+    file_id = db.Column(db.Integer, db.ForeignKey('project_files.id', ondelete='CASCADE'), primary_key=True)
+    page = db.Column(db.Integer, primary_key=True)  # 1-based, like Annotation.page
+    text = db.Column(db.Text, nullable=False)
+
+class FileSheet(db.Model):
+    """One worksheet of an uploaded spreadsheet, cached column by column (see services/sheets.py)"""
+    __tablename__ = 'file_sheets'
+    
+    file_id = db.Column(db.Integer, db.ForeignKey('project_files.id', ondelete='CASCADE'), primary_key=True)
+    sheet = db.Column(db.Integer, primary_key=True)  # 0-based position in the workbook
+    name = db.Column(db.String(255), nullable=False)
+    row_count = db.Column(db.Integer, nullable=False)
+    # JSON list of {"name", "kind"}; kind is number, date or text
+    columns = db.Column(db.Text, nullable=False)
+    # Rows past SHEET_MAX_ROWS were not cached
+    truncated = db.Column(db.Boolean, default=False)
+    
+    def to_dict(self):
+        return {
+            'sheet': self.sheet,
+            'name': self.name,
+            'row_count': self.row_count,
+            'columns': json.loads(self.columns),
+            'truncated': self.truncated
+        }
+
+class UploadSession(db.Model):
+    """A resumable chunked upload in progress"""
+    __tablename__ = 'upload_sessions'
+    
+    id = db.Column(db.String(32), primary_key=True)
+    project_id = db.Column(db.Integer, db.ForeignKey('projects.id'), nullable=False, index=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    name = db.Column(db.String(255), nullable=False)
+    file_type = db.Column(db.String(20), nullable=False)
+    stored_name = db.Column(db.String(500), nullable=False)
+    total_size = db.Column(db.BigInteger, nullable=False)
+    sha256 = db.Column(db.String(64))
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    # Relationships
+    parts = db.relationship('UploadPart', backref='session', lazy=True, cascade='all, delete-orphan')
+    
+    def received_ranges(self):
+        """Merged [start, end) byte ranges that have been received so far"""
+        ranges = []
+        for start, end in sorted((p.offset, p.offset + p.length) for p in self.parts):
+            if ranges and start <= ranges[-1][1]:
+                ranges[-1][1] = max(ranges[-1][1], end)
+            else:
+                ranges.append([start, end])
+        return ranges
+    
+    def to_dict(self):
+        received = self.received_ranges()
+        return {
+            'upload_id': self.id,
+            'project_id': self.project_id,
+            'name': self.name,
+            'size': self.total_size,
+            'received': received,
+            'received_bytes': sum(end - start for start, end in received),
+            'created_at': self.created_at.isoformat()
+        }
+
+class UploadPart(db.Model):
+    """A verified byte range written for an upload session"""
+    __tablename__ = 'upload_parts'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    session_id = db.Column(db.String(32), db.ForeignKey('upload_sessions.id'), nullable=False, index=True)
+    offset = db.Column(db.BigInteger, nullable=False)
+    length = db.Column(db.BigInteger, nullable=False)
+    sha256 = db.Column(db.String(64), nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
 class Annotation(db.Model):
     __tablename__ = 'annotations'
+    __table_args__ = (
+        db.Index('ix_annotations_file_id_page', 'file_id', 'page'),
+        db.Index('ix_annotations_project_id_created_at', 'project_id', 'created_at'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     project_id = db.Column(db.Integer, db.ForeignKey('projects.id'), nullable=False)
@@ -113,8 +240,45 @@ class Annotation(db.Model):
             'created_at': self.created_at.isoformat()
         }
 
+class AnnotationCell(db.Model):
+    """Grid cell entry of the annotation spatial index (see services/spatial.py)"""
+    __tablename__ = 'annotation_cells'
+    __table_args__ = (
+        db.Index('ix_annotation_cells_lookup', 'file_id', 'page', 'level', 'cell_x', 'cell_y'),
+    )
+    
+    annotation_id = db.Column(db.Integer, db.ForeignKey('annotations.id', ondelete='CASCADE'), primary_key=True)
+    level = db.Column(db.Integer, primary_key=True)
+    cell_x = db.Column(db.Integer, primary_key=True)
+    cell_y = db.Column(db.Integer, primary_key=True)
+    file_id = db.Column(db.Integer, nullable=False)
+    page = db.Column(db.Integer, nullable=False)
+    min_x = db.Column(db.Float, nullable=False)
+    min_y = db.Column(db.Float, nullable=False)
+    max_x = db.Column(db.Float, nullable=False)
+    max_y = db.Column(db.Float, nullable=False)
+
+class AnnotationChange(db.Model):
+    """Append-only log of annotation writes; the project version is the sync token"""
+    __tablename__ = 'annotation_changes'
+    __table_args__ = (
+        db.Index('ix_annotation_changes_project_id_version', 'project_id', 'version'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    project_id = db.Column(db.Integer, db.ForeignKey('projects.id'), nullable=False)
+    # projects.version after the write, which orders changes by commit
+    version = db.Column(db.Integer, nullable=False, server_default='0')
+    # Not a foreign key: deleted annotations keep their tombstones
+    annotation_id = db.Column(db.Integer, nullable=False)
+    op = db.Column(db.String(10), nullable=False)  # upsert, delete
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
 class Question(db.Model):
     __tablename__ = 'questions'
+    __table_args__ = (
+        db.Index('ix_questions_project_id_created_at', 'project_id', 'created_at'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     project_id = db.Column(db.Integer, db.ForeignKey('projects.id'), nullable=False)
@@ -141,8 +305,25 @@ class Question(db.Model):
             'updated_at': self.updated_at.isoformat()
         }
 
+class QuestionEvent(db.Model):
+    """Append-only log of answered questions, relayed to Q&A stream subscribers"""
+    __tablename__ = 'question_events'
+    __table_args__ = (
+        db.Index('ix_question_events_project_id_version', 'project_id', 'version'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    project_id = db.Column(db.Integer, db.ForeignKey('projects.id'), nullable=False)
+    question_id = db.Column(db.Integer, nullable=False)
+    # projects.version after the answer, which orders events by commit
+    version = db.Column(db.Integer, nullable=False, server_default='0')
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+
 class Discussion(db.Model):
     __tablename__ = 'discussions'
+    __table_args__ = (
+        db.Index('ix_discussions_project_id_created_at', 'project_id', 'created_at'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     project_id = db.Column(db.Integer, db.ForeignKey('projects.id'), nullable=False)
@@ -163,3 +344,63 @@ class Discussion(db.Model):
             'created_at': self.created_at.isoformat()
         }
 
+
+class Job(db.Model):
+    """A unit of background work in the database-backed queue (see services/jobs.py)"""
+    __tablename__ = 'jobs'
+    __table_args__ = (
+        db.Index('ix_jobs_status_run_at', 'status', 'run_at'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(50), nullable=False)
+    # Identifies the object the job works on, e.g. "question:12"
+    key = db.Column(db.String(100), index=True)
+    payload = db.Column(db.Text, nullable=False, default='{}')  # JSON
+    status = db.Column(db.String(20), nullable=False, default='queued')  # queued, running, done, failed
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    max_attempts = db.Column(db.Integer, nullable=False, default=5)
+    run_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    # While running, the job is invisible to other workers until this passes
+    locked_until = db.Column(db.DateTime)
+    last_error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'kind': self.kind,
+            'key': self.key,
+            'status': self.status,
+            'attempts': self.attempts,
+            'max_attempts': self.max_attempts,
+            'run_at': self.run_at.isoformat(),
+            'last_error': self.last_error,
+            'created_at': self.created_at.isoformat()
+        }
+
+class AIResponse(db.Model):
+    """Cached AI completion, keyed by a hash of model, parameters and prompt (see services/ai_cache.py)"""
+    __tablename__ = 'ai_responses'
+    
+    key = db.Column(db.String(64), primary_key=True)
+    model = db.Column(db.String(50), nullable=False)
+    content = db.Column(db.Text, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+
+class SearchDocument(db.Model):
+    """Searchable text of one project item; the full-text index is built over it (see services/search.py)"""
+    __tablename__ = 'search_documents'
+    __table_args__ = (
+        db.Index('ix_search_documents_ref', 'kind', 'ref_id', 'page', unique=True),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(20), nullable=False)  # project, question, discussion, annotation, page
+    ref_id = db.Column(db.Integer, nullable=False)
+    page = db.Column(db.Integer, nullable=False, default=0)
+    project_id = db.Column(db.Integer, db.ForeignKey('projects.id'), nullable=False, index=True)
+    title = db.Column(db.Text)
+    body = db.Column(db.Text)
@@ -2,74 +2,89 @@ from flask import Blueprint, request, jsonify, current_app
 from flask_login import login_required, current_user
 from extensions import db
 from models import Project, ProjectFile, User
+from services import retrieval, ai_cache, sse
+from services.openai_client import get_openai_client, AIBusy
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
 import os
-import PyPDF2
 import threading
+import time
 
 ai_design_bp = Blueprint('ai_design', __name__)
 
-def get_openai_client():
-    """Get OpenAI client, initializing it if needed"""
-    try:
-        from openai import OpenAI
-        api_key = os.getenv('OPENAI_API_KEY')
-        if not api_key:
-            return None
-        return OpenAI(api_key=api_key)
-    except Exception as e:
-        print(f"Error initializing OpenAI client: {e}")
-        return None
+# The design report runs its sections on this pool, shared by all requests
+REPORT_SECTION_TIMEOUT = float(os.getenv('AI_REPORT_SECTION_TIMEOUT', 50))
+REPORT_POOL = ThreadPoolExecutor(max_workers=int(os.getenv('AI_REPORT_THREADS', 8)), thread_name_prefix='ai-report')
 
-def extract_text_from_pdf(file_path, max_pages=10):
-    """Extract text from PDF file for analysis"""
-    try:
-        text = ""
-        with open(file_path, 'rb') as file:
-            pdf_reader = PyPDF2.PdfReader(file)
-            num_pages = min(len(pdf_reader.pages), max_pages)
-            
-            for page_num in range(num_pages):
-                page = pdf_reader.pages[page_num]
-                text += page.extract_text() + "\n\n"
-        
-        return text[:10000]  # Limit to 10k characters
-    except Exception as e:
-        print(f"Error extracting PDF text: {e}")
-        return ""
+# What each prompt looks for in the project documents, added to the
+# retrieval query so the excerpts match the section being written
+ANALYSIS_TOPICS = 'layout space plan room dimensions area materials finishes lighting ceiling flooring'
+PALETTE_TOPICS = 'color colour paint finish wall'
+MATERIALS_TOPICS = 'materials finishes flooring countertop cabinet tile fixtures'
+ESTIMATE_TOPICS = 'area square feet dimensions quantities scope schedule'
 
-@ai_design_bp.route('/analyze/<int:project_id>', methods=['POST'])
-def analyze_project(project_id):
-    """
-    Analyze a project and provide AI-powered design insights
-    """
-    user_id = current_user.id
-    project = Project.query.filter_by(id=project_id, user_id=user_id).first()
+def refresh_requested():
+    """?refresh=1 skips the response cache and replaces the cached answer"""
+    return request.args.get('refresh', '').lower() in ('1', 'true', 'yes')
+
+def stream_requested():
+    """?stream=1 relays the answer token by token as server-sent events"""
+    return request.args.get('stream', '').lower() in ('1', 'true', 'yes')
+
+def stream_reply(client, field, params, **extra):
+    """Stream a completion over SSE and cache the assembled text when it ends.
     
-    if not project:
-        return jsonify({'error': 'Project not found'}), 404
+    Emits "token" events ({"text": ...}) as deltas arrive, then one "done"
+    event carrying the same fields as the JSON response minus the text, or an
+    "error" event. A cached answer is replayed as a single token event.
+    """
+    key = ai_cache.cache_key(params)
+    content = ai_cache.get(key, refresh_requested())
+    if content is not None:
+        def replay():
+            yield sse.event('token', {'text': content})
+            yield sse.event('done', {'success': True, 'field': field, 'cached': True, **extra})
+        return sse.response(replay())
     
-    # Get OpenAI client
-    client = get_openai_client()
+    # Raises AIBusy or API errors here, while a JSON error status is still possible
+    stream = client.chat_stream(**params)
     
-    if not client:
-        return jsonify({
-            'error': 'OpenAI API not configured',
-            'message': 'Please set OPENAI_API_KEY environment variable to use AI features'
-        }), 503
+    def relay():
+        parts = []
+        try:
+            # Opens the response right away so proxies see a live connection
+            yield sse.comment('stream open')
+            for text in stream:
+                parts.append(text)
+                yield sse.event('token', {'text': text})
+        except Exception as e:
+            print(f"Error streaming AI response: {e}")
+            yield sse.event('error', {'error': str(e)})
+            return
+        finally:
+            # Also runs when the client disconnects (GeneratorExit), which
+            # stops the upstream generation; partial answers are not cached
+            stream.close()
+        ai_cache.store(key, params['model'], ''.join(parts))
+        yield sse.event('done', {'success': True, 'field': field, 'cached': False, **extra})
     
-    try:
-        # Extract context from project files
-        file_context = ""
-        if project.files:
-            for file in project.files[:3]:  # Analyze up to 3 files
-                file_path = os.path.join(current_app.config['UPLOAD_FOLDER'], file.file_path)
-                if file.file_type == 'pdf' and os.path.exists(file_path):
-                    pdf_text = extract_text_from_pdf(file_path)
-                    if pdf_text:
-                        file_context += f"\n\nFile: {file.name}\nContent:\n{pdf_text}\n"
-        
-        # Create comprehensive analysis prompt
-        system_prompt = """You are an expert interior designer and architect with 20+ years of experience. 
+    return sse.response(relay(), on_close=stream.close)
+
+def busy_response(error):
+    response = jsonify({'error': 'AI service busy', 'message': str(error)})
+    response.headers['Retry-After'] = '10'
+    return response, 503
+
+def project_file_context(project, topics):
+    """Excerpts of the project's PDFs relevant to the project and the topics"""
+    return retrieval.excerpts(project, f"{project.name} {project.description or ''} {topics}")
+
+def documents_section(file_context):
+    """Document excerpts for prompts that do not require them; empty keeps the prompt unchanged"""
+    return f"\nProject Documents:{file_context}" if file_context else ""
+
+def analysis_params(project, file_context):
+    # Create comprehensive analysis prompt
+    system_prompt = """You are an expert interior designer and architect with 20+ years of experience. 
 You provide comprehensive design analysis including:
 - Space planning and layout optimization
 - Material and finish recommendations
@@ -80,8 +95,8 @@ You provide comprehensive design analysis including:
 - Current design trends
 
 Provide detailed, actionable recommendations."""
-        
-        user_prompt = f"""Please analyze this interior design project:
+    
+    user_prompt = f"""Please analyze this interior design project:
 
 Project Name: {project.name}
 Description: {project.description or 'No description provided'}
@@ -99,26 +114,154 @@ Provide a comprehensive design analysis covering:
 
 Format your response in a clear, professional manner with specific, actionable recommendations."""
 
-        # Call OpenAI API
-        response = client.chat.completions.create(
-            model="gpt-4",
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_prompt}
-            ],
-            max_tokens=1500,
-            temperature=0.7
-        )
+    return dict(
+        model="gpt-4",
+        messages=[
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_prompt}
+        ],
+        max_tokens=1500,
+        temperature=0.7
+    )
+
+def palette_params(project, style, room_type, file_context=''):
+    prompt = f"""As an expert color consultant, create a professional color palette for a {style} style {room_type}.
+
+Project: {project.name}
+Description: {project.description or 'No description'}{documents_section(file_context)}
+
+Provide:
+1. Primary Color (with hex code)
+2. Secondary Color (with hex code)
+3. Accent Color (with hex code)
+4. Neutral/Background Color (with hex code)
+5. Brief explanation of why these colors work together
+6. Application suggestions (where to use each color)
+
+Format each color as: Color Name (#HEXCODE) - Usage description"""
+
+    return dict(
+        model="gpt-4",
+        messages=[
+            {"role": "system", "content": "You are an expert color consultant and interior designer."},
+            {"role": "user", "content": prompt}
+        ],
+        max_tokens=800,
+        temperature=0.8
+    )
+
+def materials_params(project, budget_level, sustainability, file_context=''):
+    prompt = f"""As an expert in materials and finishes, recommend materials for this interior design project:
+
+Project: {project.name}
+Description: {project.description or 'No description'}{documents_section(file_context)}
+Budget Level: {budget_level}
+Sustainability Priority: {'Yes' if sustainability else 'No'}
+
+Provide specific recommendations for:
+1. Flooring (2-3 options with pros/cons)
+2. Wall Finishes (2-3 options)
+3. Countertops/Surfaces (2-3 options)
+4. Cabinetry/Millwork (2-3 options)
+5. Hardware & Fixtures (style recommendations)
+
+For each material, include:
+- Material name and type
+- Approximate price range
+- Durability rating
+- Maintenance requirements
+- Aesthetic qualities
+- Sustainability notes (if applicable)"""
+
+    return dict(
+        model="gpt-4",
+        messages=[
+            {"role": "system", "content": "You are an expert in interior design materials and finishes."},
+            {"role": "user", "content": prompt}
+        ],
+        max_tokens=1200,
+        temperature=0.7
+    )
+
+def estimate_params(project, square_footage, scope, location, file_context=''):
+    prompt = f"""As a construction cost estimator and project manager, provide a detailed budget estimate for:
+
+Project: {project.name}
+Description: {project.description or 'No description'}{documents_section(file_context)}
+Square Footage: {square_footage} sq ft
+Scope: {scope}
+Location: {location}
+
+Provide a detailed budget breakdown including:
+1. Design & Planning (architect, designer fees)
+2. Materials (flooring, fixtures, finishes)
+3. Labor & Installation
+4. Permits & Inspections
+5. Contingency (10-20%)
+
+For each category:
+- Estimated cost range (low-high)
+- Key factors affecting cost
+- Cost-saving alternatives
+- Priority level (must-have vs. nice-to-have)
+
+Also include:
+- Total estimated budget range
+- Timeline estimate
+- Money-saving tips
+- Value engineering suggestions"""
+
+    return dict(
+        model="gpt-4",
+        messages=[
+            {"role": "system", "content": "You are an expert construction cost estimator and project manager."},
+            {"role": "user", "content": prompt}
+        ],
+        max_tokens=1500,
+        temperature=0.6
+    )
+
+
+@ai_design_bp.route('/analyze/<int:project_id>', methods=['POST'])
+def analyze_project(project_id):
+    """
+    Analyze a project and provide AI-powered design insights
+    """
+    user_id = current_user.id
+    project = Project.query.filter_by(id=project_id, user_id=user_id).first()
+    
+    if not project:
+        return jsonify({'error': 'Project not found'}), 404
+    
+    # Get OpenAI client
+    client = get_openai_client()
+    
+    if not client:
+        return jsonify({
+            'error': 'OpenAI API not configured',
+            'message': 'Please set OPENAI_API_KEY environment variable to use AI features'
+        }), 503
+    
+    try:
+        file_context = project_file_context(project, ANALYSIS_TOPICS)
+        
+        params = analysis_params(project, file_context)
+        files_analyzed = len(project.files) if project.files else 0
+        if stream_requested():
+            return stream_reply(client, 'analysis', params, project_id=project_id, files_analyzed=files_analyzed)
         
-        analysis = response.choices[0].message.content
+        analysis, cached = ai_cache.cached_chat(client, refresh=refresh_requested(), **params)
         
         return jsonify({
             'success': True,
             'project_id': project_id,
             'analysis': analysis,
-            'files_analyzed': len(project.files) if project.files else 0
+            'cached': cached,
+            'files_analyzed': files_analyzed
         }), 200
         
+    except AIBusy as e:
+        return busy_response(e)
     except Exception as e:
         print(f"Error in AI analysis: {str(e)}")
         return jsonify({
@@ -148,38 +291,23 @@ def generate_color_palette(project_id):
         style = data.get('style', 'modern')
         room_type = data.get('room_type', 'living room')
         
-        prompt = f"""As an expert color consultant, create a professional color palette for a {style} style {room_type}.
-
-Project: {project.name}
-Description: {project.description or 'No description'}
-
-Provide:
-1. Primary Color (with hex code)
-2. Secondary Color (with hex code)
-3. Accent Color (with hex code)
-4. Neutral/Background Color (with hex code)
-5. Brief explanation of why these colors work together
-6. Application suggestions (where to use each color)
-
-Format each color as: Color Name (#HEXCODE) - Usage description"""
-
-        response = client.chat.completions.create(
-            model="gpt-4",
-            messages=[
-                {"role": "system", "content": "You are an expert color consultant and interior designer."},
-                {"role": "user", "content": prompt}
-            ],
-            max_tokens=800,
-            temperature=0.8
-        )
+        params = palette_params(project, style, room_type,
+                                project_file_context(project, f"{style} {room_type} {PALETTE_TOPICS}"))
+        if stream_requested():
+            return stream_reply(client, 'palette', params, style=style, room_type=room_type)
+        
+        content, cached = ai_cache.cached_chat(client, refresh=refresh_requested(), **params)
         
         return jsonify({
             'success': True,
-            'palette': response.choices[0].message.content,
+            'palette': content,
+            'cached': cached,
             'style': style,
             'room_type': room_type
         }), 200
         
+    except AIBusy as e:
+        return busy_response(e)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -203,45 +331,23 @@ def recommend_materials(project_id):
         budget_level = data.get('budget', 'medium')  # low, medium, high
         sustainability = data.get('sustainability', False)
         
-        prompt = f"""As an expert in materials and finishes, recommend materials for this interior design project:
-
-Project: {project.name}
-Description: {project.description or 'No description'}
-Budget Level: {budget_level}
-Sustainability Priority: {'Yes' if sustainability else 'No'}
-
-Provide specific recommendations for:
-1. Flooring (2-3 options with pros/cons)
-2. Wall Finishes (2-3 options)
-3. Countertops/Surfaces (2-3 options)
-4. Cabinetry/Millwork (2-3 options)
-5. Hardware & Fixtures (style recommendations)
-
-For each material, include:
-- Material name and type
-- Approximate price range
-- Durability rating
-- Maintenance requirements
-- Aesthetic qualities
-- Sustainability notes (if applicable)"""
-
-        response = client.chat.completions.create(
-            model="gpt-4",
-            messages=[
-                {"role": "system", "content": "You are an expert in interior design materials and finishes."},
-                {"role": "user", "content": prompt}
-            ],
-            max_tokens=1200,
-            temperature=0.7
-        )
+        params = materials_params(project, budget_level, sustainability,
+                                  project_file_context(project, MATERIALS_TOPICS))
+        if stream_requested():
+            return stream_reply(client, 'recommendations', params, budget_level=budget_level, sustainability_focused=sustainability)
+        
+        content, cached = ai_cache.cached_chat(client, refresh=refresh_requested(), **params)
         
         return jsonify({
             'success': True,
-            'recommendations': response.choices[0].message.content,
+            'recommendations': content,
+            'cached': cached,
             'budget_level': budget_level,
             'sustainability_focused': sustainability
         }), 200
         
+    except AIBusy as e:
+        return busy_response(e)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -266,54 +372,96 @@ def estimate_costs(project_id):
         scope = data.get('scope', 'full renovation')
         location = data.get('location', 'United States')
         
-        prompt = f"""As a construction cost estimator and project manager, provide a detailed budget estimate for:
-
-Project: {project.name}
-Description: {project.description or 'No description'}
-Square Footage: {square_footage} sq ft
-Scope: {scope}
-Location: {location}
-
-Provide a detailed budget breakdown including:
-1. Design & Planning (architect, designer fees)
-2. Materials (flooring, fixtures, finishes)
-3. Labor & Installation
-4. Permits & Inspections
-5. Contingency (10-20%)
-
-For each category:
-- Estimated cost range (low-high)
-- Key factors affecting cost
-- Cost-saving alternatives
-- Priority level (must-have vs. nice-to-have)
-
-Also include:
-- Total estimated budget range
-- Timeline estimate
-- Money-saving tips
-- Value engineering suggestions"""
-
-        response = client.chat.completions.create(
-            model="gpt-4",
-            messages=[
-                {"role": "system", "content": "You are an expert construction cost estimator and project manager."},
-                {"role": "user", "content": prompt}
-            ],
-            max_tokens=1500,
-            temperature=0.6
-        )
+        params = estimate_params(project, square_footage, scope, location,
+                                 project_file_context(project, f"{scope} {ESTIMATE_TOPICS}"))
+        if stream_requested():
+            return stream_reply(client, 'estimate', params, square_footage=square_footage, scope=scope, location=location)
+        
+        content, cached = ai_cache.cached_chat(client, refresh=refresh_requested(), **params)
         
         return jsonify({
             'success': True,
-            'estimate': response.choices[0].message.content,
+            'estimate': content,
+            'cached': cached,
             'square_footage': square_footage,
             'scope': scope,
             'location': location
         }), 200
         
+    except AIBusy as e:
+        return busy_response(e)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+def run_report_section(app, client, params, refresh):
+    with app.app_context():
+        return ai_cache.cached_chat(client, refresh=refresh, **params)
+
+@ai_design_bp.route('/report/<int:project_id>', methods=['POST'])
+@login_required
+def design_report(project_id):
+    """
+    Generate the full design report (analysis, color palette, materials and
+    cost estimate) with the four sections requested concurrently
+    
+    Accepts the options of the individual endpoints in one body. A section
+    that fails or exceeds AI_REPORT_SECTION_TIMEOUT is reported with its
+    status while the others are still returned.
+    """
+    user_id = current_user.id
+    project = Project.query.filter_by(id=project_id, user_id=user_id).first()
+    
+    if not project:
+        return jsonify({'error': 'Project not found'}), 404
+    
+    client = get_openai_client()
+    if not client:
+        return jsonify({'error': 'OpenAI API not configured'}), 503
+    
+    data = request.get_json(silent=True) or {}
+    style = data.get('style', 'modern')
+    room_type = data.get('room_type', 'living room')
+    scope = data.get('scope', 'full renovation')
+    # Each section gets the document excerpts relevant to it
+    sections = {
+        'analysis': analysis_params(project, project_file_context(project, ANALYSIS_TOPICS)),
+        'palette': palette_params(project, style, room_type,
+                                  project_file_context(project, f"{style} {room_type} {PALETTE_TOPICS}")),
+        'recommendations': materials_params(project, data.get('budget', 'medium'), data.get('sustainability', False),
+                                            project_file_context(project, MATERIALS_TOPICS)),
+        'estimate': estimate_params(project, data.get('square_footage', 0), scope, data.get('location', 'United States'),
+                                    project_file_context(project, f"{scope} {ESTIMATE_TOPICS}")),
+    }
+    
+    app = current_app._get_current_object()
+    refresh = refresh_requested()
+    futures = {name: REPORT_POOL.submit(run_report_section, app, client, params, refresh)
+               for name, params in sections.items()}
+    
+    deadline = time.monotonic() + REPORT_SECTION_TIMEOUT
+    results = {}
+    for name, future in futures.items():
+        try:
+            content, cached = future.result(timeout=max(0, deadline - time.monotonic()))
+            results[name] = {'status': 'ok', 'content': content, 'cached': cached}
+        except FutureTimeout:
+            # Left running: its answer lands in the cache for the next request
+            results[name] = {'status': 'timeout', 'error': f'No answer within {REPORT_SECTION_TIMEOUT:g}s'}
+        except AIBusy as e:
+            results[name] = {'status': 'busy', 'error': str(e)}
+        except Exception as e:
+            print(f"Error in design report section {name}: {str(e)}")
+            results[name] = {'status': 'error', 'error': str(e)}
+    
+    succeeded = sum(1 for result in results.values() if result['status'] == 'ok')
+    return jsonify({
+        'success': succeeded > 0,
+        'complete': succeeded == len(results),
+        'project_id': project_id,
+        'files_analyzed': len(project.files) if project.files else 0,
+        'sections': results
+    }), 200 if succeeded else 502
+
 @ai_design_bp.route('/quick-suggestion', methods=['POST'])
 def quick_suggestion():
     """
@@ -330,7 +478,7 @@ def quick_suggestion():
         if not question:
             return jsonify({'error': 'Question is required'}), 400
         
-        response = client.chat.completions.create(
+        params = dict(
             model="gpt-4",
             messages=[
                 {"role": "system", "content": "You are an expert interior designer providing quick, practical design advice."},
@@ -339,12 +487,24 @@ def quick_suggestion():
             max_tokens=500,
             temperature=0.7
         )
+        if stream_requested():
+            return stream_reply(client, 'suggestion', params)
+        
+        content, cached = ai_cache.cached_chat(client, refresh=refresh_requested(), **params)
         
         return jsonify({
             'success': True,
-            'suggestion': response.choices[0].message.content
+            'suggestion': content,
+            'cached': cached
         }), 200
         
+    except AIBusy as e:
+        return busy_response(e)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@ai_design_bp.route('/cache-stats', methods=['GET'])
+@login_required
+def cache_stats():
+    """Response cache hit/miss counters of this worker process"""
+    return jsonify(ai_cache.stats()), 200
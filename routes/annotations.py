@@ -1,21 +1,204 @@
 from flask import Blueprint, request, jsonify
 from flask_login import login_required, current_user
 from extensions import db
-from models import Annotation, User
+from models import Annotation, User, Project, ProjectFile
+from services.pagination import PaginationError, parse_page_args, keyset_page, listing_response
+from services import spatial, changefeed, search
+from services.etags import conditional, project_version, file_project_version
+from sqlalchemy import insert, update, delete
+from sqlalchemy.orm import selectinload
+from datetime import timezone
 
 annotations_bp = Blueprint('annotations', __name__)
 
+MAX_BATCH_OPERATIONS = 1000
+MAX_CHANGES_PER_POLL = 1000
+
+# Request field -> Annotation column for the writable shape fields
+ANNOTATION_FIELDS = {
+    'type': 'annotation_type',
+    'x': 'x',
+    'y': 'y',
+    'width': 'width',
+    'height': 'height',
+    'text': 'text',
+    'color': 'color',
+    'page': 'page'
+}
+REQUIRED_CREATE_FIELDS = ('project_id', 'file_id', 'type', 'x', 'y', 'color')
+NUMERIC_FIELDS = ('x', 'y', 'width', 'height')
+
+# Columns sent as plain arrays in the columnar listing format
+COLUMNAR_PLAIN_FIELDS = ('id', 'x', 'y', 'width', 'height', 'text', 'page')
+
+def _dictionary_encode(values):
+    """Replace each value by its index into a list of the distinct values"""
+    lookup = {}
+    codes = [lookup.setdefault(value, len(lookup)) for value in values]
+    return codes, list(lookup)
+
+def columnar_annotations(rows):
+    """Encode annotation rows as one array per field.
+    
+    Repetitive fields (project, file, type, color and the author) are
+    dictionary-encoded: the column holds small integer codes and the distinct
+    values are sent once under 'dictionaries'. Creation times are sent as
+    milliseconds since the Unix epoch (UTC).
+    """
+    columns = {field: [getattr(row, field) for row in rows] for field in COLUMNAR_PLAIN_FIELDS}
+    columns['created_at_ms'] = [
+        int(row.created_at.replace(tzinfo=timezone.utc).timestamp() * 1000) for row in rows
+    ]
+    
+    columns['project_id'], project_ids = _dictionary_encode(row.project_id for row in rows)
+    columns['file_id'], file_ids = _dictionary_encode(row.file_id for row in rows)
+    columns['type'], types = _dictionary_encode(row.annotation_type for row in rows)
+    columns['color'], colors = _dictionary_encode(row.color for row in rows)
+    columns['user'], users = _dictionary_encode((row.user_id, row.user_name) for row in rows)
+    
+    return {
+        'format': 'columnar',
+        'count': len(rows),
+        'columns': columns,
+        'dictionaries': {
+            'project_id': project_ids,
+            'file_id': file_ids,
+            'type': types,
+            'color': colors,
+            'user': [{'id': user_id, 'name': name or 'Unknown'} for user_id, name in users]
+        }
+    }
+
+def list_annotations(*criteria):
+    """Serialize an annotation listing, paging it when the client asks for it.
+    
+    ?format=columnar selects plain column values with the author names from a
+    single join instead of building ORM objects and per-row dicts.
+    """
+    try:
+        limit, cursor = parse_page_args(request.args)
+    except PaginationError as e:
+        return jsonify({'message': str(e)}), 400
+    
+    output_format = request.args.get('format', 'json')
+    if output_format == 'columnar':
+        query = db.session.query(
+            Annotation.id, Annotation.project_id, Annotation.file_id, Annotation.user_id,
+            Annotation.annotation_type, Annotation.x, Annotation.y, Annotation.width,
+            Annotation.height, Annotation.text, Annotation.color, Annotation.page,
+            Annotation.created_at, User.name.label('user_name')
+        ).outerjoin(User, User.id == Annotation.user_id).filter(*criteria)
+        rows, next_cursor = keyset_page(query, Annotation.created_at, Annotation.id, limit, cursor)
+        
+        result = columnar_annotations(rows)
+        if limit is not None:
+            result['next_cursor'] = next_cursor
+        return jsonify(result), 200
+    
+    if output_format != 'json':
+        return jsonify({'message': "format must be 'json' or 'columnar'"}), 400
+    
+    annotations, next_cursor = keyset_page(
+        Annotation.query.filter(*criteria).options(selectinload(Annotation.user)),
+        Annotation.created_at, Annotation.id, limit, cursor
+    )
+    return listing_response([a.to_dict() for a in annotations], limit, next_cursor)
+
 @annotations_bp.route('/file/<int:file_id>', methods=['GET'])
 @login_required
+@conditional('annotations-file', file_project_version)
 def get_annotations_by_file(file_id):
-    annotations = Annotation.query.filter_by(file_id=file_id).all()
-    return jsonify([a.to_dict() for a in annotations]), 200
+    """Annotations of a file, optionally limited to ?page=N and a ?bbox=x0,y0,x1,y1 viewport"""
+    criteria = [Annotation.file_id == file_id]
+    
+    page = request.args.get('page')
+    bbox = request.args.get('bbox')
+    if page is not None:
+        try:
+            page = int(page)
+        except ValueError:
+            return jsonify({'message': 'page must be an integer'}), 400
+        criteria.append(Annotation.page == page)
+    
+    if bbox is not None:
+        if page is None:
+            return jsonify({'message': 'bbox requires page'}), 400
+        try:
+            bbox = spatial.parse_bbox(bbox)
+        except ValueError as e:
+            return jsonify({'message': str(e)}), 400
+        criteria.append(Annotation.id.in_(spatial.viewport_annotation_ids(file_id, page, bbox)))
+    
+    return list_annotations(*criteria)
 
 @annotations_bp.route('/project/<int:project_id>', methods=['GET'])
 @login_required
+@conditional('annotations', project_version)
 def get_annotations_by_project(project_id):
-    annotations = Annotation.query.filter_by(project_id=project_id).all()
-    return jsonify([a.to_dict() for a in annotations]), 200
+    return list_annotations(Annotation.project_id == project_id)
+
+@annotations_bp.route('/project/<int:project_id>/changes', methods=['GET'])
+@login_required
+@conditional('annotation-changes', project_version)
+def get_annotation_changes(project_id):
+    """Incremental sync feed.
+    
+    Without ?since the response is a snapshot of every annotation in the
+    project plus the current token. With ?since=<token> it holds only the
+    annotations created or modified after that token and the ids of the ones
+    deleted; has_more means the client should ask again with the new token.
+    """
+    since = request.args.get('since')
+    try:
+        limit = min(int(request.args.get('limit', MAX_CHANGES_PER_POLL)), MAX_CHANGES_PER_POLL)
+        if limit < 1:
+            raise ValueError
+    except ValueError:
+        return jsonify({'message': 'limit must be a positive integer'}), 400
+    
+    if since is None:
+        # Read the token first: changes racing with the snapshot are replayed
+        # on the next poll, and applying an upsert twice is harmless
+        token = changefeed.latest_token(project_id)
+        annotations = Annotation.query.filter_by(project_id=project_id) \
+            .options(selectinload(Annotation.user)) \
+            .order_by(Annotation.id.asc()) \
+            .all()
+        return jsonify({
+            'upserted': [a.to_dict() for a in annotations],
+            'deleted': [],
+            'token': str(token),
+            'has_more': False
+        }), 200
+    
+    try:
+        since = int(since)
+    except ValueError:
+        return jsonify({'message': 'Invalid token'}), 400
+    # Tokens are project versions; a larger one was not handed out for this
+    # project, so the client has to start over from a snapshot
+    if since > changefeed.latest_token(project_id):
+        return jsonify({'message': 'Invalid token'}), 400
+    
+    ops, token, has_more = changefeed.changes_since(project_id, since, limit)
+    upsert_ids = [annotation_id for annotation_id, op in ops.items() if op == changefeed.UPSERT]
+    upserted = Annotation.query.filter(Annotation.id.in_(upsert_ids)) \
+        .options(selectinload(Annotation.user)) \
+        .order_by(Annotation.id.asc()) \
+        .all() if upsert_ids else []
+    
+    # An annotation upserted in this window but deleted by a later change is
+    # already gone; report it as deleted now rather than waiting for the next poll
+    found = {a.id for a in upserted}
+    deleted = sorted(annotation_id for annotation_id, op in ops.items()
+                     if op == changefeed.DELETE or annotation_id not in found)
+    
+    return jsonify({
+        'upserted': [a.to_dict() for a in upserted],
+        'deleted': deleted,
+        'token': str(token),
+        'has_more': has_more
+    }), 200
 
 @annotations_bp.route('', methods=['POST'])
 @login_required
@@ -38,6 +221,10 @@ def create_annotation():
     )
     
     db.session.add(annotation)
+    db.session.flush()
+    spatial.index_annotations([annotation])
+    search.index_annotations([annotation])
+    changefeed.record_changes([(annotation.project_id, annotation.id, changefeed.UPSERT)])
     db.session.commit()
     
     return jsonify(annotation.to_dict()), 201
@@ -51,8 +238,167 @@ def delete_annotation(annotation_id):
     if not annotation:
         return jsonify({'message': 'Annotation not found'}), 404
     
+    spatial.unindex_annotations([annotation.id])
+    search.unindex_annotations([annotation.id])
+    changefeed.record_changes([(annotation.project_id, annotation.id, changefeed.DELETE)])
     db.session.delete(annotation)
     db.session.commit()
     
     return jsonify({'message': 'Annotation deleted'}), 200
 
+
+def _shape_values(op):
+    """Validate the shape fields present in a batch operation and map them to columns"""
+    values = {}
+    for field, column in ANNOTATION_FIELDS.items():
+        if field not in op:
+            continue
+        value = op[field]
+        definition = Annotation.__table__.c[column]
+        if value is None and not definition.nullable:
+            raise ValueError(f'{field} may not be null')
+        if field in NUMERIC_FIELDS and value is not None:
+            if isinstance(value, bool) or not isinstance(value, (int, float)):
+                raise ValueError(f'{field} must be a number')
+            value = float(value)
+        if field == 'page' and (isinstance(value, bool) or not isinstance(value, int) or value < 1):
+            raise ValueError('page must be a positive integer')
+        if field in ('type', 'color') and not (isinstance(value, str) and value):
+            raise ValueError(f'{field} must be a non-empty string')
+        length = getattr(definition.type, 'length', None)
+        if isinstance(value, str) and length and len(value) > length:
+            raise ValueError(f'{field} must be at most {length} characters')
+        values[column] = value
+    return values
+
+@annotations_bp.route('/batch', methods=['POST'])
+@login_required
+def batch_annotations():
+    """Apply many create/update/delete operations in a single transaction.
+    
+    The whole batch is validated up front; if any operation is invalid nothing
+    is written and the errors are reported by operation index. On success the
+    results list the affected annotation ids in request order.
+    """
+    user_id = current_user.id
+    data = request.get_json(silent=True) or {}
+    operations = data.get('operations')
+    
+    if not isinstance(operations, list) or not operations:
+        return jsonify({'message': 'operations must be a non-empty list'}), 400
+    if len(operations) > MAX_BATCH_OPERATIONS:
+        return jsonify({'message': f'A batch may contain at most {MAX_BATCH_OPERATIONS} operations'}), 400
+    
+    errors = []
+    creates, updates, deletes = [], [], []
+    for index, op in enumerate(operations):
+        try:
+            if not isinstance(op, dict):
+                raise ValueError('operation must be an object')
+            kind = op.get('op')
+            if kind == 'create':
+                missing = [f for f in REQUIRED_CREATE_FIELDS if op.get(f) is None]
+                if missing:
+                    raise ValueError(f"missing required fields: {', '.join(missing)}")
+                # Every create row carries the same keys so they go out as one executemany
+                row = dict.fromkeys(ANNOTATION_FIELDS.values())
+                row['page'] = 1
+                row.update(_shape_values(op))
+                row.update(project_id=op['project_id'], file_id=op['file_id'], user_id=user_id)
+                creates.append((index, row))
+            elif kind in ('update', 'delete'):
+                if isinstance(op.get('id'), bool) or not isinstance(op.get('id'), int):
+                    raise ValueError('id must be an integer')
+                if kind == 'update':
+                    values = _shape_values(op)
+                    if not values:
+                        raise ValueError('update has no fields to change')
+                    updates.append((index, op['id'], values))
+                else:
+                    deletes.append((index, op['id']))
+            else:
+                raise ValueError("op must be 'create', 'update' or 'delete'")
+        except ValueError as e:
+            errors.append({'index': index, 'error': str(e)})
+    
+    # Creates must target a file of the given project, owned by the caller
+    targets = {(row['project_id'], row['file_id']) for _, row in creates}
+    if targets:
+        file_ids = {file_id for _, file_id in targets}
+        valid = set(db.session.query(ProjectFile.project_id, ProjectFile.id)
+                    .join(Project, Project.id == ProjectFile.project_id)
+                    .filter(ProjectFile.id.in_(file_ids), Project.user_id == user_id)
+                    .all())
+        for index, row in creates:
+            if (row['project_id'], row['file_id']) not in valid:
+                errors.append({'index': index, 'error': 'file not found in project'})
+    
+    # Updates and deletes are limited to the caller's own annotations
+    target_ids = [annotation_id for _, annotation_id, _ in updates] + [annotation_id for _, annotation_id in deletes]
+    owned = {}
+    if target_ids:
+        owned = dict(db.session.query(Annotation.id, Annotation.project_id)
+                     .filter(Annotation.id.in_(target_ids), Annotation.user_id == user_id)
+                     .all())
+        deleted = set()
+        for index, annotation_id in deletes:
+            if annotation_id not in owned or annotation_id in deleted:
+                errors.append({'index': index, 'error': 'annotation not found'})
+            deleted.add(annotation_id)
+        for index, annotation_id, _ in updates:
+            if annotation_id not in owned or annotation_id in deleted:
+                errors.append({'index': index, 'error': 'annotation not found'})
+    
+    if errors:
+        errors.sort(key=lambda e: e['index'])
+        return jsonify({'message': 'Invalid batch', 'errors': errors}), 400
+    
+    results = [None] * len(operations)
+    try:
+        if creates:
+            new_ids = db.session.scalars(
+                insert(Annotation).returning(Annotation.id, sort_by_parameter_order=True),
+                [row for _, row in creates]
+            ).all()
+            for (index, _), annotation_id in zip(creates, new_ids):
+                results[index] = {'op': 'create', 'id': annotation_id}
+        
+        if updates:
+            db.session.execute(
+                update(Annotation),
+                [dict(values, id=annotation_id) for _, annotation_id, values in updates]
+            )
+            for index, annotation_id, _ in updates:
+                results[index] = {'op': 'update', 'id': annotation_id}
+        
+        if deletes:
+            db.session.execute(
+                delete(Annotation).where(Annotation.id.in_([annotation_id for _, annotation_id in deletes])),
+                execution_options={'synchronize_session': False}
+            )
+            for index, annotation_id in deletes:
+                results[index] = {'op': 'delete', 'id': annotation_id}
+            spatial.unindex_annotations([annotation_id for _, annotation_id in deletes])
+            search.unindex_annotations([annotation_id for _, annotation_id in deletes])
+        
+        written_ids = [r['id'] for r in results if r['op'] != 'delete']
+        if written_ids:
+            written = db.session.query(
+                Annotation.id, Annotation.project_id, Annotation.file_id, Annotation.page, Annotation.annotation_type,
+                Annotation.x, Annotation.y, Annotation.width, Annotation.height, Annotation.text
+            ).filter(Annotation.id.in_(written_ids)).all()
+            spatial.index_annotations(written)
+            search.index_annotations(written)
+        
+        changefeed.record_changes(
+            [(row['project_id'], results[index]['id'], changefeed.UPSERT) for index, row in creates] +
+            [(owned[annotation_id], annotation_id, changefeed.UPSERT) for _, annotation_id, _ in updates] +
+            [(owned[annotation_id], annotation_id, changefeed.DELETE) for _, annotation_id in deletes]
+        )
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        print(f"Error applying annotation batch: {str(e)}")
+        return jsonify({'message': 'Failed to apply batch'}), 500
+    
+    return jsonify({'results': results}), 200
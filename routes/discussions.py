@@ -2,14 +2,27 @@ from flask import Blueprint, request, jsonify
 from flask_login import login_required, current_user
 from extensions import db
 from models import Discussion, User
+from services import search
+from services.etags import bump_project_version, conditional, project_version
+from services.pagination import PaginationError, parse_page_args, keyset_page, listing_response
+from sqlalchemy.orm import selectinload
 
 discussions_bp = Blueprint('discussions', __name__)
 
 @discussions_bp.route('/project/<int:project_id>', methods=['GET'])
 @login_required
+@conditional('discussions', project_version)
 def get_discussions(project_id):
-    discussions = Discussion.query.filter_by(project_id=project_id).order_by(Discussion.created_at.asc()).all()
-    return jsonify([d.to_dict() for d in discussions]), 200
+    try:
+        limit, cursor = parse_page_args(request.args)
+    except PaginationError as e:
+        return jsonify({'message': str(e)}), 400
+    
+    discussions, next_cursor = keyset_page(
+        Discussion.query.filter_by(project_id=project_id).options(selectinload(Discussion.user)),
+        Discussion.created_at, Discussion.id, limit, cursor
+    )
+    return listing_response([d.to_dict() for d in discussions], limit, next_cursor)
 
 @discussions_bp.route('', methods=['POST'])
 @login_required
@@ -30,6 +43,9 @@ def create_discussion():
     )
     
     db.session.add(discussion)
+    db.session.flush()
+    search.index_discussion(discussion)
+    bump_project_version(project_id)
     db.session.commit()
     
     return jsonify(discussion.to_dict()), 201
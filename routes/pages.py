@@ -0,0 +1,44 @@
+from flask import Blueprint, jsonify, send_file
+from flask_login import login_required
+from routes.sheets import owned_file
+from services import page_tiles
+import os
+
+pages_bp = Blueprint('pages', __name__)
+
+# A file's rendered pages never change, so browsers may keep them for good
+IMMUTABLE = 'private, max-age=31536000, immutable'
+
+def send_image(path):
+    if not os.path.isfile(path):
+        return jsonify({'message': 'Image not found'}), 404
+    response = send_file(path, mimetype='image/png', conditional=True)
+    response.headers['Cache-Control'] = IMMUTABLE
+    return response
+
+@pages_bp.route('/<int:project_id>/files/<int:file_id>/pages', methods=['GET'])
+@login_required
+def list_pages(project_id, file_id):
+    """Rendered pages of a PDF with their sizes (points) and zoom levels.
+
+    While the status is pending, pages appear as they finish rendering.
+    """
+    project_file = owned_file(project_id, file_id)
+    if not project_file or project_file.file_type != 'pdf':
+        return jsonify({'message': 'PDF not found'}), 404
+    return jsonify(page_tiles.page_manifest(project_file)), 200
+
+@pages_bp.route('/<int:project_id>/files/<int:file_id>/pages/<int:page>/thumbnail', methods=['GET'])
+@login_required
+def get_thumbnail(project_id, file_id, page):
+    if not owned_file(project_id, file_id):
+        return jsonify({'message': 'PDF not found'}), 404
+    return send_image(page_tiles.thumbnail_path(file_id, page))
+
+@pages_bp.route('/<int:project_id>/files/<int:file_id>/pages/<int:page>/tiles/<int:level>/<int:x>/<int:y>',
+                methods=['GET'])
+@login_required
+def get_tile(project_id, file_id, page, level, x, y):
+    if not owned_file(project_id, file_id):
+        return jsonify({'message': 'PDF not found'}), 404
+    return send_image(page_tiles.tile_path(file_id, page, level, x, y))
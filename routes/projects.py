@@ -2,34 +2,94 @@ from flask import Blueprint, request, jsonify, current_app
 from flask_login import login_required, current_user
 from werkzeug.utils import secure_filename
 from extensions import db
-from models import Project, ProjectFile
+from models import Project, ProjectFile, UploadSession, UploadPart
+from services import spatial, changefeed, answerfeed, blobs, jobs, pdf_text, search, sheets, page_tiles, storage
+from services.etags import bump_project_version, conditional, project_version
+from sqlalchemy import func
+from sqlalchemy.orm import selectinload
 import os
-from datetime import datetime
+import re
+import uuid
+import hashlib
+import shutil
+from datetime import datetime, timedelta
 
 projects_bp = Blueprint('projects', __name__)
 
 ALLOWED_EXTENSIONS = {'pdf', 'xls', 'xlsx'}
 
+# Chunked uploads: recommended part size and how much of a body is read at a time
+UPLOAD_PART_SIZE = 8 * 1024 * 1024
+STREAM_CHUNK_SIZE = 1024 * 1024
+SHA256_PATTERN = re.compile(r'[0-9a-fA-F]{64}')
+# Unfinished chunked uploads are deleted this long after their last part
+UPLOAD_SESSION_TTL = timedelta(hours=float(os.getenv('UPLOAD_SESSION_TTL_HOURS', 24)))
+
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
+def file_extension(filename):
+    return filename.rsplit('.', 1)[1].lower()
+
+def file_type_for(filename):
+    return 'pdf' if file_extension(filename) == 'pdf' else 'excel'
+
+def add_project_file(project_id, filename, blob):
+    """Record a stored blob as a file of the project and queue its processing; the caller commits"""
+    project_file = ProjectFile(
+        name=filename,
+        file_type=file_type_for(filename),
+        file_path=blob.path,
+        file_size=blob.size,
+        project_id=project_id,
+        blob_id=blob.id
+    )
+    db.session.add(project_file)
+    db.session.flush()
+    pdf_text.schedule_extraction(project_file)
+    sheets.schedule_ingest(project_file)
+    page_tiles.schedule_render(project_file)
+    bump_project_version(project_id)
+    return project_file
+
+def list_projects(user_id, view='full'):
+    """Serialize a user's projects for the listing endpoints.
+    
+    The full view loads every project's files in one batched query; the
+    summary view skips file rows and reports per-project file counts and the
+    last upload time from a single grouped query.
+    """
+    if view == 'summary':
+        rows = db.session.query(
+            Project,
+            func.count(ProjectFile.id),
+            func.max(ProjectFile.uploaded_at)
+        ).outerjoin(ProjectFile, ProjectFile.project_id == Project.id) \
+            .filter(Project.user_id == user_id) \
+            .group_by(Project.id) \
+            .order_by(Project.updated_at.desc()) \
+            .all()
+        return [project.to_summary_dict(file_count, last_upload_at)
+                for project, file_count, last_upload_at in rows]
+    
+    projects = Project.query.options(selectinload(Project.files)) \
+        .filter_by(user_id=user_id) \
+        .order_by(Project.updated_at.desc()) \
+        .all()
+    return [p.to_dict() for p in projects]
+
 @projects_bp.route('', methods=['GET'])
 @login_required
 def get_projects():
     try:
         user_id = current_user.id
-        print(f"Getting projects for user_id: {user_id}")
-        
-        # Verify user exists
-        from models import User
-        user = User.query.get(user_id)
-        if not user:
-            print(f"User with ID {user_id} not found")
-            return jsonify({'error': f'User with ID {user_id} not found'}), 422
+        view = request.args.get('view', 'full')
+        if view not in ('full', 'summary'):
+            return jsonify({'error': "view must be 'full' or 'summary'"}), 400
         
-        projects = Project.query.filter_by(user_id=user_id).all()
+        projects = list_projects(user_id, view)
         print(f"Found {len(projects)} projects for user {user_id}")
-        return jsonify([p.to_dict() for p in projects]), 200
+        return jsonify(projects), 200
         
     except Exception as e:
         print(f"Error getting projects: {str(e)}")
@@ -69,6 +129,8 @@ def create_project():
         )
         
         db.session.add(project)
+        db.session.flush()
+        search.index_project(project)
         db.session.commit()
         
         print(f"Project created successfully: {project.id}")
@@ -81,6 +143,7 @@ def create_project():
 
 @projects_bp.route('/<int:project_id>', methods=['GET'])
 @login_required
+@conditional('project', lambda project_id: project_version(project_id, current_user.id))
 def get_project(project_id):
     user_id = current_user.id
     project = Project.query.filter_by(id=project_id, user_id=user_id).first()
@@ -112,27 +175,287 @@ def upload_file(project_id):
     
     # Secure filename
     filename = secure_filename(file.filename)
-    timestamp = datetime.now().strftime('%Y%m%d%H%M%S')
-    unique_filename = f"{timestamp}_{filename}"
     
-    # Save file
-    file_path = os.path.join(current_app.config['UPLOAD_FOLDER'], unique_filename)
-    file.save(file_path)
+    # Hash while saving, then store once under the content hash
+    temp_file, sha256, size = blobs.stream_to_temp(file.stream)
+    blob = blobs.store_blob(temp_file, sha256, size, file_extension(filename))
     
-    # Get file type
-    file_ext = filename.rsplit('.', 1)[1].lower()
-    file_type = 'pdf' if file_ext == 'pdf' else 'excel'
+    project_file = add_project_file(project_id, filename, blob)
+    db.session.commit()
     
-    # Create file record
-    project_file = ProjectFile(
+    return jsonify({
+        'message': 'File uploaded successfully',
+        'file': project_file.to_dict()
+    }), 201
+
+@projects_bp.route('/<int:project_id>/files/by-hash', methods=['POST'])
+@login_required
+def add_file_by_hash(project_id):
+    """Attach already-stored content to a project without re-sending it.
+    
+    Body: {"sha256": ..., "filename": ...}. Returns 404 when the content is
+    not stored yet, in which case the client uploads it normally.
+    """
+    project = Project.query.filter_by(id=project_id, user_id=current_user.id).first()
+    if not project:
+        return jsonify({'message': 'Project not found'}), 404
+    
+    data = request.get_json(silent=True) or {}
+    filename = secure_filename(data.get('filename') or '')
+    checksum = str(data.get('sha256') or '')
+    if not filename or not allowed_file(filename):
+        return jsonify({'message': 'Invalid file type. Only PDF and Excel files allowed'}), 400
+    if not SHA256_PATTERN.fullmatch(checksum):
+        return jsonify({'message': 'sha256 must be a hex SHA-256 digest'}), 400
+    
+    blob = blobs.find_blob(checksum)
+    if not blob or not blobs.add_reference(blob):
+        return jsonify({'message': 'Content not found, upload the file'}), 404
+    
+    project_file = add_project_file(project_id, filename, blob)
+    db.session.commit()
+    
+    return jsonify({
+        'message': 'File uploaded successfully',
+        'deduplicated': True,
+        'file': project_file.to_dict()
+    }), 201
+
+def release_project_files(blob_ids):
+    """Release the stored content of a deleted project's files.
+    
+    Runs after the files' rows are flushed away, so a blob row that loses
+    its last reference can be deleted. Returns the storage keys to delete
+    once the deletion has committed.
+    """
+    return [blobs.release_blob(blob_id) for blob_id in blob_ids]
+
+def remove_project(project):
+    """Delete a project with everything derived from it, and commit.
+    
+    Stored content, upload staging files and render caches are removed from
+    disk once the deletion has committed.
+    """
+    file_ids = [file.id for file in project.files]
+    spatial.unindex_files(file_ids)
+    pdf_text.discard_files(file_ids)
+    sheets.discard_files(file_ids)
+    changefeed.purge_project(project.id)
+    answerfeed.purge_project(project.id)
+    search.purge_project(project.id)
+    
+    blob_ids = [file.blob_id for file in project.files if file.blob_id]
+    stored_keys = [file.file_path for file in project.files if not file.blob_id]
+    part_paths = [_part_path(upload) for upload in project.upload_sessions]
+    
+    db.session.delete(project)
+    db.session.flush()
+    # Shared content is only removed once no other file references it
+    stored_keys += release_project_files(blob_ids)
+    db.session.commit()
+    storage.backend().delete(stored_keys)
+    blobs.remove_files(part_paths)
+    sheets.remove_caches(file_ids)
+    page_tiles.remove_caches(file_ids)
+
+def _upload_session(project_id, upload_id):
+    """The caller's upload session for a project, or None"""
+    return UploadSession.query.filter_by(id=upload_id, project_id=project_id, user_id=current_user.id).first()
+
+def _last_activity(upload):
+    return max([upload.created_at] + [part.created_at for part in upload.parts])
+
+def schedule_upload_expiry(upload, at):
+    """Queue the check that deletes the upload once abandoned; the caller commits"""
+    jobs.enqueue('expire_upload', {'upload_id': upload.id}, key=f'upload:{upload.id}',
+                 check_limit=False, run_at=at)
+
+def expire_upload(upload_id):
+    """Delete an upload session that got no parts for UPLOAD_SESSION_TTL; runs as a job
+    
+    The .part file can only be removed here when the job runs on the
+    instance that staged it (always, with a single instance).
+    """
+    upload = db.session.get(UploadSession, upload_id)
+    if upload is None:
+        return
+    expires = _last_activity(upload) + UPLOAD_SESSION_TTL
+    if expires > datetime.utcnow():
+        # Still in use: look again once it could have expired
+        schedule_upload_expiry(upload, expires)
+        db.session.commit()
+        return
+    part_path = _part_path(upload)
+    db.session.delete(upload)
+    db.session.commit()
+    blobs.remove_files([part_path])
+
+def requeue_upload_expiry():
+    """Queue expiry checks for upload sessions that have none, e.g. from before they existed"""
+    uploads = UploadSession.query.options(selectinload(UploadSession.parts)).all()
+    queued = jobs.active_keys([f'upload:{upload.id}' for upload in uploads])
+    for upload in uploads:
+        if f'upload:{upload.id}' not in queued:
+            schedule_upload_expiry(upload, _last_activity(upload) + UPLOAD_SESSION_TTL)
+
+jobs.register('expire_upload', lambda payload: expire_upload(payload['upload_id']),
+              recover=requeue_upload_expiry)
+
+def _staged_elsewhere():
+    """Response for an upload whose .part file is not in this instance's upload folder.
+    
+    Parts are staged locally (see services/storage.py), so behind several
+    instances an upload only works on the one that started it.
+    """
+    return jsonify({'message': 'Upload is staged on another server instance; start a new upload'}), 409
+
+def _part_path(upload):
+    return os.path.join(current_app.config['UPLOAD_FOLDER'], upload.stored_name + '.part')
+
+@projects_bp.route('/<int:project_id>/uploads', methods=['POST'])
+@login_required
+def init_chunked_upload(project_id):
+    """Start a resumable upload.
+    
+    Body: {"filename": ..., "size": <bytes>, "sha256": <optional hex digest>}.
+    The client then PUTs parts to /uploads/<upload_id>?offset=N in any order,
+    may resume by asking GET /uploads/<upload_id> which ranges arrived, and
+    finishes with POST /uploads/<upload_id>/complete.
+    """
+    project = Project.query.filter_by(id=project_id, user_id=current_user.id).first()
+    if not project:
+        return jsonify({'message': 'Project not found'}), 404
+    
+    data = request.get_json(silent=True) or {}
+    filename = secure_filename(data.get('filename') or '')
+    size = data.get('size')
+    checksum = data.get('sha256')
+    
+    if not filename or not allowed_file(filename):
+        return jsonify({'message': 'Invalid file type. Only PDF and Excel files allowed'}), 400
+    if isinstance(size, bool) or not isinstance(size, int) or size <= 0:
+        return jsonify({'message': 'size must be a positive integer'}), 400
+    if size > current_app.config['MAX_CHUNKED_UPLOAD_SIZE']:
+        return jsonify({'message': 'File is larger than the maximum allowed upload size'}), 413
+    if checksum is not None and not SHA256_PATTERN.fullmatch(str(checksum)):
+        return jsonify({'message': 'sha256 must be a hex SHA-256 digest'}), 400
+    
+    # Content we already store needs no transfer at all
+    blob = blobs.find_blob(checksum) if checksum else None
+    if blob and blob.size == size and blobs.add_reference(blob):
+        project_file = add_project_file(project_id, filename, blob)
+        db.session.commit()
+        return jsonify({
+            'message': 'File uploaded successfully',
+            'deduplicated': True,
+            'file': project_file.to_dict()
+        }), 201
+    
+    upload_id = uuid.uuid4().hex
+    timestamp = datetime.now().strftime('%Y%m%d%H%M%S')
+    upload = UploadSession(
+        id=upload_id,
+        project_id=project_id,
+        user_id=current_user.id,
         name=filename,
-        file_type=file_type,
-        file_path=unique_filename,
-        file_size=os.path.getsize(file_path),
-        project_id=project_id
+        file_type=file_type_for(filename),
+        stored_name=f"{timestamp}_{upload_id[:8]}_{filename}",
+        total_size=size,
+        sha256=checksum.lower() if checksum else None
     )
     
-    db.session.add(project_file)
+    # Reserve the whole file up front; parts are written in place at their offsets
+    with open(_part_path(upload), 'wb') as part_file:
+        part_file.truncate(size)
+    
+    db.session.add(upload)
+    db.session.flush()
+    schedule_upload_expiry(upload, datetime.utcnow() + UPLOAD_SESSION_TTL)
+    db.session.commit()
+    
+    result = upload.to_dict()
+    result['part_size'] = UPLOAD_PART_SIZE
+    return jsonify(result), 201
+
+@projects_bp.route('/<int:project_id>/uploads/<upload_id>', methods=['GET'])
+@login_required
+def get_chunked_upload(project_id, upload_id):
+    upload = _upload_session(project_id, upload_id)
+    if not upload:
+        return jsonify({'message': 'Upload not found'}), 404
+    if not os.path.exists(_part_path(upload)):
+        return _staged_elsewhere()
+    return jsonify(upload.to_dict()), 200
+
+@projects_bp.route('/<int:project_id>/uploads/<upload_id>', methods=['PUT'])
+@login_required
+def upload_part(project_id, upload_id):
+    """Write one part of a chunked upload.
+    
+    The raw request body is streamed to a temporary file without being
+    buffered in memory, checked, and only then copied into the upload at
+    ?offset=N, so a truncated or corrupt retry never overwrites bytes that
+    were already accepted. An optional X-Content-SHA256 header is checked
+    against the bytes received; a part that fails the check is not recorded
+    as received and must be sent again.
+    """
+    upload = _upload_session(project_id, upload_id)
+    if not upload:
+        return jsonify({'message': 'Upload not found'}), 404
+    if not os.path.exists(_part_path(upload)):
+        return _staged_elsewhere()
+    
+    try:
+        offset = int(request.args.get('offset', ''))
+    except ValueError:
+        return jsonify({'message': 'offset must be an integer'}), 400
+    length = request.content_length
+    if length is None:
+        return jsonify({'message': 'Content-Length is required'}), 411
+    if offset < 0 or length <= 0 or offset + length > upload.total_size:
+        return jsonify({'message': 'Part lies outside the declared file size'}), 416
+    
+    temp_file, sha256, written = blobs.stream_to_temp(request.stream)
+    try:
+        if written != length:
+            return jsonify({'message': 'Incomplete part body'}), 400
+        
+        expected = request.headers.get('X-Content-SHA256')
+        if expected and expected.lower() != sha256:
+            return jsonify({'message': 'Checksum mismatch', 'sha256': sha256}), 400
+        
+        with open(temp_file, 'rb') as part, open(_part_path(upload), 'r+b') as part_file:
+            part_file.seek(offset)
+            shutil.copyfileobj(part, part_file, STREAM_CHUNK_SIZE)
+    finally:
+        blobs.remove_files([temp_file])
+    
+    db.session.add(UploadPart(session_id=upload.id, offset=offset, length=length, sha256=sha256))
+    db.session.commit()
+    
+    return jsonify(upload.to_dict()), 200
+
+@projects_bp.route('/<int:project_id>/uploads/<upload_id>/complete', methods=['POST'])
+@login_required
+def complete_chunked_upload(project_id, upload_id):
+    upload = _upload_session(project_id, upload_id)
+    if not upload:
+        return jsonify({'message': 'Upload not found'}), 404
+    if not os.path.exists(_part_path(upload)):
+        return _staged_elsewhere()
+    
+    if upload.received_ranges() != [[0, upload.total_size]]:
+        return jsonify({'message': 'Upload is missing parts', 'upload': upload.to_dict()}), 409
+    
+    part_path = _part_path(upload)
+    sha256 = blobs.hash_file(part_path)
+    if upload.sha256 and sha256 != upload.sha256:
+        return jsonify({'message': 'Checksum mismatch', 'sha256': sha256}), 400
+    
+    # Locally this is a rename; object storage gets a parallel multipart upload
+    blob = blobs.store_blob(part_path, sha256, upload.total_size, file_extension(upload.name))
+    project_file = add_project_file(project_id, upload.name, blob)
+    db.session.delete(upload)
     db.session.commit()
     
     return jsonify({
@@ -140,6 +463,20 @@ def upload_file(project_id):
         'file': project_file.to_dict()
     }), 201
 
+@projects_bp.route('/<int:project_id>/uploads/<upload_id>', methods=['DELETE'])
+@login_required
+def abort_chunked_upload(project_id, upload_id):
+    upload = _upload_session(project_id, upload_id)
+    if not upload:
+        return jsonify({'message': 'Upload not found'}), 404
+    
+    if os.path.exists(_part_path(upload)):
+        os.remove(_part_path(upload))
+    db.session.delete(upload)
+    db.session.commit()
+    
+    return jsonify({'message': 'Upload aborted'}), 200
+
 @projects_bp.route('/<int:project_id>', methods=['DELETE'])
 @login_required
 def delete_project(project_id):
@@ -149,14 +486,7 @@ def delete_project(project_id):
     if not project:
         return jsonify({'message': 'Project not found'}), 404
     
-    # Delete associated files
-    for file in project.files:
-        file_path = os.path.join(current_app.config['UPLOAD_FOLDER'], file.file_path)
-        if os.path.exists(file_path):
-            os.remove(file_path)
-    
-    db.session.delete(project)
-    db.session.commit()
+    remove_project(project)
     
     return jsonify({'message': 'Project deleted successfully'}), 200
 
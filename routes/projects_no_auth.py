@@ -1,9 +1,9 @@
-from flask import Blueprint, request, jsonify, current_app
+from flask import Blueprint, request, jsonify
 from werkzeug.utils import secure_filename
 from extensions import db
-from models import Project, ProjectFile, User
-import os
-from datetime import datetime
+from models import Project, User
+from services import blobs, search
+from routes.projects import list_projects, add_project_file, file_extension, remove_project
 
 projects_no_auth_bp = Blueprint('projects_no_auth', __name__)
 
@@ -45,10 +45,13 @@ def get_projects():
         if not user:
             return jsonify({'error': 'Could not create default user'}), 500
         
-        print(f"Getting projects for user_id: {user.id}")
-        projects = Project.query.filter_by(user_id=user.id).all()
+        view = request.args.get('view', 'full')
+        if view not in ('full', 'summary'):
+            return jsonify({'error': "view must be 'full' or 'summary'"}), 400
+        
+        projects = list_projects(user.id, view)
         print(f"Found {len(projects)} projects for user {user.id}")
-        return jsonify([p.to_dict() for p in projects]), 200
+        return jsonify(projects), 200
         
     except Exception as e:
         print(f"Error getting projects: {str(e)}")
@@ -84,6 +87,8 @@ def create_project():
         )
         
         db.session.add(project)
+        db.session.flush()
+        search.index_project(project)
         db.session.commit()
         
         print(f"Project created successfully: {project.id}")
@@ -139,27 +144,12 @@ def upload_file(project_id):
         
         # Secure filename
         filename = secure_filename(file.filename)
-        timestamp = datetime.now().strftime('%Y%m%d%H%M%S')
-        unique_filename = f"{timestamp}_{filename}"
-        
-        # Save file
-        file_path = os.path.join(current_app.config['UPLOAD_FOLDER'], unique_filename)
-        file.save(file_path)
-        
-        # Get file type
-        file_ext = filename.rsplit('.', 1)[1].lower()
-        file_type = 'pdf' if file_ext == 'pdf' else 'excel'
-        
-        # Create file record
-        project_file = ProjectFile(
-            name=filename,
-            file_type=file_type,
-            file_path=unique_filename,
-            file_size=os.path.getsize(file_path),
-            project_id=project_id
-        )
         
-        db.session.add(project_file)
+        # Hash while saving, then store once under the content hash
+        temp_file, sha256, size = blobs.stream_to_temp(file.stream)
+        blob = blobs.store_blob(temp_file, sha256, size, file_extension(filename))
+        
+        project_file = add_project_file(project_id, filename, blob)
         db.session.commit()
         
         return jsonify({
@@ -185,14 +175,7 @@ def delete_project(project_id):
         if not project:
             return jsonify({'error': 'Project not found'}), 404
         
-        # Delete associated files
-        for file in project.files:
-            file_path = os.path.join(current_app.config['UPLOAD_FOLDER'], file.file_path)
-            if os.path.exists(file_path):
-                os.remove(file_path)
-        
-        db.session.delete(project)
-        db.session.commit()
+        remove_project(project)
         
         return jsonify({'message': 'Project deleted successfully'}), 200
         
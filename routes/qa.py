@@ -1,101 +1,134 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, current_app
 from flask_login import login_required, current_user
 from extensions import db
 from models import Question, User, Project, ProjectFile
-import threading
+from services import jobs, answerfeed, retrieval, search, sse
+from services.openai_client import get_openai_client
+from services.etags import bump_project_version, conditional, project_version
+from services.pagination import PaginationError, parse_page_args, keyset_page, listing_response
+from sqlalchemy import select, or_
+from sqlalchemy.orm import selectinload
 import os
+import threading
+import time
 
 qa_bp = Blueprint('qa', __name__)
 
-# Initialize OpenAI client lazily to ensure .env is loaded
-def get_openai_client():
-    """Get OpenAI client, initializing it if needed"""
-    try:
-        from openai import OpenAI
-        api_key = os.getenv('OPENAI_API_KEY')
-        if not api_key:
-            return None
-        return OpenAI(api_key=api_key)
-    except Exception as e:
-        print(f"Error initializing OpenAI client: {e}")
-        return None
+# Seconds a client is asked to wait when the answer queue is full
+QUESTION_RETRY_AFTER = 30
+# An idle answer stream sends a heartbeat this often (seconds) and is closed
+# after STREAM_MAX_AGE; EventSource reconnects and resumes from Last-Event-ID
+STREAM_HEARTBEAT = 15
+STREAM_MAX_AGE = 60
+# Each open stream holds a server thread, so a process serves at most
+# QA_STREAM_LIMIT of them; clients over the limit are told to retry later
+STREAM_LIMIT = int(os.getenv('QA_STREAM_LIMIT', 4))
+STREAM_RETRY = 3000
+STREAM_BUSY_RETRY = 15000
+_stream_slots = threading.BoundedSemaphore(STREAM_LIMIT)
+
+def save_answer(question, answer):
+    """Store an answer and mark the question answered"""
+    question.answer = answer
+    question.answered = True
+    answerfeed.record_answer(question)
+    search.index_question(question)
+    db.session.commit()
 
-def generate_ai_response(question_id, app):
-    """Generate AI response using OpenAI"""
-    with app.app_context():
-        try:
-            question = Question.query.get(question_id)
-            if not question:
-                return
-            
-            # Get OpenAI client
-            client = get_openai_client()
-            
-            # If OpenAI is not configured, use fallback response
-            if not client:
-                question.answer = "AI features require OpenAI API configuration. This is a simulated response: I can help you with interior design questions about dimensions, materials, color schemes, space planning, and design recommendations. Please configure the OpenAI API key to get intelligent AI-powered responses."
-                question.answered = True
-                db.session.commit()
-                return
-            
-            # Get project context
-            project = Project.query.get(question.project_id)
-            if not project:
-                question.answer = "Error: Project not found."
-                question.answered = True
-                db.session.commit()
-                return
-            
-            # Build context from project files
-            context = f"Project: {project.name}\nDescription: {project.description or 'No description'}\n\n"
-            
-            if project.files:
-                context += "Uploaded Files:\n"
-                for file in project.files:
-                    context += f"- {file.name} ({file.file_type})\n"
-            
-            # Create prompt for OpenAI
-            system_prompt = """You are an expert AI assistant for interior design and architecture projects. 
+def generate_ai_response(question_id):
+    """Generate AI response using OpenAI; runs as an answer_question job"""
+    question = Question.query.get(question_id)
+    if not question or question.answered:
+        return
+    
+    # Get OpenAI client
+    client = get_openai_client()
+    
+    # If OpenAI is not configured, use fallback response
+    if not client:
+        save_answer(question, "AI features require OpenAI API configuration. This is a simulated response: I can help you with interior design questions about dimensions, materials, color schemes, space planning, and design recommendations. Please configure the OpenAI API key to get intelligent AI-powered responses.")
+        return
+    
+    # Get project context
+    project = Project.query.get(question.project_id)
+    if not project:
+        save_answer(question, "Error: Project not found.")
+        return
+    
+    # Build context from project files
+    context = f"Project: {project.name}\nDescription: {project.description or 'No description'}\n\n"
+    
+    if project.files:
+        context += "Uploaded Files:\n"
+        for file in project.files:
+            context += f"- {file.name} ({file.file_type})\n"
+        
+        # Only the passages of the documents relevant to the question
+        excerpts = retrieval.excerpts(project, question.question)
+        if excerpts:
+            context += f"\nRelevant Excerpts:{excerpts}"
+    
+    # Create prompt for OpenAI
+    system_prompt = """You are an expert AI assistant for interior design and architecture projects. 
 You help analyze floor plans, design documents, and answer questions about dimensions, materials, 
 specifications, and design recommendations. Provide detailed, professional answers based on the 
 project context provided."""
-            
-            user_prompt = f"""Project Context:
+    
+    user_prompt = f"""Project Context:
 {context}
 
 User Question: {question.question}
 
 Please provide a detailed, professional answer to this question about the interior design project."""
 
-            # Call OpenAI API
-            response = client.chat.completions.create(
-                model="gpt-4",
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": user_prompt}
-                ],
-                max_tokens=500,
-                temperature=0.7
-            )
-            
-            # Update question with AI response
-            question.answer = response.choices[0].message.content
-            question.answered = True
-            db.session.commit()
-            
-        except Exception as e:
-            print(f"Error generating AI response: {str(e)}")
-            question = Question.query.get(question_id)
-            if question:
-                question.answer = f"I'm here to help with your interior design questions! However, I encountered an issue: {str(e)}. Please try again or rephrase your question."
-                question.answered = True
-                db.session.commit()
+    # Call OpenAI API
+    response = client.chat(
+        model="gpt-4",
+        messages=[
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_prompt}
+        ],
+        max_tokens=500,
+        temperature=0.7
+    )
+    
+    # Update question with AI response
+    save_answer(question, response.choices[0].message.content)
+
+def answer_failed(payload, error):
+    """Answer with an apology once every attempt at a real answer failed"""
+    question = Question.query.get(payload['question_id'])
+    if question and not question.answered:
+        save_answer(question, f"I'm here to help with your interior design questions! However, I encountered an issue: {error}. Please try again or rephrase your question.")
+
+def requeue_unanswered():
+    """Queue questions whose answer was lost, e.g. asked before a crash"""
+    question_ids = db.session.execute(
+        select(Question.id).where(or_(Question.answered.is_(False), Question.answered.is_(None)))
+    ).scalars().all()
+    queued = jobs.active_keys([f'question:{question_id}' for question_id in question_ids])
+    for question_id in question_ids:
+        if f'question:{question_id}' not in queued:
+            jobs.enqueue('answer_question', {'question_id': question_id},
+                         key=f'question:{question_id}', check_limit=False)
+
+jobs.register('answer_question', lambda payload: generate_ai_response(payload['question_id']),
+              on_failure=answer_failed, recover=requeue_unanswered)
 
 @qa_bp.route('/project/<int:project_id>', methods=['GET'])
 @login_required
+@conditional('questions', project_version)
 def get_questions(project_id):
-    questions = Question.query.filter_by(project_id=project_id).all()
-    return jsonify([q.to_dict() for q in questions]), 200
+    try:
+        limit, cursor = parse_page_args(request.args)
+    except PaginationError as e:
+        return jsonify({'message': str(e)}), 400
+    
+    questions, next_cursor = keyset_page(
+        Question.query.filter_by(project_id=project_id).options(selectinload(Question.user)),
+        Question.created_at, Question.id, limit, cursor
+    )
+    return listing_response([q.to_dict() for q in questions], limit, next_cursor)
 
 @qa_bp.route('', methods=['POST'])
 @login_required
@@ -117,13 +150,81 @@ def ask_question():
     )
     
     db.session.add(question)
-    db.session.commit()
+    db.session.flush()
+    search.index_question(question)
+    
+    # The answer is generated by a job worker; the job commits with the question
+    try:
+        jobs.enqueue('answer_question', {'question_id': question.id}, key=f'question:{question.id}')
+    except jobs.QueueFull:
+        db.session.rollback()
+        response = jsonify({'message': 'Too many questions are waiting for an answer, please retry shortly'})
+        response.headers['Retry-After'] = str(QUESTION_RETRY_AFTER)
+        return response, 429
     
-    # Start AI response generation in background
-    from flask import current_app
-    thread = threading.Thread(target=generate_ai_response, args=(question.id, current_app._get_current_object()))
-    thread.daemon = True
-    thread.start()
+    bump_project_version(project_id)
+    db.session.commit()
     
     return jsonify(question.to_dict()), 201
 
+@qa_bp.route('/project/<int:project_id>/stream', methods=['GET'])
+@login_required
+def stream_answers(project_id):
+    """Push answers to this project's questions as server-sent events.
+    
+    A new stream starts with a 'ready' event: anything answered before it is
+    in the question listing, everything after arrives as an 'answered'
+    event carrying the question. Event ids are project versions, so a
+    reconnect resumes from Last-Event-ID. Past STREAM_LIMIT open streams
+    the response only sets a longer retry delay and ends.
+    """
+    if not Project.query.filter_by(id=project_id, user_id=current_user.id).first():
+        return jsonify({'message': 'Project not found'}), 404
+    
+    if not _stream_slots.acquire(blocking=False):
+        # Busy: end right away and let EventSource come back later
+        db.session.close()
+        return sse.response(iter([sse.retry(STREAM_BUSY_RETRY)]))
+    
+    try:
+        latest = answerfeed.latest_version(project_id)
+        last_event_id = request.headers.get('Last-Event-ID', type=int)
+        if last_event_id is not None and last_event_id > latest:
+            # Not an id of this project's current log: start over
+            last_event_id = None
+        start = latest if last_event_id is None else last_event_id
+        # Subscribe before reading the log so nothing falls in between
+        subscription = answerfeed.subscribe(current_app._get_current_object(), project_id, start)
+        backlog = answerfeed.events_since(project_id, start)
+    except Exception:
+        _stream_slots.release()
+        raise
+    # Don't hold a database connection (or a SQLite read lock) while streaming
+    db.session.close()
+    
+    def close():
+        subscription.close()
+        _stream_slots.release()
+    
+    def generate():
+        last_id = start
+        yield sse.retry(STREAM_RETRY)
+        if last_event_id is None:
+            yield sse.event('ready', {}, id=start)
+        for message in backlog:
+            last_id = message['id']
+            yield sse.event('answered', message['question'], id=last_id)
+        if len(backlog) == answerfeed.BATCH_SIZE:
+            # More to catch up on; the reconnect continues from last_id
+            return
+        
+        deadline = time.monotonic() + STREAM_MAX_AGE
+        while time.monotonic() < deadline and not subscription.overflowed:
+            message = subscription.get(STREAM_HEARTBEAT)
+            if message is None:
+                yield sse.comment('keep-alive')
+            elif message['id'] > last_id:
+                last_id = message['id']
+                yield sse.event('answered', message['question'], id=last_id)
+    
+    return sse.response(generate(), on_close=close)
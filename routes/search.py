@@ -0,0 +1,51 @@
+from flask import Blueprint, request, jsonify
+from flask_login import login_required, current_user
+from extensions import db
+from models import Project
+from services import search as search_index
+from sqlalchemy import select
+import time
+
+search_bp = Blueprint('search', __name__)
+
+DEFAULT_LIMIT = 20
+MAX_LIMIT = 100
+
+@search_bp.route('', methods=['GET'])
+@login_required
+def search():
+    """Full-text search across the current user's projects.
+
+    ?q= is required. ?project_id= (repeatable) and ?kind= (comma separated:
+    project, question, discussion, annotation, page) narrow the search.
+    Snippets are HTML-escaped with matches wrapped in <mark>.
+    """
+    query = (request.args.get('q') or '').strip()
+    if not query:
+        return jsonify({'message': 'Query parameter q is required'}), 400
+
+    limit = request.args.get('limit', DEFAULT_LIMIT, type=int)
+    if limit is None or limit < 1:
+        return jsonify({'message': 'limit must be a positive integer'}), 400
+    limit = min(limit, MAX_LIMIT)
+
+    kinds = [kind for kind in request.args.get('kind', '').split(',') if kind]
+    unknown = [kind for kind in kinds if kind not in search_index.KINDS]
+    if unknown:
+        return jsonify({'message': f"Unknown kind: {', '.join(unknown)}"}), 400
+    project_ids = request.args.getlist('project_id', type=int) or None
+
+    started = time.perf_counter()
+    results = search_index.search(current_user.id, query, limit, project_ids, kinds)
+
+    names = dict(db.session.execute(
+        select(Project.id, Project.name).where(Project.id.in_({r['project_id'] for r in results}))
+    ).all()) if results else {}
+    for result in results:
+        result['project_name'] = names.get(result['project_id'])
+
+    return jsonify({
+        'query': query,
+        'results': results,
+        'took_ms': round((time.perf_counter() - started) * 1000, 1)
+    }), 200
@@ -0,0 +1,86 @@
+from flask import Blueprint, request, jsonify
+from flask_login import login_required, current_user
+from extensions import db
+from models import Project, ProjectFile, FileSheet
+from services import sheets
+
+sheets_bp = Blueprint('sheets', __name__)
+
+DEFAULT_SLICE_ROWS = 100
+MAX_SLICE_ROWS = 1000
+# Seconds a client is asked to wait while a lost sheet cache is rebuilt
+REBUILD_RETRY_AFTER = 10
+
+def owned_file(project_id, file_id):
+    """The spreadsheet file if it belongs to one of the current user's projects"""
+    return ProjectFile.query.join(Project).filter(
+        ProjectFile.id == file_id,
+        ProjectFile.project_id == project_id,
+        Project.user_id == current_user.id
+    ).first()
+
+def owned_sheet(project_id, file_id, sheet):
+    if not owned_file(project_id, file_id):
+        return None
+    return db.session.get(FileSheet, (file_id, sheet))
+
+def rebuilding(file_id):
+    """Queue a spreadsheet whose cache was lost for ingestion and say so"""
+    sheets.requeue_missing(file_id)
+    response = jsonify({'message': 'Spreadsheet is being prepared, please retry shortly', 'status': sheets.PENDING})
+    response.headers['Retry-After'] = str(REBUILD_RETRY_AFTER)
+    return response, 503
+
+@sheets_bp.route('/<int:project_id>/files/<int:file_id>/sheets', methods=['GET'])
+@login_required
+def list_sheets(project_id, file_id):
+    project_file = owned_file(project_id, file_id)
+    if not project_file or project_file.file_type != 'excel':
+        return jsonify({'message': 'Spreadsheet not found'}), 404
+
+    file_sheets = FileSheet.query.filter_by(file_id=file_id).order_by(FileSheet.sheet).all()
+    return jsonify({
+        'status': project_file.sheet_status,
+        'sheets': [file_sheet.to_dict() for file_sheet in file_sheets]
+    }), 200
+
+@sheets_bp.route('/<int:project_id>/files/<int:file_id>/sheets/<int:sheet>/rows', methods=['GET'])
+@login_required
+def get_sheet_rows(project_id, file_id, sheet):
+    """A slice of a sheet: ?offset=0&limit=100&columns=Item,Qty"""
+    file_sheet = owned_sheet(project_id, file_id, sheet)
+    if not file_sheet:
+        return jsonify({'message': 'Sheet not found'}), 404
+
+    offset = request.args.get('offset', 0, type=int)
+    limit = request.args.get('limit', DEFAULT_SLICE_ROWS, type=int)
+    if offset < 0 or limit < 1:
+        return jsonify({'message': 'offset must be >= 0 and limit >= 1'}), 400
+    names = [name for name in request.args.get('columns', '').split(',') if name] or None
+
+    try:
+        return jsonify(sheets.sheet_slice(file_sheet, offset, min(limit, MAX_SLICE_ROWS), names)), 200
+    except sheets.SheetError as e:
+        return jsonify({'message': str(e)}), 400
+    except sheets.SheetUnavailable:
+        return rebuilding(file_id)
+
+@sheets_bp.route('/<int:project_id>/files/<int:file_id>/sheets/<int:sheet>/aggregate', methods=['GET'])
+@login_required
+def aggregate_sheet_column(project_id, file_id, sheet):
+    """Aggregates of one column: ?column=Amount[&group_by=Trade]"""
+    file_sheet = owned_sheet(project_id, file_id, sheet)
+    if not file_sheet:
+        return jsonify({'message': 'Sheet not found'}), 404
+
+    column = request.args.get('column')
+    if not column:
+        return jsonify({'message': 'column is required'}), 400
+
+    try:
+        result = sheets.aggregate(file_sheet, column, request.args.get('group_by') or None)
+    except sheets.SheetError as e:
+        return jsonify({'message': str(e)}), 400
+    except sheets.SheetUnavailable:
+        return rebuilding(file_id)
+    return jsonify(dict(result, column=column)), 200
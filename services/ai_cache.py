@@ -0,0 +1,142 @@
+"""
+Response cache for AI completions.
+
+Identical requests (same model, parameters and rendered prompt) are
+answered from the cache instead of calling the API again. The key is a
+SHA-256 of those inputs. There are two tiers: an in-process LRU checked
+first, and the ai_responses table shared by all workers. Entries expire
+after AI_CACHE_TTL seconds. Callers pass refresh=True (the routes map
+?refresh=1 to it) to skip the lookup and overwrite the entry.
+
+Settings (environment):
+    AI_CACHE_TTL    seconds an answer stays cached (default: 86400)
+    AI_CACHE_SIZE   entries kept in the in-process tier (default: 256)
+"""
+from collections import OrderedDict
+from extensions import db
+from models import AIResponse
+from sqlalchemy import delete, insert, update
+from sqlalchemy.exc import IntegrityError, OperationalError
+from datetime import datetime, timedelta
+import hashlib
+import json
+import os
+import threading
+
+TTL = timedelta(seconds=int(os.getenv('AI_CACHE_TTL', 24 * 60 * 60)))
+MEMORY_SIZE = int(os.getenv('AI_CACHE_SIZE', 256))
+# Expired rows are deleted after this many stores in a process
+PURGE_EVERY = 100
+
+_memory = OrderedDict()  # key -> (content, expires_at)
+_lock = threading.Lock()
+_stats = {'memory_hits': 0, 'db_hits': 0, 'misses': 0, 'refreshes': 0}
+_stores = 0
+
+
+def cache_key(params):
+    encoded = json.dumps(params, sort_keys=True, separators=(',', ':'), ensure_ascii=False)
+    return hashlib.sha256(encoded.encode('utf-8')).hexdigest()
+
+
+def _count(name):
+    with _lock:
+        _stats[name] += 1
+
+
+def _remember(key, content, expires_at):
+    with _lock:
+        _memory[key] = (content, expires_at)
+        _memory.move_to_end(key)
+        while len(_memory) > MEMORY_SIZE:
+            _memory.popitem(last=False)
+
+
+def lookup(key):
+    """Cached content for key, or None; counts memory and database hits"""
+    now = datetime.utcnow()
+    with _lock:
+        entry = _memory.get(key)
+        if entry and entry[1] > now:
+            _memory.move_to_end(key)
+            _stats['memory_hits'] += 1
+            return entry[0]
+        if entry:
+            del _memory[key]
+
+    row = db.session.get(AIResponse, key)
+    if row is not None and row.expires_at > now:
+        _remember(key, row.content, row.expires_at)
+        _count('db_hits')
+        return row.content
+    return None
+
+
+def store(key, model, content):
+    global _stores
+    expires_at = datetime.utcnow() + TTL
+    _remember(key, content, expires_at)
+    with _lock:
+        _stores += 1
+        purge = _stores % PURGE_EVERY == 0
+    try:
+        # Write first (no read-then-write), so SQLite waits for the lock
+        # instead of failing on a lock upgrade
+        values = {'model': model, 'content': content, 'expires_at': expires_at, 'created_at': datetime.utcnow()}
+        updated = db.session.execute(update(AIResponse).where(AIResponse.key == key).values(**values)).rowcount
+        if not updated:
+            try:
+                with db.session.begin_nested():
+                    db.session.execute(insert(AIResponse).values(key=key, **values))
+            except IntegrityError:
+                # Another worker stored the same prompt first; its answer is as good
+                pass
+        if purge:
+            db.session.execute(delete(AIResponse).where(AIResponse.expires_at <= datetime.utcnow()))
+        db.session.commit()
+    except OperationalError as e:
+        # Best effort: a locked database must not cost the caller its answer
+        print(f"Error storing AI response in cache: {e}")
+        db.session.rollback()
+
+
+def get(key, refresh=False):
+    """Cached content for key unless refreshing; counts the outcome"""
+    if refresh:
+        _count('refreshes')
+        return None
+    content = lookup(key)
+    if content is None:
+        _count('misses')
+    return content
+
+
+def cached_chat(client, refresh=False, **params):
+    """client.chat(**params) through the cache.
+
+    Returns (content, cached) where cached tells whether the API was skipped.
+    """
+    key = cache_key(params)
+    content = get(key, refresh)
+    if content is not None:
+        return content, True
+
+    response = client.chat(**params)
+    content = response.choices[0].message.content
+    store(key, params.get('model', ''), content)
+    return content, False
+
+
+def stats():
+    """Counters of this process since it started"""
+    with _lock:
+        counters = dict(_stats)
+        counters['memory_entries'] = len(_memory)
+    lookups = counters['memory_hits'] + counters['db_hits'] + counters['misses']
+    counters['hit_rate'] = round((counters['memory_hits'] + counters['db_hits']) / lookups, 3) if lookups else None
+    return counters
+
+
+def clear_memory():
+    with _lock:
+        _memory.clear()
@@ -0,0 +1,146 @@
+"""
+Answer log backing the pushed Q&A answer streams.
+
+Saving an answer appends a question_events row in the same transaction.
+Each process relays new rows to its open streams through services.pubsub,
+on the channel of the question's project, so an answer produced by a job
+worker in any process reaches every browser waiting for it.
+
+Events are ordered by the project's version (projects.version) after the
+answer, not by row id: bumping the version locks the project row until
+commit, so versions become visible in commit order, whereas an id assigned
+at insert can commit after a higher one and be skipped by a cursor that
+already moved past it. The version is also the SSE event id, which lets a
+reconnecting stream resume where it left off, and the relay keeps one
+cursor per project that has streams open in this process.
+"""
+from extensions import db
+from models import Project, Question, QuestionEvent
+from services import pubsub
+from services.etags import bump_project_version
+from sqlalchemy import select, delete, or_, and_
+from sqlalchemy.orm import selectinload
+from datetime import datetime, timedelta
+import threading
+
+CHANNEL_PREFIX = 'questions:'
+# Rows a relay poll publishes at most; the rest follow on the next poll
+BATCH_SIZE = 500
+# Events are kept this long for resuming streams, then deleted
+RETENTION = timedelta(days=1)
+
+_last_purge = datetime.min
+# Guards the relay's cursors against streams opening at the same time
+_cursor_lock = threading.Lock()
+
+
+def channel(project_id):
+    return f'{CHANNEL_PREFIX}{project_id}'
+
+
+def record_answer(question):
+    """Log that question was answered, in the current transaction.
+
+    Also bumps the project's version, which the event is logged under;
+    callers do not need to call bump_project_version() for it.
+    """
+    bump_project_version(question.project_id)
+    version = db.session.query(Project.version).filter(Project.id == question.project_id).scalar()
+    db.session.add(QuestionEvent(project_id=question.project_id, question_id=question.id, version=version))
+
+
+def purge_project(project_id):
+    db.session.execute(delete(QuestionEvent).where(QuestionEvent.project_id == project_id))
+
+
+def latest_version(project_id):
+    """Event id covering every committed answer of a project"""
+    return db.session.query(Project.version).filter(Project.id == project_id).scalar() or 0
+
+
+def messages(events):
+    """Stream messages ({'id', 'project_id', 'question'}) for events, in order"""
+    question_ids = {event.question_id for event in events}
+    questions = {
+        question.id: question
+        for question in Question.query.filter(Question.id.in_(question_ids)).options(selectinload(Question.user))
+    } if question_ids else {}
+    return [
+        {'id': event.version, 'project_id': event.project_id, 'question': questions[event.question_id].to_dict()}
+        for event in events if event.question_id in questions
+    ]
+
+
+def whole_versions(events):
+    """Drop the last version of a full batch, which may continue past it"""
+    if len(events) < BATCH_SIZE:
+        return events
+    last = (events[-1].project_id, events[-1].version)
+    complete = [event for event in events if (event.project_id, event.version) != last]
+    return complete or events
+
+
+def events_since(project_id, since):
+    """Messages of one project after version since, for a starting stream"""
+    events = db.session.execute(
+        select(QuestionEvent)
+        .where(QuestionEvent.project_id == project_id, QuestionEvent.version > since)
+        .order_by(QuestionEvent.version, QuestionEvent.id)
+        .limit(BATCH_SIZE)
+    ).scalars().all()
+    return messages(whole_versions(events))
+
+
+def relay(cursors):
+    """Publish events logged after each project's cursor; the pub/sub relay's poll function.
+
+    cursors maps the project ids with streams open in this process to the
+    last version published for them.
+    """
+    global _last_purge
+    with _cursor_lock:
+        listening = {channel[len(CHANNEL_PREFIX):] for channel in pubsub.subscribed_channels(CHANNEL_PREFIX)}
+        for project_id in [project_id for project_id in cursors if str(project_id) not in listening]:
+            del cursors[project_id]
+        watched = dict(cursors)
+    if watched:
+        events = db.session.execute(
+            select(QuestionEvent)
+            .where(or_(*(and_(QuestionEvent.project_id == project_id, QuestionEvent.version > version)
+                         for project_id, version in watched.items())))
+            .order_by(QuestionEvent.project_id, QuestionEvent.version, QuestionEvent.id)
+            .limit(BATCH_SIZE)
+        ).scalars().all()
+        events = whole_versions(events)
+        for message in messages(events):
+            pubsub.publish(channel(message['project_id']), message)
+        with _cursor_lock:
+            for event in events:
+                if event.project_id in cursors:
+                    cursors[event.project_id] = max(cursors[event.project_id], event.version)
+
+    now = datetime.utcnow()
+    if now - _last_purge >= timedelta(hours=1):
+        _last_purge = now
+        db.session.execute(delete(QuestionEvent).where(QuestionEvent.created_at < now - RETENTION))
+        db.session.commit()
+    return cursors
+
+
+def start_relay(app):
+    """Start this process's relay (once); it only polls while streams are open"""
+    return pubsub.start_relay(app, 'answers', relay, CHANNEL_PREFIX, {})
+
+
+def subscribe(app, project_id, since):
+    """Subscribe to a project's answers logged after version since"""
+    cursors = start_relay(app).cursor
+    with _cursor_lock:
+        if channel(project_id) not in pubsub.subscribed_channels(CHANNEL_PREFIX):
+            # Left over from streams that have closed since
+            cursors.pop(project_id, None)
+        subscription = pubsub.subscribe(channel(project_id))
+        # Open streams may still be waiting for events up to since; starting
+        # lower than needed only repeats events, which streams skip
+        cursors.setdefault(project_id, since)
+    return subscription
@@ -0,0 +1,143 @@
+"""
+Content-addressed storage for uploaded files.
+
+Uploads are hashed with SHA-256 while they are streamed to a temporary
+file in the upload folder, then stored once under the key
+blobs/<2 hex>/<sha256>.<ext> in the storage backend (services/storage.py).
+ProjectFile rows point at a shared FileBlob row that counts its
+references; the stored file is only removed when the last reference is
+released. Taking and releasing references are single conditional
+statements, so a reference taken while the last one is released either
+keeps the blob alive or finds it gone, never a row whose file is deleted.
+"""
+from flask import current_app
+from extensions import db
+from models import FileBlob
+from services import storage
+from sqlalchemy import update, delete, select
+from sqlalchemy.exc import IntegrityError
+import hashlib
+import os
+import uuid
+
+STREAM_CHUNK_SIZE = 1024 * 1024
+
+
+def upload_root():
+    return current_app.config['UPLOAD_FOLDER']
+
+
+def temp_path():
+    """A fresh path for staging an upload before it is hashed and stored"""
+    folder = os.path.join(upload_root(), 'tmp')
+    os.makedirs(folder, exist_ok=True)
+    return os.path.join(folder, uuid.uuid4().hex)
+
+
+def stream_to_temp(stream):
+    """Copy a stream to a temporary file, hashing it on the way.
+    
+    Returns (temp_path, sha256 hex digest, size in bytes).
+    """
+    path = temp_path()
+    digest = hashlib.sha256()
+    size = 0
+    with open(path, 'wb') as out:
+        for chunk in iter(lambda: stream.read(STREAM_CHUNK_SIZE), b''):
+            digest.update(chunk)
+            out.write(chunk)
+            size += len(chunk)
+    return path, digest.hexdigest(), size
+
+
+def hash_file(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as source:
+        for chunk in iter(lambda: source.read(STREAM_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def blob_relative_path(sha256, extension, unique=False):
+    suffix = f'-{uuid.uuid4().hex[:8]}' if unique else ''
+    return f"blobs/{sha256[:2]}/{sha256}{suffix}.{extension}"
+
+
+def find_blob(sha256):
+    return FileBlob.query.filter_by(sha256=sha256.lower()).first()
+
+
+def add_reference(blob):
+    """Count one more ProjectFile pointing at an existing blob.
+    
+    Returns False when the blob was deleted since it was looked up (its
+    last reference was released concurrently); the content is not stored
+    any more then.
+    """
+    return db.session.execute(
+        update(FileBlob).where(FileBlob.id == blob.id, FileBlob.ref_count > 0)
+        .values(ref_count=FileBlob.ref_count + 1),
+        execution_options={'synchronize_session': False}
+    ).rowcount > 0
+
+
+def store_blob(source_path, sha256, size, extension):
+    """Store a hashed file under its content address and take a reference.
+    
+    If identical content is already stored the source file is discarded and
+    the existing blob is reused. The caller commits.
+    """
+    store = storage.backend()
+    blob = find_blob(sha256)
+    if blob is not None and add_reference(blob):
+        if store.exists(blob.path):
+            os.remove(source_path)
+        else:
+            # The row outlived its file (e.g. a lost volume); restore it
+            store.put_file(source_path, blob.path)
+        return blob
+    
+    # A blob released since find_blob() still has its file deleted after
+    # that transaction commits, so this copy goes under a key of its own
+    relative_path = blob_relative_path(sha256, extension, unique=blob is not None)
+    store.put_file(source_path, relative_path)
+    
+    blob = FileBlob(sha256=sha256, size=size, path=relative_path, ref_count=1)
+    try:
+        with db.session.begin_nested():
+            db.session.add(blob)
+        return blob
+    except IntegrityError:
+        # A concurrent upload of the same content won the insert; share its
+        # row (the bytes are identical) and drop our copy if it has its own key
+        blob = find_blob(sha256)
+        if blob.path != relative_path:
+            store.delete([relative_path])
+    
+    add_reference(blob)
+    return blob
+
+
+def release_blob(blob_id):
+    """Drop one reference and delete the blob row once none remain.
+    
+    Returns the storage key to delete after the transaction commits, or
+    None while other files still reference the content.
+    """
+    db.session.execute(
+        update(FileBlob).where(FileBlob.id == blob_id).values(ref_count=FileBlob.ref_count - 1),
+        execution_options={'synchronize_session': False}
+    )
+    path = db.session.execute(select(FileBlob.path).where(FileBlob.id == blob_id)).scalar()
+    # Only deleted if no reference was taken in the meantime
+    deleted = db.session.execute(
+        delete(FileBlob).where(FileBlob.id == blob_id, FileBlob.ref_count <= 0)
+    ).rowcount
+    return path if deleted else None
+
+
+def remove_files(paths):
+    """Remove local staging files (see storage.backend().delete for stored ones)"""
+    for path in paths:
+        if path and os.path.exists(path):
+            os.remove(path)
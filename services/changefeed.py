@@ -0,0 +1,80 @@
+"""
+Annotation change log backing the incremental sync feed.
+
+Every annotation write appends one row per affected annotation to
+annotation_changes in the same transaction. The token is the project's
+version (projects.version) after the write: bumping it locks the project
+row until the transaction commits, so versions are handed out in commit
+order. Row ids are not: they are assigned at insert, and a transaction
+holding id N can commit after N + 1 is already visible, which would make a
+client that moved past N + 1 skip it forever. A client that has applied
+everything up to token N asks for changes after N and receives the
+annotations upserted since then plus tombstones for the ones deleted.
+"""
+from extensions import db
+from models import AnnotationChange, Project
+from services.etags import bump_project_version
+from sqlalchemy import insert, delete
+
+UPSERT = 'upsert'
+DELETE = 'delete'
+
+
+def record_changes(changes):
+    """Append (project_id, annotation_id, op) entries in the current transaction.
+
+    Also bumps the version of every project involved; callers do not need
+    to call bump_project_version() for them.
+    """
+    if not changes:
+        return
+    project_ids = sorted({project_id for project_id, _, _ in changes})
+    # In id order, so concurrent writers lock project rows in the same order
+    for project_id in project_ids:
+        bump_project_version(project_id)
+    versions = dict(db.session.query(Project.id, Project.version).filter(Project.id.in_(project_ids)).all())
+    db.session.execute(insert(AnnotationChange), [
+        {'project_id': project_id, 'annotation_id': annotation_id, 'op': op, 'version': versions[project_id]}
+        for project_id, annotation_id, op in changes
+    ])
+
+
+def purge_project(project_id):
+    db.session.execute(delete(AnnotationChange).where(AnnotationChange.project_id == project_id))
+
+
+def latest_token(project_id):
+    """Token covering every committed change of a project"""
+    return db.session.query(Project.version).filter(Project.id == project_id).scalar() or 0
+
+
+def changes_since(project_id, since, limit):
+    """Collapse the changes after a token into the final op per annotation.
+    
+    Returns (ops, token, has_more) where ops maps annotation id to its last
+    op within the window and token is the version of the last change
+    included. A window never ends in the middle of a version: the client
+    could not resume inside it.
+    """
+    columns = (AnnotationChange.version, AnnotationChange.annotation_id, AnnotationChange.op)
+    entries = db.session.query(*columns) \
+        .filter(AnnotationChange.project_id == project_id, AnnotationChange.version > since) \
+        .order_by(AnnotationChange.version.asc(), AnnotationChange.id.asc()) \
+        .limit(limit + 1) \
+        .all()
+    
+    has_more = len(entries) > limit
+    if has_more:
+        cut = entries[limit].version
+        entries = [entry for entry in entries[:limit] if entry.version != cut]
+        if not entries:
+            # One write changed more than limit annotations; send all of it
+            entries = db.session.query(*columns) \
+                .filter(AnnotationChange.project_id == project_id, AnnotationChange.version == cut) \
+                .order_by(AnnotationChange.id.asc()) \
+                .all()
+    ops = {}
+    for entry in entries:
+        ops[entry.annotation_id] = entry.op
+    token = entries[-1].version if entries else since
+    return ops, token, has_more
@@ -0,0 +1,75 @@
+"""
+Project change versions and conditional GET support.
+
+Every write to a project's collaborative data (files, annotations,
+questions, discussions) bumps projects.version in the same transaction.
+Read endpoints derive a strong ETag from that version plus the request's
+query string, so an If-None-Match revalidation costs one indexed lookup
+and is answered with 304 before any rows are loaded or serialized.
+"""
+from flask import request, make_response
+from functools import wraps
+from extensions import db
+from models import Project, ProjectFile
+from sqlalchemy import update
+import hashlib
+
+
+def bump_project_version(project_id):
+    """Mark a project's data as changed; call inside the writing transaction"""
+    db.session.execute(
+        update(Project).where(Project.id == project_id).values(version=Project.version + 1),
+        execution_options={'synchronize_session': False}
+    )
+
+
+def make_etag(scope, project_id, version):
+    # The query string selects the representation (paging, format, viewport)
+    variant = hashlib.sha1(request.query_string).hexdigest()[:12]
+    return f'{scope}-{project_id}-{version}-{variant}'
+
+
+def conditional(scope, resolve_version):
+    """Answer If-None-Match with 304 using the owning project's version.
+    
+    resolve_version receives the view's keyword arguments and returns
+    (project_id, version), or None when the resource does not exist, in which
+    case the view runs normally (and usually returns 404).
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            resolved = resolve_version(**kwargs)
+            if resolved is None or resolved[1] is None:
+                return view(*args, **kwargs)
+            
+            etag = make_etag(scope, *resolved)
+            if request.if_none_match.contains(etag):
+                response = make_response('', 304)
+            else:
+                response = make_response(view(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+            
+            # Per-user data: let the browser keep it but revalidate on every use
+            response.set_etag(etag)
+            response.headers['Cache-Control'] = 'private, no-cache'
+            return response
+        return wrapper
+    return decorator
+
+
+def project_version(project_id, user_id=None):
+    """(project_id, version) for a project, optionally restricted to its owner"""
+    query = db.session.query(Project.id, Project.version).filter(Project.id == project_id)
+    if user_id is not None:
+        query = query.filter(Project.user_id == user_id)
+    return query.first()
+
+
+def file_project_version(file_id):
+    """(project_id, version) of the project a file belongs to"""
+    return db.session.query(Project.id, Project.version) \
+        .join(ProjectFile, ProjectFile.project_id == Project.id) \
+        .filter(ProjectFile.id == file_id) \
+        .first()
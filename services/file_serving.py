@@ -0,0 +1,143 @@
+"""
+Serving uploaded files.
+
+Uploads are served with validators and range support so viewers can
+revalidate instead of re-downloading, and PDF.js can fetch the byte ranges
+of the pages it shows:
+
+- Strong ETags: the SHA-256 for content-addressed blobs (their name), size
+  and modification time for anything else in the upload folder.
+- Cache-Control: blobs never change, so browsers and proxies may keep them
+  for a year without asking; other files are revalidated on every use.
+- Single byte ranges (Range / If-Range) answered with 206 or 416. Requests
+  for several ranges get the whole file, which HTTP allows.
+
+Bodies are handed to the server's wsgi.file_wrapper positioned at the
+first byte, with an exact Content-Length, so gunicorn sends full files and
+ranges alike with sendfile() and no worker reads them. With
+UPLOAD_ACCEL_REDIRECT set to an internal nginx location, the body is left
+to nginx entirely (X-Accel-Redirect), which also handles ranges:
+
+    location /_uploads/ {
+        internal;
+        alias /app/static/uploads/;
+    }
+
+Settings (environment):
+    UPLOAD_ACCEL_REDIRECT  internal nginx location of the upload folder,
+                           e.g. /_uploads/ (default: unset, serve directly)
+"""
+from flask import current_app, request, Response
+from werkzeug.exceptions import NotFound
+from werkzeug.http import is_resource_modified
+from werkzeug.security import safe_join
+import mimetypes
+import os
+import re
+
+ACCEL_REDIRECT = os.getenv('UPLOAD_ACCEL_REDIRECT')
+IMMUTABLE = 'public, max-age=31536000, immutable'
+REVALIDATE = 'public, no-cache'
+BLOCK_SIZE = 256 * 1024
+
+_BLOB_NAME = re.compile(r'^blobs/[0-9a-f]{2}/([0-9a-f]{64})(\.|$)')
+
+
+def upload_path(relative_path):
+    folder = current_app.config['UPLOAD_FOLDER']
+    path = safe_join(folder, relative_path)
+    if path is None:
+        raise NotFound()
+    if not os.path.isabs(path):
+        path = os.path.join(current_app.root_path, path)
+    if not os.path.isfile(path):
+        raise NotFound()
+    return path
+
+
+def validators(relative_path, stat):
+    """(strong ETag, Cache-Control) of an upload"""
+    blob = _BLOB_NAME.match(relative_path)
+    if blob:
+        return blob.group(1), IMMUTABLE
+    return f'{stat.st_size:x}-{stat.st_mtime_ns:x}', REVALIDATE
+
+
+def requested_range(etag, size):
+    """(start, stop) of a single satisfiable Range, None for the whole file.
+
+    Raises ValueError when the range cannot be satisfied.
+    """
+    ranges = request.range
+    if ranges is None or len(ranges.ranges) != 1:
+        return None
+    # If-Range: only honour the range if the client still has this version
+    if_range = request.if_range
+    if if_range.etag is not None and if_range.etag != etag:
+        return None
+    if if_range.date is not None:
+        return None
+    bounds = ranges.range_for_length(size)
+    if bounds is None:
+        raise ValueError(f'Range not satisfiable for {size} bytes')
+    return bounds
+
+
+def read_range(file, length):
+    """Iterate length bytes of file from its current position"""
+    try:
+        while length > 0:
+            chunk = file.read(min(BLOCK_SIZE, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+    finally:
+        file.close()
+
+
+def send_upload(relative_path):
+    """Response for a file in the upload folder (GET and HEAD)"""
+    path = upload_path(relative_path)
+    stat = os.stat(path)
+    etag, cache_control = validators(relative_path, stat)
+    response = Response(mimetype=mimetypes.guess_type(path)[0] or 'application/octet-stream')
+    response.set_etag(etag)
+    response.last_modified = int(stat.st_mtime)
+    response.headers['Cache-Control'] = cache_control
+    response.accept_ranges = 'bytes'
+
+    if not is_resource_modified(request.environ, etag, last_modified=response.last_modified):
+        response.status_code = 304
+        return response
+
+    if ACCEL_REDIRECT:
+        # nginx serves the body, ranges included; only headers go back
+        response.headers['X-Accel-Redirect'] = ACCEL_REDIRECT.rstrip('/') + '/' + relative_path.lstrip('/')
+        return response
+
+    size = stat.st_size
+    try:
+        bounds = requested_range(etag, size)
+    except ValueError:
+        response.status_code = 416
+        response.headers['Content-Range'] = f'bytes */{size}'
+        return response
+    start, stop = bounds or (0, size)
+    if bounds:
+        response.status_code = 206
+        response.headers['Content-Range'] = f'bytes {start}-{stop - 1}/{size}'
+    response.content_length = stop - start
+    if request.method == 'HEAD':
+        return response
+
+    file = open(path, 'rb')
+    file.seek(start)
+    file_wrapper = request.environ.get('wsgi.file_wrapper')
+    if file_wrapper is not None:
+        # The server stops at Content-Length (gunicorn uses sendfile())
+        response.response = file_wrapper(file, BLOCK_SIZE)
+    else:
+        response.response = read_range(file, stop - start)
+    response.direct_passthrough = True
+    return response
@@ -0,0 +1,290 @@
+"""
+Database-backed background job queue.
+
+Jobs are rows in the jobs table, so they survive worker restarts. Each
+process runs a fixed pool of JOB_WORKERS threads that claim due jobs with
+a conditional UPDATE (safe across processes), run the handler registered
+for the job's kind and record the outcome.
+
+- A claimed job is locked for JOB_VISIBILITY_TIMEOUT seconds. If its worker
+  dies, the lock expires and another worker picks the job up again.
+  Handlers that can run longer call heartbeat() to extend the lock.
+- A failed run is retried with exponential backoff until max_attempts, then
+  the handler's on_failure callback gets the last error.
+- enqueue() raises QueueFull once JOB_QUEUE_LIMIT jobs are waiting, so
+  callers can push back (the Q&A route answers 429).
+- At startup each handler's recover callback can requeue work that was
+  lost before the queue existed or never made it into a job.
+
+Handlers take the job payload (a JSON dict) and run inside an app context.
+They may run more than once and must be idempotent.
+"""
+from extensions import db
+from models import Job
+from sqlalchemy import select, update, delete, func, or_, and_, event
+from sqlalchemy.orm import Session
+from datetime import datetime, timedelta
+import json
+import os
+import random
+import threading
+import time
+
+WORKERS = int(os.getenv('JOB_WORKERS', 2))
+QUEUE_LIMIT = int(os.getenv('JOB_QUEUE_LIMIT', 200))
+VISIBILITY_TIMEOUT = int(os.getenv('JOB_VISIBILITY_TIMEOUT', 300))
+POLL_INTERVAL = 2.0
+# Locks are extended well before they expire
+HEARTBEAT_INTERVAL = VISIBILITY_TIMEOUT / 4
+BACKOFF_BASE = 5  # seconds before the first retry
+BACKOFF_MAX = 600
+# Finished jobs are kept this long for inspection, then deleted
+RETENTION = timedelta(days=1)
+
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+
+_handlers = {}
+_wakeup = threading.Event()
+_running = threading.local()  # job this worker thread is running
+# Process whose worker threads are running. Threads do not survive fork, so
+# a forked server worker must not trust state inherited from its parent.
+_worker_pid = None
+_start_lock = threading.Lock()
+# Process that imported the app (and created its database engine)
+_import_pid = os.getpid()
+_last_purge = datetime.min
+
+
+class QueueFull(Exception):
+    pass
+
+
+class LockLost(Exception):
+    """The running job's lock expired and another worker took the job over"""
+
+
+def register(kind, run, on_failure=None, recover=None):
+    """Register the handler for a kind of job.
+
+    run(payload) does the work. on_failure(payload, error) is called once a
+    job has used up its attempts. recover() runs at worker startup.
+    """
+    _handlers[kind] = {'run': run, 'on_failure': on_failure, 'recover': recover}
+
+
+def pending_count():
+    return db.session.execute(
+        select(func.count(Job.id)).where(Job.status.in_([QUEUED, RUNNING]))
+    ).scalar()
+
+
+def active_keys(keys):
+    """The subset of keys that already have a queued or running job"""
+    if not keys:
+        return set()
+    return set(db.session.execute(
+        select(Job.key).where(Job.key.in_(keys), Job.status.in_([QUEUED, RUNNING]))
+    ).scalars())
+
+
+def enqueue(kind, payload=None, key=None, max_attempts=5, check_limit=True, run_at=None):
+    """Add a job in the current transaction; the caller commits.
+
+    The job is due at run_at (UTC, default now). Raises QueueFull when
+    check_limit is set and the queue is at capacity.
+    """
+    if check_limit and pending_count() >= QUEUE_LIMIT:
+        raise QueueFull(f"Job queue is full ({QUEUE_LIMIT} pending jobs)")
+    job = Job(kind=kind, key=key, payload=json.dumps(payload or {}), status=QUEUED,
+              max_attempts=max_attempts, run_at=run_at or datetime.utcnow())
+    db.session.add(job)
+    db.session.info['jobs_enqueued'] = True
+    return job
+
+
+@event.listens_for(Session, 'after_commit')
+def _wake_workers(session):
+    """Wake idle workers once enqueued jobs are committed and visible"""
+    if session.info.pop('jobs_enqueued', False):
+        _wakeup.set()
+
+
+def backoff(attempts):
+    """Delay before retry number `attempts`, with jitter so retries spread out"""
+    delay = min(BACKOFF_MAX, BACKOFF_BASE * 2 ** (attempts - 1))
+    return timedelta(seconds=delay * random.uniform(0.5, 1.0))
+
+
+def claim_next():
+    """Atomically take the next due job, or return None"""
+    now = datetime.utcnow()
+    claimable = or_(
+        and_(Job.status == QUEUED, Job.run_at <= now),
+        # Lock expired: the worker running it died or hung
+        and_(Job.status == RUNNING, Job.locked_until < now)
+    )
+    job_id = db.session.execute(
+        select(Job.id).where(claimable).order_by(Job.run_at, Job.id).limit(1)
+    ).scalar()
+    if job_id is None:
+        return None
+
+    claimed = db.session.execute(
+        update(Job).where(Job.id == job_id, claimable).values(
+            status=RUNNING,
+            attempts=Job.attempts + 1,
+            locked_until=now + timedelta(seconds=VISIBILITY_TIMEOUT),
+            updated_at=now
+        )
+    ).rowcount
+    db.session.commit()
+    # Another worker won the race; the caller just asks again
+    return db.session.get(Job, job_id) if claimed else None
+
+
+def heartbeat(force=False):
+    """Extend the lock of the job running in this thread.
+
+    Handlers that may run longer than JOB_VISIBILITY_TIMEOUT call this
+    regularly; it only writes every HEARTBEAT_INTERVAL seconds unless
+    forced, e.g. right before publishing results. Raises LockLost when the
+    lock already expired and the job was claimed again, in which case the
+    handler must stop without publishing its results.
+    """
+    job = getattr(_running, 'job', None)
+    if job is None or (not force and time.monotonic() - job['beat'] < HEARTBEAT_INTERVAL):
+        return
+    now = datetime.utcnow()
+    # On its own connection, so the handler's transaction is left alone
+    with db.engine.begin() as connection:
+        extended = connection.execute(
+            update(Job).where(Job.id == job['id'], Job.status == RUNNING, Job.attempts == job['attempts'])
+            .values(locked_until=now + timedelta(seconds=VISIBILITY_TIMEOUT), updated_at=now)
+        ).rowcount
+    if not extended:
+        raise LockLost(f"Job {job['id']} was taken over by another worker")
+    job['beat'] = time.monotonic()
+
+
+def run_job(job):
+    job_id = job.id
+    attempts = job.attempts
+    spec = _handlers.get(job.kind)
+    payload = json.loads(job.payload)
+    _running.job = {'id': job_id, 'attempts': attempts, 'beat': time.monotonic()}
+    try:
+        if spec is None:
+            raise LookupError(f"No handler registered for job kind '{job.kind}'")
+        if job.attempts > job.max_attempts:
+            raise RuntimeError('Job exceeded its attempts (worker lost while running it)')
+        spec['run'](payload)
+    except LockLost as e:
+        # The job now belongs to the worker that reclaimed it
+        print(f"Job {job_id} ({job.kind}) attempt {attempts} abandoned: {e}")
+        db.session.rollback()
+        return
+    except Exception as e:
+        error = f"{type(e).__name__}: {e}"
+        print(f"Job {job_id} ({job.kind}) attempt {job.attempts} failed: {error}")
+        db.session.rollback()
+        job = db.session.get(Job, job_id)
+        job.last_error = error
+        job.locked_until = None
+        if spec is not None and job.attempts < job.max_attempts:
+            job.status = QUEUED
+            job.run_at = datetime.utcnow() + backoff(job.attempts)
+            db.session.commit()
+            return
+
+        job.status = FAILED
+        db.session.commit()
+        if spec is not None and spec['on_failure']:
+            spec['on_failure'](payload, error)
+        return
+    finally:
+        _running.job = None
+
+    db.session.execute(
+        update(Job).where(Job.id == job_id, Job.attempts == attempts)
+        .values(status=DONE, locked_until=None, last_error=None)
+    )
+    db.session.commit()
+
+
+def run_next():
+    """Run one due job if there is one; returns whether a job ran"""
+    job = claim_next()
+    if job is None:
+        return False
+    run_job(job)
+    return True
+
+
+def purge_finished():
+    global _last_purge
+    now = datetime.utcnow()
+    if now - _last_purge < timedelta(hours=1):
+        return
+    _last_purge = now
+    db.session.execute(delete(Job).where(Job.status.in_([DONE, FAILED]), Job.updated_at < now - RETENTION))
+    db.session.commit()
+
+
+def work(app):
+    """Worker thread loop"""
+    while True:
+        ran = False
+        try:
+            with app.app_context():
+                ran = run_next()
+                if not ran:
+                    purge_finished()
+        except Exception as e:
+            print(f"Job worker error: {e}")
+        if not ran:
+            _wakeup.wait(POLL_INTERVAL)
+            _wakeup.clear()
+
+
+def recover():
+    """Let handlers requeue work lost before it reached the queue"""
+    for kind, spec in _handlers.items():
+        if spec['recover']:
+            try:
+                spec['recover']()
+                db.session.commit()
+            except Exception as e:
+                print(f"Error recovering {kind} jobs: {e}")
+                db.session.rollback()
+
+
+def start_workers(app):
+    """Start this process's worker threads (JOB_WORKERS=0 disables them).
+
+    Cheap after the first call, so it can also run before every request.
+    Forking servers (gunicorn) import the app in the master, so each forked
+    worker starts its own threads from the post_fork hook in gunicorn.conf.py,
+    after dropping the database connections it inherited from the master.
+    """
+    global _worker_pid
+    if _worker_pid == os.getpid() or WORKERS <= 0:
+        return
+    with _start_lock:
+        if _worker_pid == os.getpid():
+            return
+        _worker_pid = os.getpid()
+
+    with app.app_context():
+        if os.getpid() != _import_pid:
+            # Pooled connections are shared with the parent's socket; leave
+            # them open for the parent and start a fresh pool here
+            db.engine.dispose(close=False)
+        recover()
+    for number in range(WORKERS):
+        thread = threading.Thread(target=work, args=(app,), name=f'job-worker-{number}')
+        thread.daemon = True
+        thread.start()
+    print(f"Started {WORKERS} job workers in process {os.getpid()}")
@@ -0,0 +1,139 @@
+"""
+Process-wide OpenAI client.
+
+One SDK client is shared by every route and job worker in the process, so
+HTTP connections (and their TLS sessions) are kept alive and reused instead
+of being set up for each call. Every call has explicit connect/read
+timeouts that fit inside the gunicorn worker timeout. A semaphore caps
+concurrent upstream calls; callers that cannot get a slot in time get
+AIBusy instead of queueing until the worker is killed.
+
+Settings (environment):
+    OPENAI_API_KEY          required; AI features are off without it
+    OPENAI_BASE_URL         alternative endpoint (proxy, local stub server)
+    OPENAI_CONNECT_TIMEOUT  seconds (default: 5)
+    OPENAI_READ_TIMEOUT     seconds (default: 45)
+    OPENAI_MAX_RETRIES      SDK retries on connection errors/5xx (default: 1)
+    OPENAI_MAX_CONCURRENCY  concurrent calls per process (default: 8)
+    OPENAI_QUEUE_TIMEOUT    seconds to wait for a free slot (default: 10)
+"""
+from contextlib import contextmanager
+import os
+import threading
+
+CONNECT_TIMEOUT = float(os.getenv('OPENAI_CONNECT_TIMEOUT', 5))
+READ_TIMEOUT = float(os.getenv('OPENAI_READ_TIMEOUT', 45))
+MAX_RETRIES = int(os.getenv('OPENAI_MAX_RETRIES', 1))
+MAX_CONCURRENCY = int(os.getenv('OPENAI_MAX_CONCURRENCY', 8))
+QUEUE_TIMEOUT = float(os.getenv('OPENAI_QUEUE_TIMEOUT', 10))
+
+_client = None
+_client_lock = threading.Lock()
+_slots = threading.BoundedSemaphore(MAX_CONCURRENCY)
+
+
+class AIBusy(Exception):
+    """All upstream slots stayed taken for OPENAI_QUEUE_TIMEOUT seconds"""
+
+
+class AIClient:
+    """The shared SDK client plus the concurrency limit around its calls"""
+
+    def __init__(self, api_key, base_url=None):
+        from openai import OpenAI, DefaultHttpxClient, Timeout
+        timeout = Timeout(READ_TIMEOUT, connect=CONNECT_TIMEOUT)
+        self.api_key = api_key
+        self.base_url = base_url
+        self.sdk = OpenAI(
+            api_key=api_key,
+            base_url=base_url,
+            timeout=timeout,
+            max_retries=MAX_RETRIES,
+            http_client=DefaultHttpxClient(timeout=timeout)
+        )
+
+    def chat(self, **kwargs):
+        """chat.completions.create() within the concurrency limit"""
+        with upstream_slot():
+            return self.sdk.chat.completions.create(**kwargs)
+
+    def chat_stream(self, **kwargs):
+        """Start a streamed completion; iterate the result for text deltas"""
+        return ChatStream(self.sdk, kwargs)
+
+    def close(self):
+        self.sdk.close()
+
+
+class ChatStream:
+    """A streamed completion that holds an upstream slot until closed.
+
+    The request is sent (and AIBusy or API errors raised) on construction,
+    so callers can still answer with an error status before streaming.
+    Closing early, e.g. when the browser disconnects, stops the upstream
+    generation.
+    """
+
+    def __init__(self, sdk, params):
+        if not _slots.acquire(timeout=QUEUE_TIMEOUT):
+            raise AIBusy('AI service is busy, please retry shortly')
+        try:
+            self._stream = sdk.chat.completions.create(stream=True, **params)
+        except Exception:
+            _slots.release()
+            raise
+        self._closed = False
+
+    def __iter__(self):
+        for chunk in self._stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+
+    def close(self):
+        if not self._closed:
+            self._closed = True
+            try:
+                self._stream.close()
+            finally:
+                _slots.release()
+
+
+@contextmanager
+def upstream_slot():
+    if not _slots.acquire(timeout=QUEUE_TIMEOUT):
+        raise AIBusy('AI service is busy, please retry shortly')
+    try:
+        yield
+    finally:
+        _slots.release()
+
+
+def get_openai_client():
+    """The shared client, or None when no API key is configured"""
+    global _client
+    api_key = os.getenv('OPENAI_API_KEY')
+    if not api_key:
+        return None
+    base_url = os.getenv('OPENAI_BASE_URL') or None
+
+    client = _client
+    if client is not None and client.api_key == api_key and client.base_url == base_url:
+        return client
+    with _client_lock:
+        # Rebuilt only when the key or endpoint changed (e.g. after setup_env.py)
+        if _client is None or _client.api_key != api_key or _client.base_url != base_url:
+            try:
+                _client = AIClient(api_key, base_url)
+            except Exception as e:
+                print(f"Error initializing OpenAI client: {e}")
+                return None
+        return _client
+
+
+def reset_client():
+    """Close the shared client; the next call builds a new one"""
+    global _client
+    with _client_lock:
+        if _client is not None:
+            _client.close()
+        _client = None
@@ -0,0 +1,346 @@
+"""
+Pre-rendered PDF page thumbnails and zoom tiles.
+
+Each uploaded PDF is rasterized once by a render_pdf_pages job queued with
+the upload, so the annotation viewer can show a drawing without downloading
+and rendering the whole PDF in the browser. Pages are rendered with PDFium
+in the shared PDF worker pool (services/pdf_extraction.py), one page per
+task with page 1 first, and cut into a tile pyramid with Pillow:
+
+    tiles/<file_id>/<attempt>/<page>/thumb.png
+    tiles/<file_id>/<attempt>/<page>/<level>/<x>_<y>.png
+
+under the upload folder. Level n is the page at PAGE_TILE_SCALES[n] pixels
+per PDF point (1 = 72 dpi), cut into PAGE_TILE_SIZE square tiles; edge
+tiles are smaller. Each page is rendered once at its largest level and the
+smaller levels are downsampled from it. Levels over PAGE_TILE_MAX_PIXELS
+are skipped for that page (large sheets only get the lower zoom levels).
+
+Every run of the job renders into its own attempt directory, and
+tiles/<file_id>/current names the one being shown; it is switched with an
+atomic rename. A retried job therefore never deletes or overwrites tiles
+that an earlier run, possibly still going after losing its job lock, is
+writing. Long renders keep their job lock with jobs.heartbeat().
+
+A finished attempt is stored through the storage backend, pointer last.
+Instances that did not render it fetch its files into their upload folder
+as they are requested; a file whose tiles are gone from storage altogether
+is rendered again.
+
+A page directory is moved into place only when it is complete, and
+manifest.json (page sizes and levels) is rewritten as pages finish, so the
+viewer can open page 1 while the rest is still rendering. A file's tiles
+never change once written, which is what lets them be served as immutable.
+
+PDFium comes from the optional pypdfium2 package; without it nothing is
+scheduled and the viewer keeps showing the PDF itself.
+
+Settings (environment):
+    PAGE_TILE_SCALES      zoom levels, pixels per point (default: 0.5,1,2,4)
+    PAGE_TILE_SIZE        tile edge in pixels (default: 256)
+    PAGE_TILE_MAX_PIXELS  largest rendered page in pixels (default: 40000000)
+    PAGE_THUMB_WIDTH      thumbnail width in pixels (default: 200)
+    PAGE_RENDER_TIMEOUT   seconds allowed per document (default: 600)
+"""
+from concurrent.futures import wait, FIRST_COMPLETED
+from concurrent.futures.process import BrokenProcessPool
+from flask import current_app
+from extensions import db
+from models import ProjectFile
+from sqlalchemy import select, update
+from services import etags, jobs, pdf_extraction, storage
+from PIL import Image
+import json
+import math
+import os
+import shutil
+import time
+import uuid
+
+try:
+    import pypdfium2 as pdfium
+except ImportError:
+    pdfium = None
+
+SCALES = sorted(float(scale) for scale in os.getenv('PAGE_TILE_SCALES', '0.5,1,2,4').split(','))
+TILE_SIZE = int(os.getenv('PAGE_TILE_SIZE', 256))
+MAX_PIXELS = int(os.getenv('PAGE_TILE_MAX_PIXELS', 40000000))
+THUMB_WIDTH = int(os.getenv('PAGE_THUMB_WIDTH', 200))
+TIMEOUT = float(os.getenv('PAGE_RENDER_TIMEOUT', 600))
+
+PENDING = 'pending'
+READY = 'ready'
+FAILED = 'failed'
+
+MANIFEST = 'manifest.json'
+CURRENT = 'current'
+
+
+class RenderTimeout(Exception):
+    pass
+
+
+def available():
+    return pdfium is not None
+
+
+def cache_key(file_id):
+    return f'tiles/{file_id}'
+
+
+def cache_dir(file_id):
+    return os.path.join(current_app.config['UPLOAD_FOLDER'], cache_key(file_id))
+
+
+def current_attempt(file_id):
+    """Name of the render attempt being shown, or None before any"""
+    storage.backend().fetch(f'{cache_key(file_id)}/{CURRENT}')
+    try:
+        with open(os.path.join(cache_dir(file_id), CURRENT)) as file:
+            return file.read().strip()
+    except OSError:
+        return None
+
+
+def current_key(file_id):
+    attempt = current_attempt(file_id)
+    return f'{cache_key(file_id)}/{attempt}' if attempt else cache_key(file_id)
+
+
+def current_dir(file_id):
+    """Directory of the render attempt being shown (the cache dir before any)"""
+    return os.path.join(current_app.config['UPLOAD_FOLDER'], current_key(file_id))
+
+
+def stored_path(file_id, *parts):
+    """Local path of a file of the attempt being shown, fetched from storage if needed"""
+    key = '/'.join([current_key(file_id)] + [str(part) for part in parts])
+    storage.backend().fetch(key)
+    return os.path.join(current_app.config['UPLOAD_FOLDER'], key)
+
+
+def set_current(file_id, attempt):
+    partial = os.path.join(cache_dir(file_id), f'{CURRENT}.{attempt}.partial')
+    with open(partial, 'w') as file:
+        file.write(attempt)
+    os.replace(partial, os.path.join(cache_dir(file_id), CURRENT))
+
+
+def thumbnail_path(file_id, page):
+    return stored_path(file_id, page, 'thumb.png')
+
+
+def tile_path(file_id, page, level, x, y):
+    return stored_path(file_id, page, level, f'{x}_{y}.png')
+
+
+def schedule_render(project_file):
+    """Queue rendering of a new PDF in the current transaction (flush first)"""
+    if project_file.file_type != 'pdf' or not available():
+        return
+    try:
+        jobs.enqueue('render_pdf_pages', {'file_id': project_file.id}, key=f'tiles:{project_file.id}')
+        project_file.tile_status = PENDING
+    except jobs.QueueFull:
+        project_file.tile_status = None
+
+
+def requeue_missing(file_id):
+    """Mark a ready file whose tiles were found missing as never rendered (in the current transaction)"""
+    # Only the first request to notice flips the status and queues the job
+    return db.session.execute(
+        update(ProjectFile)
+        .where(ProjectFile.id == file_id, ProjectFile.tile_status == READY)
+        .values(tile_status=None)
+    ).rowcount > 0
+
+
+def write_tiles(image, directory, tile_size):
+    os.makedirs(directory, exist_ok=True)
+    for y in range(math.ceil(image.height / tile_size)):
+        for x in range(math.ceil(image.width / tile_size)):
+            box = (x * tile_size, y * tile_size,
+                   min((x + 1) * tile_size, image.width), min((y + 1) * tile_size, image.height))
+            image.crop(box).save(os.path.join(directory, f'{x}_{y}.png'))
+
+
+def render_page(path, out_dir, page, scales, tile_size, thumb_width, max_pixels):
+    """Thumbnail and tiles of one page (1-based); runs inside a worker process.
+
+    Returns the page entry of the manifest.
+    """
+    document = pdfium.PdfDocument(path)
+    try:
+        pdf_page = document[page - 1]
+        width, height = pdf_page.get_size()
+        fitting = [scale for scale in scales if width * height * scale * scale <= max_pixels] or scales[:1]
+        image = pdf_page.render(scale=fitting[-1]).to_pil().convert('RGB')
+        pdf_page.close()
+    finally:
+        document.close()
+
+    # The rendered size accounts for page rotation
+    width, height = image.width / fitting[-1], image.height / fitting[-1]
+    partial = os.path.join(out_dir, f'{page}.partial')
+    shutil.rmtree(partial, ignore_errors=True)
+    levels = []
+    for scale in reversed(fitting):
+        size = (max(1, round(width * scale)), max(1, round(height * scale)))
+        if image.size != size:
+            image = image.resize(size, Image.LANCZOS)
+        write_tiles(image, os.path.join(partial, str(scales.index(scale))), tile_size)
+        levels.append({'level': scales.index(scale), 'scale': scale, 'width': size[0], 'height': size[1]})
+
+    image.resize((thumb_width, max(1, round(thumb_width * height / width))), Image.LANCZOS) \
+        .save(os.path.join(partial, 'thumb.png'))
+    os.replace(partial, os.path.join(out_dir, str(page)))
+    return {'page': page, 'width': round(width, 2), 'height': round(height, 2), 'levels': levels[::-1]}
+
+
+def write_manifest(out_dir, page_count, pages):
+    manifest = {
+        'page_count': page_count,
+        'tile_size': TILE_SIZE,
+        'scales': SCALES,
+        'pages': sorted(pages, key=lambda entry: entry['page'])
+    }
+    partial = os.path.join(out_dir, MANIFEST + '.partial')
+    with open(partial, 'w') as file:
+        json.dump(manifest, file)
+    os.replace(partial, os.path.join(out_dir, MANIFEST))
+
+
+def read_manifest(file_id):
+    try:
+        with open(stored_path(file_id, MANIFEST)) as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return None
+
+
+def render_file(file_id):
+    """Render the pages of one uploaded PDF; runs as a job"""
+    project_file = db.session.get(ProjectFile, file_id)
+    if project_file is None or project_file.tile_status == READY:
+        return
+
+    # A retried job starts over in a directory of its own
+    attempt = uuid.uuid4().hex[:12]
+    out_dir = os.path.join(cache_dir(file_id), attempt)
+    try:
+        if not copy_from_twin(project_file, out_dir):
+            with storage.backend().local_path(project_file.file_path) as path:
+                page_count = min(pdf_extraction.page_count(path), pdf_extraction.MAX_PAGES)
+                os.makedirs(out_dir)
+                write_manifest(out_dir, page_count, [])
+                # Show this attempt's pages as they finish
+                jobs.heartbeat(force=True)
+                set_current(file_id, attempt)
+                render_pages(path, out_dir, page_count)
+        jobs.heartbeat(force=True)
+    except jobs.LockLost:
+        shutil.rmtree(out_dir, ignore_errors=True)
+        raise
+
+    # Other instances follow the pointer, so it is stored after the tiles
+    storage.backend().put_tree(f'{cache_key(file_id)}/{attempt}')
+    set_current(file_id, attempt)
+    storage.backend().put_tree(f'{cache_key(file_id)}/{CURRENT}')
+    remove_attempts(file_id, keep=attempt)
+    project_file.tile_status = READY
+    # tile_status is part of the project's representation
+    etags.bump_project_version(project_file.project_id)
+    db.session.commit()
+
+
+def render_pages(path, out_dir, page_count):
+    """Render every page in the worker pool, updating the manifest as pages finish"""
+    pool = pdf_extraction.get_pool()
+    # Submitted in page order, so page 1 is the first one a worker picks up
+    waiting = {pool.submit(render_page, path, out_dir, page, SCALES, TILE_SIZE, THUMB_WIDTH, MAX_PIXELS)
+               for page in range(1, page_count + 1)}
+    deadline = time.monotonic() + TIMEOUT
+    pages = []
+    try:
+        while waiting:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                # Pages still rendering may never finish; free their workers
+                pdf_extraction.reset_pool(pool, terminate=True)
+                raise RenderTimeout(f"Page rendering did not finish within {TIMEOUT}s")
+            # Wake up in time to keep the job's lock while pages are slow
+            done, waiting = wait(waiting, timeout=min(remaining, jobs.HEARTBEAT_INTERVAL),
+                                 return_when=FIRST_COMPLETED)
+            jobs.heartbeat()
+            if done:
+                pages.extend(future.result() for future in done)
+                write_manifest(out_dir, page_count, pages)
+    except BrokenProcessPool:
+        pdf_extraction.reset_pool(pool)
+        raise
+    finally:
+        for future in waiting:
+            future.cancel()
+
+
+def copy_from_twin(project_file, out_dir):
+    """Reuse the tiles of an already rendered file with the same content"""
+    if not project_file.blob_id:
+        return False
+    twin_id = db.session.execute(
+        select(ProjectFile.id)
+        .where(ProjectFile.blob_id == project_file.blob_id,
+               ProjectFile.id != project_file.id,
+               ProjectFile.tile_status == READY)
+        .limit(1)
+    ).scalar()
+    if twin_id is None or not storage.backend().fetch_tree(current_key(twin_id)):
+        return False
+    if not os.path.isfile(os.path.join(current_dir(twin_id), MANIFEST)):
+        return False
+    shutil.copytree(current_dir(twin_id), out_dir)
+    return True
+
+
+def render_failed(payload, error):
+    project_file = db.session.get(ProjectFile, payload['file_id'])
+    if project_file is not None:
+        project_file.tile_status = FAILED
+        etags.bump_project_version(project_file.project_id)
+        db.session.commit()
+
+
+def page_manifest(project_file):
+    """Rendered pages of a PDF so far; queues files that were never rendered"""
+    if project_file.tile_status == READY and available() and read_manifest(project_file.id) is None:
+        # Rendered before, but the tiles are gone from storage
+        requeue_missing(project_file.id)
+        db.session.refresh(project_file)
+    if project_file.tile_status is None and available():
+        schedule_render(project_file)
+        etags.bump_project_version(project_file.project_id)
+        db.session.commit()
+    manifest = read_manifest(project_file.id) if project_file.tile_status in (PENDING, READY) else None
+    return dict(manifest or {'page_count': None, 'tile_size': TILE_SIZE, 'scales': SCALES, 'pages': []},
+                status=project_file.tile_status)
+
+
+def remove_attempts(file_id, keep):
+    """Delete what earlier render attempts of a file left behind"""
+    for name in os.listdir(cache_dir(file_id)):
+        path = os.path.join(cache_dir(file_id), name)
+        if name in (keep, CURRENT):
+            continue
+        if os.path.isdir(path):
+            storage.backend().delete_tree(f'{cache_key(file_id)}/{name}')
+        else:
+            os.remove(path)
+
+
+def remove_caches(file_ids):
+    for file_id in file_ids:
+        storage.backend().delete_tree(cache_key(file_id))
+
+
+jobs.register('render_pdf_pages', lambda payload: render_file(payload['file_id']),
+              on_failure=render_failed)
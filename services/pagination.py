@@ -0,0 +1,89 @@
+"""
+Keyset (cursor) pagination helpers for the listing endpoints.
+
+Listings are ordered by (created_at, id) and each page continues strictly
+after the last row of the previous one, so the database walks the index
+instead of counting past an OFFSET. The cursor handed to clients is an
+opaque, URL-safe token wrapping that last (created_at, id) pair.
+"""
+from flask import jsonify
+from sqlalchemy import and_, or_
+from datetime import datetime
+import base64
+import json
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 500
+
+
+class PaginationError(ValueError):
+    """Raised when a client sends an invalid limit or cursor"""
+
+
+def encode_cursor(created_at, row_id):
+    raw = json.dumps([created_at.isoformat(), row_id]).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor):
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        created_at, row_id = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+        return datetime.fromisoformat(created_at), int(row_id)
+    except Exception:
+        raise PaginationError('Invalid cursor')
+
+
+def parse_page_args(args):
+    """Read limit/cursor from the query string.
+    
+    Returns (None, None) when the client did not ask for paging, so the
+    endpoints keep returning the plain array older clients expect.
+    """
+    if 'limit' not in args and 'cursor' not in args:
+        return None, None
+    
+    try:
+        limit = int(args.get('limit', DEFAULT_PAGE_SIZE))
+    except (TypeError, ValueError):
+        raise PaginationError('limit must be an integer')
+    if limit < 1:
+        raise PaginationError('limit must be positive')
+    limit = min(limit, MAX_PAGE_SIZE)
+    
+    cursor = args.get('cursor') or None
+    return limit, decode_cursor(cursor) if cursor else None
+
+
+def keyset_page(query, created_col, id_col, limit=None, cursor=None):
+    """Apply stable (created_at, id) ordering and an optional keyset window.
+    
+    Works for ORM entities and column rows alike, as long as the rows expose
+    the two key columns under their column names. Returns (rows, next_cursor).
+    """
+    query = query.order_by(created_col.asc(), id_col.asc())
+    
+    if cursor:
+        after_created, after_id = cursor
+        query = query.filter(or_(
+            created_col > after_created,
+            and_(created_col == after_created, id_col > after_id)
+        ))
+    
+    if limit is None:
+        return query.all(), None
+    
+    rows = query.limit(limit + 1).all()
+    if len(rows) <= limit:
+        return rows, None
+    
+    last = rows[limit - 1]
+    next_cursor = encode_cursor(getattr(last, created_col.key), getattr(last, id_col.key))
+    return rows[:limit], next_cursor
+
+
+def listing_response(items, limit, next_cursor):
+    """Plain array for unpaged requests, {items, next_cursor} envelope otherwise"""
+    if limit is None:
+        return jsonify(items), 200
+    return jsonify({'items': items, 'next_cursor': next_cursor}), 200
@@ -0,0 +1,122 @@
+"""
+Process-pool PDF text extraction.
+
+PyPDF2 is pure Python, so parsing a large drawing set inside a web worker
+holds the GIL and stalls every other request that worker serves. Here the
+document is split into page ranges that are extracted in parallel by a
+shared pool of worker processes and reassembled in page order.
+
+The workers are started from a forkserver rather than forked from the web
+worker: that process runs request and job threads, and a child forked while
+one of them holds a lock (logging, the database pool, PDFium) can deadlock
+on it. Workers re-import the main script, so scripts that use the pool
+directly need an `if __name__ == '__main__'` guard (gunicorn and
+start_server.py have one). A document that does not finish within its timeout has the pool's
+processes killed, so a PDF that hangs the parser cannot keep a worker busy
+for every later extraction and page render.
+
+Settings (environment):
+    PDF_EXTRACT_WORKERS   worker processes (default: CPU count)
+    PDF_EXTRACT_TIMEOUT   seconds allowed per document (default: 120)
+    PDF_MAX_PAGES         pages extracted at most per document (default: 500)
+"""
+from concurrent.futures import ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+import math
+import multiprocessing
+import os
+import threading
+import PyPDF2
+
+WORKERS = int(os.getenv('PDF_EXTRACT_WORKERS', os.cpu_count() or 1))
+TIMEOUT = float(os.getenv('PDF_EXTRACT_TIMEOUT', 120))
+MAX_PAGES = int(os.getenv('PDF_MAX_PAGES', 500))
+# Smaller ranges spread better across workers but each task reopens the PDF
+MIN_PAGES_PER_TASK = 8
+
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+
+
+class ExtractionTimeout(Exception):
+    pass
+
+
+def page_count(path):
+    with open(path, 'rb') as file:
+        return len(PyPDF2.PdfReader(file).pages)
+
+
+def extract_range(path, start, stop):
+    """Text of pages [start, stop) of a PDF; runs inside a worker process"""
+    with open(path, 'rb') as file:
+        pdf_reader = PyPDF2.PdfReader(file)
+        return [(pdf_reader.pages[page_num].extract_text() or '') for page_num in range(start, stop)]
+
+
+def page_ranges(num_pages, workers):
+    """Split pages into about one contiguous range per worker"""
+    size = max(MIN_PAGES_PER_TASK, math.ceil(num_pages / max(workers, 1)))
+    return [(start, min(start + size, num_pages)) for start in range(0, num_pages, size)]
+
+
+def get_pool():
+    global _pool, _pool_pid
+    with _pool_lock:
+        # A pool inherited across fork belongs to the parent and cannot be used
+        if _pool is None or _pool_pid != os.getpid():
+            _pool = ProcessPoolExecutor(max_workers=WORKERS, mp_context=multiprocessing.get_context('forkserver'))
+            _pool_pid = os.getpid()
+        return _pool
+
+
+def reset_pool(pool=None, terminate=False):
+    """Drop a pool (default: the current one) so the next call starts a fresh one.
+
+    Used when a worker died, and with terminate=True to kill workers stuck
+    on a document that timed out; tasks of other documents still on the
+    pool then fail with BrokenProcessPool and are retried by their jobs.
+    """
+    global _pool
+    with _pool_lock:
+        if pool is None:
+            pool = _pool
+        if pool is not None and _pool_pid == os.getpid():
+            if terminate:
+                for process in list((pool._processes or {}).values()):
+                    process.terminate()
+            pool.shutdown(wait=False, cancel_futures=True)
+        if _pool is pool:
+            _pool = None
+
+
+def extract_pages(path, max_pages=None, timeout=None):
+    """Return the text of each page of a PDF, in page order.
+
+    At most max_pages (default PDF_MAX_PAGES) pages are extracted. Raises
+    ExtractionTimeout if the whole document takes longer than timeout
+    seconds (default PDF_EXTRACT_TIMEOUT).
+    """
+    limit = MAX_PAGES if max_pages is None else min(max_pages, MAX_PAGES)
+    num_pages = min(page_count(path), limit)
+    if num_pages == 0:
+        return []
+
+    pool = get_pool()
+    futures = [pool.submit(extract_range, path, start, stop)
+               for start, stop in page_ranges(num_pages, WORKERS)]
+    done, not_done = wait(futures, timeout=TIMEOUT if timeout is None else timeout)
+    if not_done:
+        # Ranges still running may never finish; don't leave them holding workers
+        reset_pool(pool, terminate=True)
+        raise ExtractionTimeout(f"PDF extraction did not finish within {timeout or TIMEOUT}s")
+
+    pages = []
+    try:
+        for future in futures:
+            pages.extend(future.result())
+    except BrokenProcessPool:
+        reset_pool(pool)
+        raise
+    return pages
@@ -0,0 +1,119 @@
+"""
+Persisted PDF text extraction.
+
+Text is extracted once per uploaded PDF by an extract_pdf_text job queued
+with the upload, and stored per page in file_page_texts. The AI routes read
+from that store and only parse the PDF themselves while extraction has not
+finished yet (or for files uploaded before the store existed, which are
+then queued for extraction as well).
+"""
+from extensions import db
+from models import ProjectFile, FilePageText
+from sqlalchemy import delete, insert, select
+from services import etags, jobs, search, storage
+from services.pdf_extraction import extract_pages
+
+PENDING = 'pending'
+READY = 'ready'
+FAILED = 'failed'
+
+
+def schedule_extraction(project_file):
+    """Queue text extraction for a new PDF in the current transaction.
+
+    The file must have an id (flush first). When the job queue is full the
+    file is left unscheduled and gets queued the next time its text is read.
+    """
+    if project_file.file_type != 'pdf':
+        return
+    try:
+        jobs.enqueue('extract_pdf_text', {'file_id': project_file.id}, key=f'file:{project_file.id}')
+        project_file.text_status = PENDING
+    except jobs.QueueFull:
+        project_file.text_status = None
+
+
+def extract_file(file_id):
+    """Extract and store the text of one uploaded PDF; runs as a job"""
+    project_file = db.session.get(ProjectFile, file_id)
+    if project_file is None or project_file.text_status == READY:
+        return
+    
+    if not copy_from_twin(project_file):
+        with storage.backend().local_path(project_file.file_path) as path:
+            pages = extract_pages(path)
+        if pages:
+            db.session.execute(insert(FilePageText), [
+                {'file_id': file_id, 'page': number, 'text': text}
+                for number, text in enumerate(pages, start=1)
+            ])
+    search.index_file_pages(file_id)
+    project_file.text_status = READY
+    # text_status is part of the project's representation; revalidating
+    # clients must see the change
+    etags.bump_project_version(project_file.project_id)
+    db.session.commit()
+
+
+def extraction_failed(payload, error):
+    project_file = db.session.get(ProjectFile, payload['file_id'])
+    if project_file is not None:
+        project_file.text_status = FAILED
+        etags.bump_project_version(project_file.project_id)
+        db.session.commit()
+
+
+def copy_from_twin(project_file):
+    """Reuse the pages of an already extracted file with the same content"""
+    if not project_file.blob_id:
+        return False
+    twin_id = db.session.execute(
+        select(ProjectFile.id)
+        .where(ProjectFile.blob_id == project_file.blob_id,
+               ProjectFile.id != project_file.id,
+               ProjectFile.text_status == READY)
+        .limit(1)
+    ).scalar()
+    if twin_id is None:
+        return False
+    db.session.execute(insert(FilePageText).from_select(
+        ['file_id', 'page', 'text'],
+        select(db.literal(project_file.id), FilePageText.page, FilePageText.text)
+        .where(FilePageText.file_id == twin_id)
+    ))
+    return True
+
+
+def file_text(project_file, max_pages=10, max_chars=10000):
+    """Text of the first pages of a PDF, from the store when it is ready"""
+    if project_file.text_status == READY:
+        pages = db.session.execute(
+            select(FilePageText.text)
+            .where(FilePageText.file_id == project_file.id, FilePageText.page <= max_pages)
+            .order_by(FilePageText.page)
+        ).scalars().all()
+    else:
+        # Not extracted yet: parse what we need now, and queue files that
+        # predate the store so the next call finds them
+        if project_file.text_status is None:
+            schedule_extraction(project_file)
+            etags.bump_project_version(project_file.project_id)
+            db.session.commit()
+        try:
+            with storage.backend().local_path(project_file.file_path) as path:
+                pages = extract_pages(path, max_pages)
+        except Exception as e:
+            print(f"Error extracting PDF text: {e}")
+            return ""
+
+    return "".join(text + "\n\n" for text in pages)[:max_chars]
+
+
+def discard_files(file_ids):
+    if file_ids:
+        db.session.execute(delete(FilePageText).where(FilePageText.file_id.in_(file_ids)))
+        search.unindex_files(file_ids)
+
+
+jobs.register('extract_pdf_text', lambda payload: extract_file(payload['file_id']),
+              on_failure=extraction_failed)
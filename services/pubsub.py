@@ -0,0 +1,145 @@
+"""
+In-process publish/subscribe for pushing events to open streams.
+
+Streams subscribe to a channel and block on their own queue; publish()
+hands a message to every subscriber of the channel in this process.
+
+Events that happen in another gunicorn worker (or a job worker thread of
+another process) are picked up by a relay: one daemon thread per process
+that, only while this process has subscribers, calls a poll function every
+PUBSUB_POLL_INTERVAL seconds. The poll function reads an append-only event
+table past the cursor it keeps and publishes what it finds. That is the
+polling stand-in for a database notify channel (PostgreSQL LISTEN/NOTIFY):
+one cheap indexed query per process per interval, however many clients
+are listening, instead of every client re-fetching full listings.
+
+Settings (environment):
+    PUBSUB_POLL_INTERVAL    seconds between relay polls (default: 1)
+    PUBSUB_QUEUE_SIZE       messages buffered per subscriber (default: 100)
+"""
+import os
+import queue
+import threading
+
+POLL_INTERVAL = float(os.getenv('PUBSUB_POLL_INTERVAL', 1))
+QUEUE_SIZE = int(os.getenv('PUBSUB_QUEUE_SIZE', 100))
+
+_channels = {}  # channel -> set of Subscription
+_lock = threading.Lock()
+_relays = {}  # name -> Relay
+
+
+class Subscription:
+    """A subscriber's queue of messages on one channel.
+
+    A subscriber that falls QUEUE_SIZE messages behind is marked overflowed
+    and stops receiving; its stream should end so the client reconnects and
+    catches up from the event table.
+    """
+
+    def __init__(self, channel):
+        self.channel = channel
+        self.overflowed = False
+        self._queue = queue.Queue(maxsize=QUEUE_SIZE)
+
+    def put(self, message):
+        try:
+            self._queue.put_nowait(message)
+        except queue.Full:
+            self.overflowed = True
+
+    def get(self, timeout):
+        """The next message, or None after timeout seconds without one"""
+        try:
+            return self._queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def close(self):
+        unsubscribe(self)
+
+
+def subscribe(channel):
+    subscription = Subscription(channel)
+    with _lock:
+        _channels.setdefault(channel, set()).add(subscription)
+    for relay in list(_relays.values()):
+        relay.wake()
+    return subscription
+
+
+def unsubscribe(subscription):
+    with _lock:
+        subscribers = _channels.get(subscription.channel)
+        if subscribers is not None:
+            subscribers.discard(subscription)
+            if not subscribers:
+                del _channels[subscription.channel]
+
+
+def publish(channel, message):
+    """Deliver message to this process's subscribers of channel"""
+    with _lock:
+        subscribers = list(_channels.get(channel, ()))
+    for subscription in subscribers:
+        if not subscription.overflowed:
+            subscription.put(message)
+    return len(subscribers)
+
+
+def has_subscribers(prefix=''):
+    with _lock:
+        return any(channel.startswith(prefix) for channel in _channels)
+
+
+def subscribed_channels(prefix=''):
+    """Channels starting with prefix that this process has subscribers on"""
+    with _lock:
+        return {channel for channel in _channels if channel.startswith(prefix)}
+
+
+class Relay:
+    """Daemon thread that runs poll(cursor) -> cursor while anyone listens.
+
+    The cursor marks what was already published, in whatever form poll
+    keeps it. poll runs inside an app context and returns the new cursor;
+    errors are printed and the poll is retried next round.
+    """
+
+    def __init__(self, app, name, poll, prefix, cursor):
+        self.app = app
+        self.name = name
+        self.poll = poll
+        self.prefix = prefix
+        self.cursor = cursor
+        self._wakeup = threading.Event()
+
+    def wake(self):
+        self._wakeup.set()
+
+    def run(self):
+        while True:
+            if not has_subscribers(self.prefix):
+                # Idle until a stream subscribes
+                self._wakeup.wait()
+                self._wakeup.clear()
+                continue
+            try:
+                with self.app.app_context():
+                    self.cursor = self.poll(self.cursor)
+            except Exception as e:
+                print(f"Pub/sub relay {self.name} error: {e}")
+            self._wakeup.wait(POLL_INTERVAL)
+            self._wakeup.clear()
+
+
+def start_relay(app, name, poll, prefix, cursor):
+    """Start the named relay once per process; later calls are no-ops"""
+    with _lock:
+        if name in _relays:
+            return _relays[name]
+        relay = _relays[name] = Relay(app, name, poll, prefix, cursor)
+    thread = threading.Thread(target=relay.run, name=f'pubsub-relay-{name}')
+    thread.daemon = True
+    thread.start()
+    return relay
@@ -0,0 +1,195 @@
+"""
+Per-project retrieval over extracted PDF text.
+
+The AI prompts include the passages of a project's drawings and documents
+that are relevant to the question, rather than a fixed-length prefix of the
+first files. Stored page text (services/pdf_text.py) is cut into chunks of
+about RETRIEVAL_CHUNK_WORDS words, and each chunk is scored against the
+question with BM25. The best chunks are kept until RETRIEVAL_TOP_K chunks
+or RETRIEVAL_TOKEN_BUDGET (estimated) prompt tokens are reached.
+
+The index of a project is a SciPy sparse matrix (chunks x terms) holding
+the BM25 term weights, so scoring a question is one sparse matrix-vector
+product. Indexes are cached per process and rebuilt when the set of
+extracted files of the project changes; page text never changes once a
+file is extracted.
+
+Settings (environment):
+    RETRIEVAL_CHUNK_WORDS   words per chunk (default: 150)
+    RETRIEVAL_TOP_K         chunks per prompt at most (default: 8)
+    RETRIEVAL_TOKEN_BUDGET  estimated prompt tokens of excerpts (default: 1500)
+    RETRIEVAL_CACHE_SIZE    project indexes kept per process (default: 32)
+"""
+from collections import OrderedDict, namedtuple
+from extensions import db
+from models import ProjectFile, FilePageText
+from services import pdf_text
+from sqlalchemy import select
+from scipy import sparse
+import numpy as np
+import os
+import re
+import threading
+
+CHUNK_WORDS = int(os.getenv('RETRIEVAL_CHUNK_WORDS', 150))
+TOP_K = int(os.getenv('RETRIEVAL_TOP_K', 8))
+TOKEN_BUDGET = int(os.getenv('RETRIEVAL_TOKEN_BUDGET', 1500))
+CACHE_SIZE = int(os.getenv('RETRIEVAL_CACHE_SIZE', 32))
+# BM25 parameters (the usual defaults)
+K1 = 1.2
+B = 0.75
+# Rough size of an English token, for budgeting without a tokenizer
+CHARS_PER_TOKEN = 4
+# PDFs still waiting for extraction contribute their first pages
+PENDING_FILES = 3
+
+STOPWORDS = frozenset("""
+a an and are as at be but by for from has have how i in is it its of on or
+our should that the their there these this to was we what when where which
+who why will with would you your can do does any all about into than then
+""".split())
+
+Chunk = namedtuple('Chunk', 'file_id file_name page text')
+
+_indexes = OrderedDict()  # project_id -> (signature, ProjectIndex)
+_lock = threading.Lock()
+
+
+def tokenize(text):
+    return [word for word in re.findall(r'[a-z0-9]+', text.lower()) if word not in STOPWORDS]
+
+
+def estimate_tokens(text):
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def chunk_pages(pages):
+    """Split (file_id, file_name, page, text) rows into chunks, in document order"""
+    chunks = []
+    for file_id, file_name, page, text in pages:
+        words = text.split()
+        for start in range(0, len(words), CHUNK_WORDS):
+            chunks.append(Chunk(file_id, file_name, page, ' '.join(words[start:start + CHUNK_WORDS])))
+    return chunks
+
+
+class ProjectIndex:
+    """BM25 weights of a project's chunks as a sparse chunks x terms matrix"""
+
+    def __init__(self, chunks):
+        self.chunks = chunks
+        self.vocabulary = {}
+        rows, columns = [], []
+        for row, chunk in enumerate(chunks):
+            for term in tokenize(chunk.text):
+                rows.append(row)
+                columns.append(self.vocabulary.setdefault(term, len(self.vocabulary)))
+
+        shape = (len(chunks), len(self.vocabulary))
+        # Repeated (row, term) entries are summed into term frequencies
+        counts = sparse.csr_matrix((np.ones(len(rows), dtype=np.float32), (rows, columns)), shape=shape)
+        counts.sum_duplicates()
+
+        lengths = np.asarray(counts.sum(axis=1)).ravel()
+        average_length = lengths.mean() if len(chunks) else 1.0
+        document_frequency = np.bincount(counts.indices, minlength=shape[1])
+        idf = np.log1p((len(chunks) - document_frequency + 0.5) / (document_frequency + 0.5))
+
+        tf = counts.data
+        entry_rows = np.repeat(np.arange(shape[0]), np.diff(counts.indptr))
+        norm = K1 * (1 - B + B * lengths[entry_rows] / max(average_length, 1.0))
+        counts.data = (tf * (K1 + 1) / (tf + norm) * idf[counts.indices]).astype(np.float32)
+        self.weights = counts
+
+    def scores(self, query):
+        """BM25 score of every chunk for the query"""
+        query_vector = np.zeros(len(self.vocabulary), dtype=np.float32)
+        for term in tokenize(query):
+            column = self.vocabulary.get(term)
+            if column is not None:
+                query_vector[column] = 1.0
+        return self.weights @ query_vector
+
+    def top_chunks(self, query, top_k=TOP_K, budget=TOKEN_BUDGET):
+        """Best matching chunks within the budget, back in document order"""
+        if not self.chunks:
+            return []
+        scores = self.scores(query)
+        if not scores.any():
+            # Nothing matches: the opening chunk of each file gives an overview
+            order = [i for i, chunk in enumerate(self.chunks)
+                     if i == 0 or self.chunks[i - 1].file_id != chunk.file_id]
+        else:
+            order = [i for i in np.argsort(-scores, kind='stable') if scores[i] > 0]
+
+        chosen, used = [], 0
+        for i in order:
+            cost = estimate_tokens(self.chunks[i].text)
+            if used + cost > budget:
+                continue
+            chosen.append(i)
+            used += cost
+            if len(chosen) >= top_k:
+                break
+        return [self.chunks[i] for i in sorted(chosen)]
+
+
+def _ready_files(project_id):
+    return tuple(db.session.execute(
+        select(ProjectFile.id)
+        .where(ProjectFile.project_id == project_id, ProjectFile.text_status == pdf_text.READY)
+        .order_by(ProjectFile.id)
+    ).scalars())
+
+
+def project_index(project_id):
+    """The (cached) index of a project's extracted PDF text"""
+    signature = _ready_files(project_id)
+    with _lock:
+        cached = _indexes.get(project_id)
+        if cached and cached[0] == signature:
+            _indexes.move_to_end(project_id)
+            return cached[1]
+
+    pages = db.session.execute(
+        select(FilePageText.file_id, ProjectFile.name, FilePageText.page, FilePageText.text)
+        .join(ProjectFile, ProjectFile.id == FilePageText.file_id)
+        .where(FilePageText.file_id.in_(signature))
+        .order_by(FilePageText.file_id, FilePageText.page)
+    ).all() if signature else []
+    index = ProjectIndex(chunk_pages(pages))
+
+    with _lock:
+        _indexes[project_id] = (signature, index)
+        _indexes.move_to_end(project_id)
+        while len(_indexes) > CACHE_SIZE:
+            _indexes.popitem(last=False)
+    return index
+
+
+def excerpts(project, query, top_k=TOP_K, budget=TOKEN_BUDGET):
+    """Prompt text with the project's passages most relevant to query.
+
+    PDFs whose text is not extracted yet are not in the index; their first
+    pages fill what is left of the budget so new uploads are not ignored.
+    """
+    chunks = project_index(project.id).top_chunks(query, top_k, budget)
+    context = "".join(f"\n\nFile: {chunk.file_name} (page {chunk.page})\nContent:\n{chunk.text}\n"
+                      for chunk in chunks)
+
+    remaining = budget - sum(estimate_tokens(chunk.text) for chunk in chunks)
+    pending = [file for file in project.files
+               if file.file_type == 'pdf' and file.text_status in (None, pdf_text.PENDING)][:PENDING_FILES]
+    for file in pending:
+        if remaining <= 0:
+            break
+        text = pdf_text.file_text(file, max_chars=remaining * CHARS_PER_TOKEN // len(pending))
+        if text:
+            context += f"\n\nFile: {file.name}\nContent:\n{text}\n"
+            remaining -= estimate_tokens(text)
+    return context
+
+
+def clear_cache():
+    with _lock:
+        _indexes.clear()
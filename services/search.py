@@ -0,0 +1,255 @@
+"""
+Full-text search over project content.
+
+Everything searchable (project names and descriptions, questions and
+answers, discussion messages, annotation text and extracted PDF pages) is
+copied into search_documents, one row per item or PDF page. The write paths
+keep those rows current explicitly, like the spatial index, since several
+of them use bulk statements.
+
+The full-text index over search_documents is database specific and created
+by the migration:
+
+- SQLite: an external-content FTS5 table (search_documents_fts) kept in
+  sync by triggers, ranked with bm25().
+- PostgreSQL: a stored tsvector column (search_vector) with a GIN index,
+  ranked with ts_rank_cd().
+
+Other databases, or a schema built without the migration, fall back to a
+LIKE scan so the endpoint keeps working, just slower and unranked.
+"""
+from extensions import db
+from models import SearchDocument, Project, Question, Discussion, Annotation, ProjectFile, FilePageText
+from sqlalchemy import delete, insert, select, literal, text, inspect
+import html
+import re
+
+PROJECT = 'project'
+QUESTION = 'question'
+DISCUSSION = 'discussion'
+ANNOTATION = 'annotation'
+PAGE = 'page'
+KINDS = (PROJECT, QUESTION, DISCUSSION, ANNOTATION, PAGE)
+
+# Annotation types whose text is geometry (JSON points), not words
+GEOMETRY_TYPES = ('pencil', 'measure-angle')
+# Title matches count this much more than body matches
+TITLE_WEIGHT = 2.0
+SNIPPET_WORDS = 16
+MAX_TERMS = 16
+
+# Highlight markers; the snippet is HTML-escaped before they become <mark>
+_START, _STOP = '\x02', '\x03'
+_backend = {}  # engine url -> 'fts5', 'tsvector' or 'like'
+
+_COLUMNS = ['kind', 'ref_id', 'page', 'project_id', 'title', 'body']
+
+
+def source_selects():
+    """SELECTs producing search_documents rows from the source tables"""
+    return {
+        PROJECT: select(literal(PROJECT), Project.id, literal(0), Project.id, Project.name, Project.description),
+        QUESTION: select(literal(QUESTION), Question.id, literal(0), Question.project_id,
+                         Question.question, Question.answer),
+        DISCUSSION: select(literal(DISCUSSION), Discussion.id, literal(0), Discussion.project_id,
+                           literal(None), Discussion.message),
+        ANNOTATION: select(literal(ANNOTATION), Annotation.id, literal(0), Annotation.project_id,
+                           literal(None), Annotation.text)
+        .where(Annotation.annotation_type.notin_(GEOMETRY_TYPES), Annotation.text.isnot(None), Annotation.text != ''),
+        PAGE: select(literal(PAGE), FilePageText.file_id, FilePageText.page, ProjectFile.project_id,
+                     ProjectFile.name, FilePageText.text)
+        .join(ProjectFile, ProjectFile.id == FilePageText.file_id)
+        .where(FilePageText.text != ''),
+    }
+
+
+def _replace(kind, ref_ids, rows):
+    """Swap the documents of kind for ref_ids with rows, in the current transaction"""
+    if ref_ids:
+        db.session.execute(delete(SearchDocument).where(SearchDocument.kind == kind,
+                                                        SearchDocument.ref_id.in_(ref_ids)))
+    if rows:
+        db.session.execute(insert(SearchDocument), [dict(row, kind=kind, page=row.get('page', 0)) for row in rows])
+
+
+def index_project(project):
+    _replace(PROJECT, [project.id], [{'ref_id': project.id, 'project_id': project.id,
+                                      'title': project.name, 'body': project.description}])
+
+
+def index_question(question):
+    _replace(QUESTION, [question.id], [{'ref_id': question.id, 'project_id': question.project_id,
+                                        'title': question.question, 'body': question.answer}])
+
+
+def index_discussion(discussion):
+    _replace(DISCUSSION, [discussion.id], [{'ref_id': discussion.id, 'project_id': discussion.project_id,
+                                            'title': None, 'body': discussion.message}])
+
+
+def index_annotations(annotations):
+    """(Re)index annotations (ORM objects or rows with id, project_id, annotation_type, text)"""
+    _replace(ANNOTATION, [a.id for a in annotations], [
+        {'ref_id': a.id, 'project_id': a.project_id, 'title': None, 'body': a.text}
+        for a in annotations if a.text and a.annotation_type not in GEOMETRY_TYPES
+    ])
+
+
+def unindex_annotations(annotation_ids):
+    _replace(ANNOTATION, annotation_ids, [])
+
+
+def index_file_pages(file_id):
+    """(Re)index the stored page texts of one PDF"""
+    _replace(PAGE, [file_id], [])
+    db.session.execute(insert(SearchDocument).from_select(
+        _COLUMNS, source_selects()[PAGE].where(FilePageText.file_id == file_id)
+    ))
+
+
+def unindex_files(file_ids):
+    _replace(PAGE, file_ids, [])
+
+
+def purge_project(project_id):
+    db.session.execute(delete(SearchDocument).where(SearchDocument.project_id == project_id))
+
+
+def backend():
+    """Which full-text index this database has (checked once per engine)"""
+    engine = db.engine
+    key = str(engine.url)
+    if key not in _backend:
+        inspector = inspect(engine)
+        if engine.dialect.name == 'sqlite' and 'search_documents_fts' in inspector.get_table_names():
+            _backend[key] = 'fts5'
+        elif engine.dialect.name == 'postgresql' and any(
+                column['name'] == 'search_vector' for column in inspector.get_columns('search_documents')):
+            _backend[key] = 'tsvector'
+        else:
+            _backend[key] = 'like'
+    return _backend[key]
+
+
+def query_terms(query):
+    """Words of a user query; operators and punctuation are not passed through"""
+    return re.findall(r'\w+', query.lower())[:MAX_TERMS]
+
+
+def _highlight(snippet):
+    escaped = html.escape(snippet or '')
+    return escaped.replace(_START, '<mark>').replace(_STOP, '</mark>')
+
+
+def _bind_list(name, values, params):
+    """Placeholders for an IN list, adding the values to params"""
+    names = [f'{name}{number}' for number in range(len(values))]
+    params.update(zip(names, values))
+    return ', '.join(f':{placeholder}' for placeholder in names) or 'NULL'
+
+
+def _search_fts5(terms, params, scope):
+    # Every term must match; quoting keeps FTS5 syntax out of user input
+    params['match'] = ' '.join(f'"{term}"' for term in terms)
+    return db.session.execute(text(f"""
+        SELECT d.kind, d.ref_id, d.page, d.project_id, d.title,
+               snippet(search_documents_fts, -1, :start, :stop, '…', :words) AS snippet,
+               -bm25(search_documents_fts, {TITLE_WEIGHT}, 1.0) AS score
+        FROM search_documents_fts
+        JOIN search_documents d ON d.id = search_documents_fts.rowid
+        JOIN projects p ON p.id = d.project_id
+        WHERE search_documents_fts MATCH :match AND p.user_id = :user_id{scope}
+        ORDER BY bm25(search_documents_fts, {TITLE_WEIGHT}, 1.0)
+        LIMIT :limit
+    """), params).all()
+
+
+def _search_tsvector(terms, params, scope):
+    params['terms'] = ' '.join(terms)
+    params['options'] = f'StartSel={_START}, StopSel={_STOP}, MaxWords={SNIPPET_WORDS}, MinWords=5'
+    # Rank in the inner query so headlines are only built for the rows returned
+    return db.session.execute(text(f"""
+        SELECT d.kind, d.ref_id, d.page, d.project_id, d.title,
+               ts_headline('english', coalesce(d.title, '') || ' ' || coalesce(d.body, ''), q, :options) AS snippet,
+               ranked.score
+        FROM (
+            SELECT d.id, ts_rank_cd(d.search_vector, q) AS score
+            FROM search_documents d
+            JOIN projects p ON p.id = d.project_id,
+                 plainto_tsquery('english', :terms) q
+            WHERE d.search_vector @@ q AND p.user_id = :user_id{scope}
+            ORDER BY score DESC
+            LIMIT :limit
+        ) ranked
+        JOIN search_documents d ON d.id = ranked.id,
+             plainto_tsquery('english', :terms) q
+        ORDER BY ranked.score DESC
+    """), params).all()
+
+
+def _search_like(terms, params, scope):
+    criteria = []
+    for number, term in enumerate(terms):
+        params[f'term{number}'] = f'%{term}%'
+        criteria.append(f"(lower(coalesce(d.title, '')) LIKE :term{number}"
+                        f" OR lower(coalesce(d.body, '')) LIKE :term{number})")
+    rows = db.session.execute(text(f"""
+        SELECT d.kind, d.ref_id, d.page, d.project_id, d.title, d.body
+        FROM search_documents d
+        JOIN projects p ON p.id = d.project_id
+        WHERE {' AND '.join(criteria)} AND p.user_id = :user_id{scope}
+        ORDER BY d.id DESC
+        LIMIT :limit
+    """), params).all()
+    return [(row.kind, row.ref_id, row.page, row.project_id, row.title,
+             _like_snippet(row.title, row.body, terms), None) for row in rows]
+
+
+def _matches(content, terms):
+    return any(term in content.lower() for term in terms)
+
+
+def _like_snippet(title, body, terms):
+    """Words around the first match, from the body unless only the title matches"""
+    content = next((c for c in (body, title) if c and _matches(c, terms)), body or title or '')
+    words = content.split()
+    first = next((i for i, word in enumerate(words) if _matches(word, terms)), 0)
+    start = max(0, first - SNIPPET_WORDS // 2)
+    marked = [f'{_START}{word}{_STOP}' if _matches(word, terms) else word
+              for word in words[start:start + SNIPPET_WORDS]]
+    return ('…' if start else '') + ' '.join(marked) + ('…' if start + SNIPPET_WORDS < len(words) else '')
+
+
+def search(user_id, query, limit=20, project_ids=None, kinds=None):
+    """Ranked matches in the user's projects, best first.
+
+    project_ids and kinds optionally narrow the search. Every word of the
+    query must match (stemmed, where the index supports it).
+    """
+    terms = query_terms(query)
+    if not terms:
+        return []
+    params = {'user_id': user_id, 'limit': limit, 'start': _START, 'stop': _STOP, 'words': SNIPPET_WORDS}
+    scope = ''
+    if project_ids is not None:
+        scope += f" AND d.project_id IN ({_bind_list('project', project_ids, params)})"
+    if kinds:
+        scope += f" AND d.kind IN ({_bind_list('kind', kinds, params)})"
+
+    search_backend = backend()
+    if search_backend == 'fts5':
+        rows = _search_fts5(terms, params, scope)
+    elif search_backend == 'tsvector':
+        rows = _search_tsvector(terms, params, scope)
+    else:
+        rows = _search_like(terms, params, scope)
+
+    return [{
+        'kind': kind,
+        'id': ref_id,
+        'page': page or None,
+        'project_id': project_id,
+        'title': title,
+        'snippet': _highlight(snippet),
+        'score': score,
+    } for kind, ref_id, page, project_id, title, snippet, score in rows]
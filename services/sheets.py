@@ -0,0 +1,563 @@
+"""
+Spreadsheet ingestion into a columnar sheet cache.
+
+Uploaded workbooks are read once by an ingest_workbook job queued with the
+upload. Rows are streamed (openpyxl read-only mode for .xlsx, xlrd for
+.xls) and written out in chunks of CHUNK_ROWS rows as they are read, so a
+sheet is never held in memory whole. Each sheet becomes one NumPy array
+per column under sheets/<file_id>/<sheet>/ in the upload folder:
+
+- number columns: float64, NaN for empty cells
+- date columns: datetime64[s], NaT for empty cells
+- text columns (and mixed ones): int32 codes, -1 for empty cells, into a
+  dictionary of UTF-8 strings stored back to back (<column>.strings.npy)
+  with their offsets (<column>.offsets.npy)
+
+A column's kind is only known once all its rows are read: chunks are
+written with the kind of their own values, and those of a column that
+turns out to be mixed are converted to text when the sheet is finished.
+
+The first non-empty row is the header. Sheet and column metadata go into
+file_sheets. Slices and aggregates memory-map the arrays, so requests never
+reopen the workbook and only touch the columns they use. The finished
+arrays are stored through the storage backend, and an instance that does
+not have a column yet fetches it into its upload folder on first use; a
+file whose arrays are gone from storage altogether is ingested again. The first rows of
+every sheet are also rendered as text into the page text store, which makes
+schedules and bills of quantities searchable and available to the AI
+prompts like PDF pages.
+
+Settings (environment):
+    SHEET_MAX_ROWS      rows cached per sheet (default: 200000)
+    SHEET_MAX_COLUMNS   columns cached per sheet (default: 256)
+    SHEET_TEXT_ROWS     rows per sheet rendered as text (default: 2000)
+"""
+from collections import OrderedDict
+from flask import current_app
+from extensions import db
+from models import ProjectFile, FileSheet, FilePageText
+from services import etags, jobs, pdf_text, search, storage
+from sqlalchemy import delete, insert, update
+from datetime import date, datetime
+import numpy as np
+import json
+import os
+import threading
+
+MAX_ROWS = int(os.getenv('SHEET_MAX_ROWS', 200000))
+MAX_COLUMNS = int(os.getenv('SHEET_MAX_COLUMNS', 256))
+TEXT_ROWS = int(os.getenv('SHEET_TEXT_ROWS', 2000))
+# Rows buffered per column before they are written
+CHUNK_ROWS = 4096
+# Memory-mapped column arrays kept open per process
+OPEN_COLUMNS = 256
+MAX_GROUPS = 500
+
+PENDING = 'pending'
+READY = 'ready'
+FAILED = 'failed'
+
+NUMBER = 'number'
+DATE = 'date'
+TEXT = 'text'
+
+# Array type and empty cell of each kind of column
+STORAGE = {
+    NUMBER: (np.float64, np.nan),
+    DATE: ('datetime64[s]', np.datetime64('NaT')),
+    TEXT: (np.int32, -1)
+}
+
+_open = OrderedDict()  # (file_id, sheet, column) -> (values, dictionary)
+_open_lock = threading.Lock()
+
+
+class SheetError(ValueError):
+    """Raised for a slice or aggregate the sheet cannot answer"""
+
+
+class SheetUnavailable(Exception):
+    """Raised when a sheet's arrays are missing from storage; see requeue_missing()"""
+
+
+def cache_key(file_id):
+    return f'sheets/{file_id}'
+
+
+def column_key(file_id, sheet, column, suffix='values'):
+    return f'{cache_key(file_id)}/{sheet}/{column}.{suffix}.npy'
+
+
+def cache_dir(file_id):
+    return os.path.join(current_app.config['UPLOAD_FOLDER'], cache_key(file_id))
+
+
+def column_path(file_id, sheet, column, suffix='values'):
+    return os.path.join(current_app.config['UPLOAD_FOLDER'], column_key(file_id, sheet, column, suffix))
+
+
+def schedule_ingest(project_file):
+    """Queue ingestion of a new spreadsheet in the current transaction (flush first)"""
+    if project_file.file_type != 'excel':
+        return
+    try:
+        jobs.enqueue('ingest_workbook', {'file_id': project_file.id}, key=f'sheets:{project_file.id}')
+        project_file.sheet_status = PENDING
+    except jobs.QueueFull:
+        project_file.sheet_status = None
+
+
+def requeue_missing(file_id):
+    """Ingest a ready file again after its arrays were found missing, and commit"""
+    # Only the first request to notice flips the status and queues the job
+    flipped = db.session.execute(
+        update(ProjectFile)
+        .where(ProjectFile.id == file_id, ProjectFile.sheet_status == READY)
+        .values(sheet_status=None)
+    ).rowcount
+    if flipped:
+        project_file = db.session.get(ProjectFile, file_id)
+        db.session.refresh(project_file)
+        schedule_ingest(project_file)
+        etags.bump_project_version(project_file.project_id)
+    db.session.commit()
+
+
+def read_workbook(path):
+    """Yield (sheet name, row iterator) for every sheet, streaming the rows"""
+    if path.lower().endswith('.xls'):
+        yield from _read_xls(path)
+        return
+    from openpyxl import load_workbook
+    workbook = load_workbook(path, read_only=True, data_only=True)
+    try:
+        for worksheet in workbook.worksheets:
+            yield worksheet.title, worksheet.iter_rows(values_only=True)
+    finally:
+        workbook.close()
+
+
+def _read_xls(path):
+    import xlrd
+    book = xlrd.open_workbook(path, on_demand=True)
+    try:
+        for index in range(book.nsheets):
+            worksheet = book.sheet_by_index(index)
+            rows = (
+                [xlrd.xldate_as_datetime(cell.value, book.datemode) if cell.ctype == xlrd.XL_CELL_DATE
+                 else None if cell.ctype in (xlrd.XL_CELL_EMPTY, xlrd.XL_CELL_BLANK) else cell.value
+                 for cell in worksheet.row(number)]
+                for number in range(worksheet.nrows)
+            )
+            yield worksheet.name, rows
+            book.unload_sheet(index)
+    finally:
+        book.release_resources()
+
+
+def _empty(value):
+    return value is None or (isinstance(value, str) and not value.strip())
+
+
+def column_letter(index):
+    letters = ''
+    index += 1
+    while index:
+        index, remainder = divmod(index - 1, 26)
+        letters = chr(65 + remainder) + letters
+    return letters
+
+
+def write_sheet(file_id, sheet, rows):
+    """Stream a sheet's rows into its column arrays.
+
+    Returns (column names, column kinds, row count, truncated, the first
+    TEXT_ROWS rows of the kept columns for the text store).
+    """
+    os.makedirs(os.path.join(cache_dir(file_id), str(sheet)), exist_ok=True)
+    header = None
+    writers = []
+    head = []
+    row_count = 0
+    blank_rows = 0
+    truncated = False
+    for row in rows:
+        values = list(row[:MAX_COLUMNS])
+        if all(_empty(value) for value in values):
+            # Blank rows inside the data are kept, trailing ones dropped
+            if header is not None:
+                blank_rows += 1
+            continue
+        if header is None:
+            header = values
+            continue
+        if row_count + blank_rows >= MAX_ROWS:
+            truncated = True
+            break
+        if blank_rows:
+            for writer in writers:
+                writer.extend_empty(blank_rows)
+            head.extend([] for _ in range(min(blank_rows, max(0, TEXT_ROWS - row_count))))
+            row_count += blank_rows
+            blank_rows = 0
+        while len(writers) < len(values):
+            writers.append(ColumnWriter(file_id, sheet, len(writers), row_count))
+        for index, writer in enumerate(writers):
+            writer.append(values[index] if index < len(values) else None)
+        if row_count < TEXT_ROWS:
+            head.append(values)
+        row_count += 1
+
+    header = list(header or [])
+    while len(writers) < len(header):
+        writers.append(ColumnWriter(file_id, sheet, len(writers), row_count))
+    header += [None] * (len(writers) - len(header))
+    for writer in writers:
+        writer.close(row_count)
+    # Drop columns without a header or any value
+    keep = [i for i, writer in enumerate(writers) if not _empty(header[i]) or writer.has_values()]
+    kinds = [writers[position].finish(index) for index, position in enumerate(keep)]
+    for position in set(range(len(writers))) - set(keep):
+        writers[position].discard()
+    text_rows = [[row[i] if i < len(row) else None for i in keep] for row in head]
+    return column_names([header[i] for i in keep], keep), kinds, row_count, truncated, text_rows
+
+
+def column_names(header, positions):
+    """Header cells as unique names; unnamed columns are named by their letter"""
+    names, seen = [], {}
+    for value, position in zip(header, positions):
+        name = str(value).strip() if not _empty(value) else f'Column {column_letter(position)}'
+        seen[name] = seen.get(name, 0) + 1
+        names.append(name if seen[name] == 1 else f'{name} ({seen[name]})')
+    return names
+
+
+def column_kind(values):
+    kinds = set()
+    for value in values:
+        if _empty(value):
+            continue
+        if isinstance(value, (bool, int, float)):
+            kinds.add(NUMBER)
+        elif isinstance(value, (datetime, date)):
+            kinds.add(DATE)
+        else:
+            kinds.add(TEXT)
+    return kinds.pop() if len(kinds) == 1 else TEXT
+
+
+def _text(value):
+    if _empty(value):
+        return None
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return str(value).strip()
+
+
+def encode(values, kind, dictionary):
+    """Cell values as the array of a kind of column; text is added to dictionary"""
+    if kind == NUMBER:
+        return np.array([np.nan if _empty(v) else float(v) for v in values], dtype=np.float64)
+    if kind == DATE:
+        return np.array([np.datetime64('NaT') if _empty(v) else np.datetime64(v, 's') for v in values],
+                        dtype='datetime64[s]')
+    return np.array([-1 if (text := _text(v)) is None else dictionary.setdefault(text, len(dictionary))
+                     for v in values], dtype=np.int32)
+
+
+def decode(array):
+    """Cell values of a number or date chunk (None for empty cells)"""
+    return [None if value is None or value != value else value for value in array.tolist()]
+
+
+class ColumnWriter:
+    """One column of a sheet, written CHUNK_ROWS rows at a time"""
+
+    def __init__(self, file_id, sheet, position, empty_rows=0):
+        self.file_id = file_id
+        self.sheet = sheet
+        self.position = position
+        self.pending = []
+        self.chunks = []  # (kind, rows); kind is None for chunks without values
+        self.kinds = set()
+        self.dictionary = {}
+        self.length = 0
+        self.extend_empty(empty_rows)
+
+    def chunk_path(self, number):
+        return column_path(self.file_id, self.sheet, self.position, f'chunk{number}')
+
+    def append(self, value):
+        self.pending.append(value)
+        self.length += 1
+        if len(self.pending) >= CHUNK_ROWS:
+            self.flush()
+
+    def extend_empty(self, count):
+        for _ in range(count):
+            self.append(None)
+
+    def has_values(self):
+        return bool(self.kinds)
+
+    def flush(self):
+        values, self.pending = self.pending, []
+        if not values:
+            return
+        if all(_empty(value) for value in values):
+            self.chunks.append((None, len(values)))
+            return
+        kind = column_kind(values)
+        self.kinds.add(kind)
+        if len(self.kinds) > 1:
+            # Mixed column: it ends up as text, so write text from here on
+            kind = TEXT
+        np.save(self.chunk_path(len(self.chunks)), encode(values, kind, self.dictionary))
+        self.chunks.append((kind, len(values)))
+
+    def close(self, row_count):
+        """Pad the column to row_count rows and write what is pending"""
+        self.extend_empty(row_count - self.length)
+        self.flush()
+
+    def finish(self, index):
+        """Write the closed column as column index of the sheet and return its kind"""
+        kind = next(iter(self.kinds)) if len(self.kinds) == 1 else TEXT
+        dtype, empty = STORAGE[kind]
+        array = np.empty(self.length, dtype=dtype)
+        start = 0
+        for number, (chunk_kind, rows) in enumerate(self.chunks):
+            if chunk_kind is None:
+                array[start:start + rows] = empty
+            else:
+                chunk = np.load(self.chunk_path(number))
+                if chunk_kind != kind:
+                    chunk = encode(decode(chunk), TEXT, self.dictionary)
+                array[start:start + rows] = chunk
+                os.remove(self.chunk_path(number))
+            start += rows
+        np.save(column_path(self.file_id, self.sheet, index), array)
+        if kind == TEXT:
+            write_dictionary(self.file_id, self.sheet, index, self.dictionary)
+        return kind
+
+    def discard(self):
+        for number, (chunk_kind, _) in enumerate(self.chunks):
+            if chunk_kind is not None:
+                os.remove(self.chunk_path(number))
+
+
+def write_dictionary(file_id, sheet, index, dictionary):
+    encoded = [text.encode('utf-8') for text in dictionary]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(text) for text in encoded], out=offsets[1:])
+    np.save(column_path(file_id, sheet, index, 'offsets'), offsets)
+    np.save(column_path(file_id, sheet, index, 'strings'), np.frombuffer(b''.join(encoded), dtype=np.uint8))
+
+
+class StringDictionary:
+    """Text dictionary of a column: dictionary[code] is the string of a code"""
+
+    def __init__(self, offsets, strings):
+        self.offsets = offsets
+        self.strings = strings
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, code):
+        return self.strings[self.offsets[code]:self.offsets[code + 1]].tobytes().decode('utf-8')
+
+
+def sheet_text(name, names, rows):
+    """The first rows of a sheet as text, one line per row"""
+    lines = [f'Sheet: {name}', ' | '.join(names)]
+    for row in rows:
+        cells = [_text(value) or '' for value in row]
+        if any(cells):
+            lines.append(' | '.join(cells))
+    return '\n'.join(lines)
+
+
+def ingest_file(file_id):
+    """Cache every sheet of one uploaded spreadsheet; runs as a job"""
+    project_file = db.session.get(ProjectFile, file_id)
+    if project_file is None or project_file.sheet_status == READY:
+        return
+
+    # A retried job starts over
+    discard_files([file_id])
+    pdf_text.discard_files([file_id])
+    remove_caches([file_id])
+
+    pages = []
+    try:
+        with storage.backend().local_path(project_file.file_path) as path:
+            for sheet, (name, rows) in enumerate(read_workbook(path)):
+                names, kinds, row_count, truncated, text_rows = write_sheet(file_id, sheet, rows)
+                db.session.add(FileSheet(
+                    file_id=file_id, sheet=sheet, name=name[:255], row_count=row_count,
+                    columns=json.dumps([{'name': n, 'kind': k} for n, k in zip(names, kinds)]),
+                    truncated=truncated
+                ))
+                pages.append({'file_id': file_id, 'page': sheet + 1, 'text': sheet_text(name, names, text_rows)})
+    except ImportError as e:
+        # .xls needs xlrd; without it the file just stays unreadable
+        print(f"Cannot read spreadsheet {file_id}: {e}")
+        db.session.rollback()
+        project_file = db.session.get(ProjectFile, file_id)
+        project_file.sheet_status = FAILED
+        etags.bump_project_version(project_file.project_id)
+        db.session.commit()
+        return
+
+    if pages:
+        db.session.execute(insert(FilePageText), pages)
+    search.index_file_pages(file_id)
+    storage.backend().put_tree(cache_key(file_id))
+    project_file.sheet_status = READY
+    project_file.text_status = READY
+    # Both statuses are part of the project's representation
+    etags.bump_project_version(project_file.project_id)
+    db.session.commit()
+
+
+def ingest_failed(payload, error):
+    project_file = db.session.get(ProjectFile, payload['file_id'])
+    if project_file is not None:
+        project_file.sheet_status = FAILED
+        etags.bump_project_version(project_file.project_id)
+        db.session.commit()
+
+
+def discard_files(file_ids):
+    """Delete sheet metadata in the current transaction; remove_caches() after commit"""
+    if file_ids:
+        db.session.execute(delete(FileSheet).where(FileSheet.file_id.in_(file_ids)))
+
+
+def remove_caches(file_ids):
+    with _open_lock:
+        for key in [key for key in _open if key[0] in file_ids]:
+            del _open[key]
+    for file_id in file_ids:
+        storage.backend().delete_tree(cache_key(file_id))
+
+
+def load_column(file_sheet, index):
+    """(values, dictionary) of one cached column, memory-mapped; dictionary is None unless text"""
+    key = (file_sheet.file_id, file_sheet.sheet, index)
+    with _open_lock:
+        if key in _open:
+            _open.move_to_end(key)
+            return _open[key]
+
+    kind = json.loads(file_sheet.columns)[index]['kind']
+    suffixes = ('values', 'offsets', 'strings') if kind == TEXT else ('values',)
+    if not all(storage.backend().fetch(column_key(*key, suffix)) for suffix in suffixes):
+        raise SheetUnavailable(f"Sheet cache of file {file_sheet.file_id} is missing")
+    values = np.load(column_path(*key), mmap_mode='r')
+    dictionary = StringDictionary(np.load(column_path(*key, 'offsets'), mmap_mode='r'),
+                                  np.load(column_path(*key, 'strings'), mmap_mode='r')) if kind == TEXT else None
+    with _open_lock:
+        _open[key] = (values, dictionary)
+        while len(_open) > OPEN_COLUMNS:
+            _open.popitem(last=False)
+    return values, dictionary
+
+
+def column_index(file_sheet, name):
+    for index, column in enumerate(json.loads(file_sheet.columns)):
+        if column['name'] == name:
+            return index
+    raise SheetError(f"Unknown column: {name}")
+
+
+def to_json(values, dictionary, kind):
+    """Cells of a column slice as JSON values (None for empty cells)"""
+    if kind == TEXT:
+        return [str(dictionary[code]) if code >= 0 else None for code in values]
+    if kind == DATE:
+        return [None if np.isnat(value) else str(value) for value in values]
+    return [None if np.isnan(value) else int(value) if value.is_integer() else float(value) for value in values]
+
+
+def sheet_slice(file_sheet, offset, limit, names=None):
+    """Rows offset..offset+limit of the named columns (all by default)"""
+    columns = json.loads(file_sheet.columns)
+    indexes = [column_index(file_sheet, name) for name in names] if names else range(len(columns))
+    data = []
+    for index in indexes:
+        values, dictionary = load_column(file_sheet, index)
+        data.append(to_json(values[offset:offset + limit], dictionary, columns[index]['kind']))
+    return {
+        'columns': [columns[index]['name'] for index in indexes],
+        'offset': offset,
+        'rows': [list(row) for row in zip(*data)],
+        'row_count': file_sheet.row_count
+    }
+
+
+def _number_stats(values):
+    present = values[~np.isnan(values)]
+    if not len(present):
+        return {'count': 0, 'sum': 0.0, 'mean': None, 'min': None, 'max': None}
+    return {'count': int(len(present)), 'sum': float(present.sum()), 'mean': float(present.mean()),
+            'min': float(present.min()), 'max': float(present.max())}
+
+
+def aggregate(file_sheet, name, group_by=None):
+    """count/sum/mean/min/max of a number column, optionally per value of a text column.
+
+    Date columns report count, min and max; text columns count and
+    distinct values.
+    """
+    columns = json.loads(file_sheet.columns)
+    index = column_index(file_sheet, name)
+    kind = columns[index]['kind']
+    values, dictionary = load_column(file_sheet, index)
+
+    if group_by is None:
+        if kind == NUMBER:
+            return _number_stats(np.asarray(values))
+        if kind == DATE:
+            present = values[~np.isnat(values)]
+            return {'count': int(len(present)),
+                    'min': str(present.min()) if len(present) else None,
+                    'max': str(present.max()) if len(present) else None}
+        present = values[values >= 0]
+        return {'count': int(len(present)), 'distinct': int(len(np.unique(present)))}
+
+    group_index = column_index(file_sheet, group_by)
+    if columns[group_index]['kind'] != TEXT:
+        raise SheetError('group_by must be a text column')
+    if kind != NUMBER:
+        raise SheetError('Grouped aggregates need a number column')
+    codes, keys = load_column(file_sheet, group_index)
+    values = np.asarray(values)
+    mask = (np.asarray(codes) >= 0) & ~np.isnan(values)
+    codes, values = np.asarray(codes)[mask], values[mask]
+
+    counts = np.bincount(codes, minlength=len(keys))
+    sums = np.bincount(codes, weights=values, minlength=len(keys))
+    minimums = np.full(len(keys), np.inf)
+    maximums = np.full(len(keys), -np.inf)
+    np.minimum.at(minimums, codes, values)
+    np.maximum.at(maximums, codes, values)
+
+    order = np.argsort(-counts, kind='stable')[:MAX_GROUPS]
+    return {'groups': [{
+        'key': str(keys[code]),
+        'count': int(counts[code]),
+        'sum': float(sums[code]),
+        'mean': float(sums[code] / counts[code]),
+        'min': float(minimums[code]),
+        'max': float(maximums[code])
+    } for code in order if counts[code]]}
+
+
+jobs.register('ingest_workbook', lambda payload: ingest_file(payload['file_id']),
+              on_failure=ingest_failed)
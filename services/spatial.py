@@ -0,0 +1,141 @@
+"""
+Grid spatial index for annotations.
+
+Each annotation's bounding box is registered in the annotation_cells table
+under every grid cell it overlaps, keyed by (file_id, page). Shapes that
+would cover too many fine cells are stored on a coarser grid, and very
+large ones in a single catch-all cell, so every shape costs at most
+MAX_CELLS_PER_SHAPE rows. A viewport lookup is then a handful of index
+range scans followed by an exact bounding-box test on the same rows.
+
+The index is maintained explicitly by the write paths (single and batch
+annotation writes, deletes and project deletion) rather than by ORM
+events, because the batch endpoint writes with bulk statements that
+bypass the unit of work.
+"""
+from extensions import db
+from models import AnnotationCell
+from sqlalchemy import and_, or_, insert, delete, select
+import json
+import math
+
+# Cell sizes (in annotation coordinate units) for each grid level; the level
+# after the last one is a single catch-all cell for oversized shapes
+GRID_LEVELS = (256.0, 4096.0)
+CATCH_ALL_LEVEL = len(GRID_LEVELS)
+MAX_CELLS_PER_SHAPE = 16
+
+
+def annotation_bounds(annotation_type, x, y, width, height, text):
+    """Axis-aligned bounding box (min_x, min_y, max_x, max_y) of a shape as the editor draws it"""
+    # Freehand and angle annotations carry their geometry as a JSON list of points
+    if text and annotation_type in ('pencil', 'measure-angle'):
+        try:
+            points = [(float(p['x']), float(p['y'])) for p in json.loads(text)]
+        except (ValueError, TypeError, KeyError):
+            points = []
+        if points:
+            xs, ys = zip(*points)
+            return min(xs), min(ys), max(xs), max(ys)
+    
+    width = width or 0.0
+    height = height or 0.0
+    if annotation_type == 'circle':
+        radius = math.hypot(width, height) / 2
+        cx, cy = x + width / 2, y + height / 2
+        return cx - radius, cy - radius, cx + radius, cy + radius
+    
+    # Rectangles, lines and measurements may be drawn in any direction
+    return min(x, x + width), min(y, y + height), max(x, x + width), max(y, y + height)
+
+
+def _cell_range(low, high, size):
+    return math.floor(low / size), math.floor(high / size)
+
+
+def grid_cells(bounds):
+    """Return (level, [(cell_x, cell_y), ...]) for the finest level the box fits"""
+    min_x, min_y, max_x, max_y = bounds
+    for level, size in enumerate(GRID_LEVELS):
+        x0, x1 = _cell_range(min_x, max_x, size)
+        y0, y1 = _cell_range(min_y, max_y, size)
+        if (x1 - x0 + 1) * (y1 - y0 + 1) <= MAX_CELLS_PER_SHAPE:
+            return level, [(cx, cy) for cx in range(x0, x1 + 1) for cy in range(y0, y1 + 1)]
+    return CATCH_ALL_LEVEL, [(0, 0)]
+
+
+def cell_rows(annotation):
+    """Index rows for one annotation (an ORM object or a row with the same attributes)"""
+    bounds = annotation_bounds(annotation.annotation_type, annotation.x, annotation.y,
+                               annotation.width, annotation.height, annotation.text)
+    level, cells = grid_cells(bounds)
+    min_x, min_y, max_x, max_y = bounds
+    return [{
+        'annotation_id': annotation.id,
+        'file_id': annotation.file_id,
+        'page': annotation.page or 1,
+        'level': level,
+        'cell_x': cx,
+        'cell_y': cy,
+        'min_x': min_x,
+        'min_y': min_y,
+        'max_x': max_x,
+        'max_y': max_y
+    } for cx, cy in cells]
+
+
+def index_annotations(annotations):
+    """(Re)build the index rows of the given annotations in the current transaction"""
+    annotations = list(annotations)
+    if not annotations:
+        return
+    unindex_annotations([a.id for a in annotations])
+    rows = [row for annotation in annotations for row in cell_rows(annotation)]
+    db.session.execute(insert(AnnotationCell), rows)
+
+
+def unindex_annotations(annotation_ids):
+    if annotation_ids:
+        db.session.execute(delete(AnnotationCell).where(AnnotationCell.annotation_id.in_(annotation_ids)))
+
+
+def unindex_files(file_ids):
+    if file_ids:
+        db.session.execute(delete(AnnotationCell).where(AnnotationCell.file_id.in_(file_ids)))
+
+
+def parse_bbox(value):
+    """Parse 'x0,y0,x1,y1' into a normalized (min_x, min_y, max_x, max_y) tuple"""
+    try:
+        x0, y0, x1, y1 = (float(v) for v in value.split(','))
+    except (AttributeError, ValueError):
+        raise ValueError('bbox must be four numbers: x0,y0,x1,y1')
+    if not all(math.isfinite(v) for v in (x0, y0, x1, y1)):
+        raise ValueError('bbox must be finite')
+    return min(x0, x1), min(y0, y1), max(x0, x1), max(y0, y1)
+
+
+def viewport_annotation_ids(file_id, page, bbox):
+    """Select the ids of annotations on a page whose bounding box intersects bbox"""
+    min_x, min_y, max_x, max_y = bbox
+    
+    cell_ranges = []
+    for level, size in enumerate(GRID_LEVELS):
+        x0, x1 = _cell_range(min_x, max_x, size)
+        y0, y1 = _cell_range(min_y, max_y, size)
+        cell_ranges.append(and_(
+            AnnotationCell.level == level,
+            AnnotationCell.cell_x.between(x0, x1),
+            AnnotationCell.cell_y.between(y0, y1)
+        ))
+    cell_ranges.append(AnnotationCell.level == CATCH_ALL_LEVEL)
+    
+    return select(AnnotationCell.annotation_id).where(
+        AnnotationCell.file_id == file_id,
+        AnnotationCell.page == page,
+        or_(*cell_ranges),
+        AnnotationCell.min_x <= max_x,
+        AnnotationCell.max_x >= min_x,
+        AnnotationCell.min_y <= max_y,
+        AnnotationCell.max_y >= min_y
+    ).distinct()
@@ -0,0 +1,42 @@
+"""
+Server-sent events helpers.
+
+Events are written as they are produced: gunicorn sends each chunk of a
+streamed response as soon as the generator yields it, and the headers below
+stop nginx-style proxies and browsers from buffering or caching the stream.
+"""
+from flask import Response, stream_with_context
+import json
+
+
+def event(name, data, id=None):
+    """One SSE frame; data is sent as JSON so newlines survive.
+    
+    With an id, a reconnecting EventSource sends it back as Last-Event-ID.
+    """
+    frame = f"event: {name}\ndata: {json.dumps(data)}\n\n"
+    return frame if id is None else f"id: {id}\n{frame}"
+
+
+def retry(milliseconds):
+    """Tell EventSource how long to wait before reconnecting"""
+    return f"retry: {milliseconds}\n\n"
+
+
+def comment(text=''):
+    """A frame clients ignore; used to open the stream and as a heartbeat"""
+    return f": {text}\n\n"
+
+
+def response(generator, on_close=None):
+    """Stream a generator of frames, keeping the request context alive.
+    
+    on_close runs when the server is done with the response, including when
+    the client went away before the generator ever started.
+    """
+    stream = Response(stream_with_context(generator), mimetype='text/event-stream')
+    stream.headers['Cache-Control'] = 'no-cache'
+    stream.headers['X-Accel-Buffering'] = 'no'
+    if on_close is not None:
+        stream.call_on_close(on_close)
+    return stream
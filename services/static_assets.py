@@ -0,0 +1,156 @@
+"""
+In-memory manifest of the built frontend (dist/).
+
+The SPA build is scanned once at startup: every file is read, given a
+strong ETag and, for text types, gzip and Brotli variants. Requests are
+then answered from memory without touching the filesystem, picking the
+variant by Accept-Encoding. Precompressed .gz/.br files already in dist/
+are used instead of compressing again: the Docker build writes them with
+precompress() at the highest Brotli level, which is too slow to run in
+every worker at startup. Brotli needs the brotli package.
+
+Vite names bundles in dist/assets/ after their content hash, so those are
+cached as immutable for a year. Everything else (index.html above all) is
+revalidated on every use and answered with 304 while it is unchanged.
+
+Restart the app after rebuilding the frontend.
+
+Settings (environment):
+    STATIC_MEMORY_LIMIT  largest file kept in memory in bytes; bigger ones
+                         are sent from disk uncompressed (default: 4194304)
+"""
+from collections import namedtuple
+from flask import request, Response, send_file
+import gzip
+import hashlib
+import mimetypes
+import os
+import re
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+MEMORY_LIMIT = int(os.getenv('STATIC_MEMORY_LIMIT', 4 * 1024 * 1024))
+# Smaller files do not gain enough from compression to be worth a variant
+MIN_COMPRESS_SIZE = 1024
+# Brotli 11 compresses ~10% better than 9 but takes ~30x longer
+STARTUP_BROTLI_QUALITY = 9
+BUILD_BROTLI_QUALITY = 11
+IMMUTABLE = 'public, max-age=31536000, immutable'
+REVALIDATE = 'no-cache'
+
+COMPRESSIBLE_TYPES = ('application/javascript', 'application/json', 'application/manifest+json',
+                      'application/xml', 'image/svg+xml')
+# Preferred first
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+_HASHED_NAME = re.compile(r'^assets/.+-[A-Za-z0-9_-]{8}\.[a-z0-9]+$')
+
+Asset = namedtuple('Asset', 'path mimetype etag cache_control body variants')
+
+_manifest = {}  # relative path -> Asset
+
+
+def compressible(mimetype):
+    return mimetype.startswith('text/') or mimetype in COMPRESSIBLE_TYPES
+
+
+def compress(data, encoding, brotli_quality=STARTUP_BROTLI_QUALITY):
+    if encoding == 'gzip':
+        return gzip.compress(data, compresslevel=9, mtime=0)
+    if encoding == 'br' and brotli is not None:
+        return brotli.compress(data, quality=brotli_quality)
+    return None
+
+
+def precompress(folder):
+    """Write .br and .gz files next to the compressible files of a build"""
+    for root, _, names in os.walk(folder):
+        for name in names:
+            path = os.path.join(root, name)
+            mimetype = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+            if any(name.endswith(suffix) for _, suffix in ENCODINGS) or not compressible(mimetype):
+                continue
+            with open(path, 'rb') as file:
+                body = file.read()
+            if len(body) < MIN_COMPRESS_SIZE:
+                continue
+            for encoding, suffix in ENCODINGS:
+                variant = compress(body, encoding, BUILD_BROTLI_QUALITY)
+                if variant is not None and len(variant) < len(body):
+                    with open(path + suffix, 'wb') as file:
+                        file.write(variant)
+
+
+def load_asset(folder, relative_path):
+    path = os.path.join(folder, relative_path)
+    mimetype = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+    cache_control = IMMUTABLE if _HASHED_NAME.match(relative_path) else REVALIDATE
+    if os.path.getsize(path) > MEMORY_LIMIT:
+        return Asset(path, mimetype, None, cache_control, None, {})
+
+    with open(path, 'rb') as file:
+        body = file.read()
+    variants = {}
+    if compressible(mimetype) and len(body) >= MIN_COMPRESS_SIZE:
+        for encoding, suffix in ENCODINGS:
+            if os.path.isfile(path + suffix):
+                with open(path + suffix, 'rb') as file:
+                    variants[encoding] = file.read()
+            else:
+                variant = compress(body, encoding)
+                if variant is not None and len(variant) < len(body):
+                    variants[encoding] = variant
+    etag = hashlib.sha256(body).hexdigest()[:32]
+    return Asset(path, mimetype, etag, cache_control, body, variants)
+
+
+def load(folder):
+    """Build the manifest of folder; call once at startup"""
+    manifest = {}
+    for root, _, names in os.walk(folder):
+        for name in names:
+            relative_path = os.path.relpath(os.path.join(root, name), folder).replace(os.sep, '/')
+            # Precompressed variants are picked up with their original
+            if any(name.endswith(suffix) and name[:-len(suffix)] in names for _, suffix in ENCODINGS):
+                continue
+            manifest[relative_path] = load_asset(folder, relative_path)
+    _manifest.clear()
+    _manifest.update(manifest)
+    compressed = sum(1 for asset in manifest.values() if asset.variants)
+    print(f"Loaded {len(manifest)} frontend files ({compressed} with compressed variants)")
+
+
+def negotiate(asset):
+    """The best variant the client accepts, or None for the identity body"""
+    for encoding, _ in ENCODINGS:
+        if encoding in asset.variants and request.accept_encodings[encoding]:
+            return encoding
+    return None
+
+
+def send_asset(relative_path):
+    """Response for a file of the frontend build, or None if there is none"""
+    asset = _manifest.get(relative_path)
+    if asset is None:
+        return None
+    if asset.body is None:
+        response = send_file(asset.path, mimetype=asset.mimetype, conditional=True)
+        response.headers['Cache-Control'] = asset.cache_control
+        return response
+
+    encoding = negotiate(asset)
+    # Each representation needs its own strong ETag
+    etag = f'{asset.etag}-{encoding}' if encoding else asset.etag
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        response = Response(asset.variants[encoding] if encoding else asset.body, mimetype=asset.mimetype)
+        if encoding:
+            response.headers['Content-Encoding'] = encoding
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = asset.cache_control
+    if asset.variants:
+        response.vary.add('Accept-Encoding')
+    return response
@@ -0,0 +1,261 @@
+"""
+Pluggable storage for uploaded content.
+
+Stored files (content-addressed blobs and files from before them) are
+addressed by the key kept in ProjectFile.file_path / FileBlob.path, e.g.
+blobs/ab/<sha256>.pdf, and go through the backend chosen by
+STORAGE_BACKEND:
+
+- local: files under the upload folder, served by services/file_serving.py
+  (ranges, validators, sendfile). The default.
+- s3: any S3-compatible object store (AWS S3, MinIO, Cloudflare R2, ...).
+  Files are uploaded with parallel multipart transfers and downloads are
+  redirected to short-lived presigned URLs, so the object store serves
+  the bytes (ranges included) and no app worker does. Needs boto3;
+  credentials come from the usual AWS_ACCESS_KEY_ID/AWS_SECRET_ACCESS_KEY
+  environment variables or the instance role. For local testing point
+  STORAGE_S3_ENDPOINT_URL at an S3-compatible server, e.g. MinIO or
+  `moto_server -p 9000`.
+
+The upload folder stays local in both cases: it holds upload staging
+(tmp/, chunked upload parts) and the working copies of derived files
+(sheets/, tiles/). Code that needs the bytes on disk, such as PDF
+extraction, asks for local_path(key), which downloads into the staging
+folder when the backend is remote.
+
+Derived files are written into the upload folder under their key and then
+stored with put_tree(key). Another instance (or this one after a redeploy)
+gets them back into its upload folder with fetch(key) / fetch_tree(key)
+and keeps them there. With the local backend the upload folder is the
+store, so these only check that the files exist.
+
+Chunked upload parts are staged on the instance that started the upload;
+with more than one instance, route each upload's requests to the same one
+(sticky sessions). A part or completion reaching another instance is
+refused rather than assembled from an incomplete file.
+
+Settings (environment):
+    STORAGE_BACKEND          local or s3 (default: local)
+    STORAGE_S3_BUCKET        bucket name (required for s3)
+    STORAGE_S3_PREFIX        key prefix inside the bucket (default: none)
+    STORAGE_S3_ENDPOINT_URL  S3-compatible endpoint (default: AWS)
+    STORAGE_S3_REGION        region (default: from the AWS configuration)
+    STORAGE_S3_PART_SIZE     multipart part size in bytes (default: 8388608)
+    STORAGE_S3_CONCURRENCY   parallel part transfers per file (default: 8)
+    STORAGE_S3_URL_EXPIRY    presigned download URL lifetime in seconds
+                             (default: 3600)
+"""
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from flask import current_app, redirect
+from services import file_serving
+import mimetypes
+import os
+import shutil
+import uuid
+
+BACKEND = os.getenv('STORAGE_BACKEND', 'local')
+S3_BUCKET = os.getenv('STORAGE_S3_BUCKET')
+S3_PREFIX = os.getenv('STORAGE_S3_PREFIX', '')
+S3_ENDPOINT_URL = os.getenv('STORAGE_S3_ENDPOINT_URL') or None
+S3_REGION = os.getenv('STORAGE_S3_REGION') or None
+S3_PART_SIZE = int(os.getenv('STORAGE_S3_PART_SIZE', 8 * 1024 * 1024))
+S3_CONCURRENCY = int(os.getenv('STORAGE_S3_CONCURRENCY', 8))
+S3_URL_EXPIRY = int(os.getenv('STORAGE_S3_URL_EXPIRY', 3600))
+# Short enough that a cached redirect never outlives its presigned URL
+REDIRECT_CACHE_CONTROL = f'private, max-age={S3_URL_EXPIRY // 2}'
+
+
+class LocalStorage:
+    """Stored files under the upload folder"""
+
+    def __init__(self, root):
+        self.root = root
+
+    def path(self, key):
+        return os.path.join(self.root, key)
+
+    def put_file(self, source_path, key):
+        """Store a local file under key; the source file is moved"""
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        os.replace(source_path, path)
+
+    def exists(self, key):
+        return os.path.exists(self.path(key))
+
+    def delete(self, keys):
+        for key in keys:
+            if key and os.path.exists(self.path(key)):
+                os.remove(self.path(key))
+
+    def put_tree(self, key):
+        """Store the derived file or directory at key in the upload folder (already in place)"""
+
+    def fetch(self, key):
+        """Whether the derived file key is in the upload folder"""
+        return os.path.isfile(self.path(key))
+
+    def fetch_tree(self, key):
+        return os.path.isdir(self.path(key))
+
+    def delete_tree(self, key):
+        shutil.rmtree(self.path(key), ignore_errors=True)
+
+    @contextmanager
+    def local_path(self, key):
+        yield self.path(key)
+
+    def send(self, key):
+        return file_serving.send_upload(key)
+
+
+class S3Storage:
+    """Stored files as objects in an S3-compatible bucket"""
+
+    def __init__(self, bucket, prefix='', endpoint_url=None, region=None, staging=None, cache=None):
+        import boto3
+        from boto3.s3.transfer import TransferConfig
+        from botocore.config import Config
+
+        if not bucket:
+            raise RuntimeError('STORAGE_S3_BUCKET is required for the s3 storage backend')
+        self.bucket = bucket
+        self.prefix = prefix
+        self.staging = staging
+        self.cache = cache
+        # Enough pooled connections for every part of a parallel transfer
+        self.client = boto3.client('s3', endpoint_url=endpoint_url, region_name=region,
+                                   config=Config(signature_version='s3v4',
+                                                 max_pool_connections=max(10, S3_CONCURRENCY * 2)))
+        self.transfer = TransferConfig(multipart_threshold=S3_PART_SIZE, multipart_chunksize=S3_PART_SIZE,
+                                       max_concurrency=S3_CONCURRENCY, use_threads=True)
+
+    def object_key(self, key):
+        return self.prefix + key
+
+    def put_file(self, source_path, key):
+        """Upload a local file under key (multipart and in parallel when large); the source is removed"""
+        content_type = mimetypes.guess_type(key)[0] or 'application/octet-stream'
+        self.client.upload_file(source_path, self.bucket, self.object_key(key),
+                                ExtraArgs={'ContentType': content_type}, Config=self.transfer)
+        os.remove(source_path)
+
+    def exists(self, key):
+        from botocore.exceptions import ClientError
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=self.object_key(key))
+            return True
+        except ClientError as e:
+            if _not_found(e):
+                return False
+            raise
+
+    def cache_path(self, key):
+        return os.path.join(self.cache, key)
+
+    def list_keys(self, prefix):
+        keys = []
+        for page in self.client.get_paginator('list_objects_v2').paginate(
+                Bucket=self.bucket, Prefix=self.object_key(prefix)):
+            keys.extend(item['Key'][len(self.prefix):] for item in page.get('Contents', ()))
+        return keys
+
+    def put_tree(self, key):
+        """Upload the derived file or directory at key in the upload folder, keeping the local copy"""
+        root = self.cache_path(key)
+        if os.path.isfile(root):
+            paths = [root]
+        else:
+            paths = [os.path.join(folder, name) for folder, _, names in os.walk(root) for name in names]
+
+        def upload(path):
+            relative = os.path.relpath(path, self.cache).replace(os.sep, '/')
+            self.client.upload_file(path, self.bucket, self.object_key(relative),
+                                    ExtraArgs={'ContentType': mimetypes.guess_type(path)[0] or 'application/octet-stream'})
+        # Tile pyramids are many small files: upload them side by side
+        with ThreadPoolExecutor(max_workers=S3_CONCURRENCY) as pool:
+            list(pool.map(upload, paths))
+
+    def fetch(self, key):
+        """Download the derived file key into the upload folder unless it is there; False if not stored"""
+        from botocore.exceptions import ClientError
+        path = self.cache_path(key)
+        if os.path.isfile(path):
+            return True
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        partial = f'{path}.{uuid.uuid4().hex}.partial'
+        try:
+            self.client.download_file(self.bucket, self.object_key(key), partial)
+        except ClientError as e:
+            if os.path.exists(partial):
+                os.remove(partial)
+            if _not_found(e):
+                return False
+            raise
+        os.replace(partial, path)
+        return True
+
+    def fetch_tree(self, key):
+        """Download a stored derived directory into the upload folder; False if not stored"""
+        keys = self.list_keys(key.rstrip('/') + '/')
+        with ThreadPoolExecutor(max_workers=S3_CONCURRENCY) as pool:
+            list(pool.map(self.fetch, keys))
+        return bool(keys)
+
+    def delete_tree(self, key):
+        shutil.rmtree(self.cache_path(key), ignore_errors=True)
+        self.delete(self.list_keys(key.rstrip('/') + '/'))
+
+    def delete(self, keys):
+        keys = [self.object_key(key) for key in keys if key]
+        # DeleteObjects takes at most 1000 keys
+        for start in range(0, len(keys), 1000):
+            self.client.delete_objects(Bucket=self.bucket, Delete={
+                'Objects': [{'Key': key} for key in keys[start:start + 1000]],
+                'Quiet': True
+            })
+
+    @contextmanager
+    def local_path(self, key):
+        """Download an object to the staging folder for as long as it is needed"""
+        os.makedirs(self.staging, exist_ok=True)
+        path = os.path.join(self.staging, f'{uuid.uuid4().hex}{os.path.splitext(key)[1]}')
+        try:
+            self.client.download_file(self.bucket, self.object_key(key), path, Config=self.transfer)
+            yield path
+        finally:
+            if os.path.exists(path):
+                os.remove(path)
+
+    def presigned_url(self, key):
+        return self.client.generate_presigned_url(
+            'get_object', Params={'Bucket': self.bucket, 'Key': self.object_key(key)}, ExpiresIn=S3_URL_EXPIRY
+        )
+
+    def send(self, key):
+        response = redirect(self.presigned_url(key))
+        response.headers['Cache-Control'] = REDIRECT_CACHE_CONTROL
+        return response
+
+
+def _not_found(error):
+    return error.response.get('Error', {}).get('Code') in ('404', 'NoSuchKey', 'NotFound')
+
+
+def create_backend(app):
+    if BACKEND == 'local':
+        return LocalStorage(app.config['UPLOAD_FOLDER'])
+    if BACKEND == 's3':
+        return S3Storage(S3_BUCKET, S3_PREFIX, S3_ENDPOINT_URL, S3_REGION,
+                         staging=os.path.join(app.config['UPLOAD_FOLDER'], 'tmp'),
+                         cache=app.config['UPLOAD_FOLDER'])
+    raise RuntimeError(f"Unknown STORAGE_BACKEND: {BACKEND}")
+
+
+def backend():
+    """The storage backend of the current app (created on first use)"""
+    app = current_app._get_current_object()
+    if 'upload_storage' not in app.extensions:
+        app.extensions['upload_storage'] = create_backend(app)
+    return app.extensions['upload_storage']
@@ -41,17 +41,21 @@ def start_with_gunicorn():
             
         workers = os.environ.get('WORKERS', '2')
         timeout = os.environ.get('TIMEOUT', '120')
+        # Threaded workers, so open event streams don't tie up a whole worker
+        threads = os.environ.get('THREADS', '8')
         
         sys.argv = [
             'gunicorn', 
             'app:app', 
             '--bind', f'0.0.0.0:{port}', 
             '--workers', workers,
+            '--threads', threads,
             '--timeout', timeout,
+            '--config', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'gunicorn.conf.py'),
             '--access-logfile', '-',
             '--error-logfile', '-'
         ]
-        print(f"Starting server with gunicorn on port {port} with {workers} workers")
+        print(f"Starting server with gunicorn on port {port} with {workers} workers x {threads} threads")
         wsgi.run()
         return True
     except ImportError as e:
@@ -67,6 +71,7 @@ def start_with_waitress():
     try:
         from waitress import serve  # type: ignore[import-untyped]
         from app import app
+        from services import jobs
         
         # Get port from environment, with fallback
         port = os.environ.get('PORT', '5000')
@@ -76,6 +81,7 @@ def start_with_waitress():
             print(f"Invalid port '{port}', using default 5000")
             port = 5000
         print(f"Starting server with waitress on port {port}")
+        jobs.start_workers(app)
         serve(app, host='0.0.0.0', port=port)
         return True
     except ImportError:
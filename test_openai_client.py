@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+"""
+Test script for the shared OpenAI client (services/openai_client.py)
+
+Points OPENAI_BASE_URL at a local stub server, so no API key or network
+access is needed, and checks the concurrency limit, the read timeout and
+that a closed ChatStream gives its slot back.
+"""
+
+import json
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+MAX_CONCURRENCY = 2
+READ_TIMEOUT = 1
+
+# Read by services.openai_client at import
+os.environ.update({
+    'OPENAI_API_KEY': 'test-key',
+    'OPENAI_MAX_CONCURRENCY': str(MAX_CONCURRENCY),
+    'OPENAI_READ_TIMEOUT': str(READ_TIMEOUT),
+    'OPENAI_QUEUE_TIMEOUT': '5',
+    'OPENAI_MAX_RETRIES': '0',
+})
+
+
+class StubOpenAI(BaseHTTPRequestHandler):
+    """Answers chat completions; the model name picks the behaviour"""
+    in_flight = 0
+    max_in_flight = 0
+    lock = threading.Lock()
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        with StubOpenAI.lock:
+            StubOpenAI.in_flight += 1
+            StubOpenAI.max_in_flight = max(StubOpenAI.max_in_flight, StubOpenAI.in_flight)
+        try:
+            if body.get('stream'):
+                self.send_stream()
+            else:
+                # 'slow' outlasts the client's read timeout
+                time.sleep(READ_TIMEOUT * 3 if body['model'] == 'slow' else 0.3)
+                self.send_json(completion('stub answer'))
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        finally:
+            with StubOpenAI.lock:
+                StubOpenAI.in_flight -= 1
+
+    def send_json(self, payload):
+        data = json.dumps(payload).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def send_stream(self):
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.end_headers()
+        # A long generation: the client is expected to hang up early
+        for number in range(50):
+            chunk = completion(f'part {number} ', delta=True)
+            self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode())
+            self.wfile.flush()
+            time.sleep(0.1)
+        self.wfile.write(b"data: [DONE]\n\n")
+
+    def log_message(self, format, *args):
+        pass
+
+
+def completion(text, delta=False):
+    choice = {'index': 0, 'finish_reason': None if delta else 'stop'}
+    if delta:
+        choice['delta'] = {'role': 'assistant', 'content': text}
+    else:
+        choice['message'] = {'role': 'assistant', 'content': text}
+    return {
+        'id': 'chatcmpl-stub',
+        'object': 'chat.completion.chunk' if delta else 'chat.completion',
+        'created': int(time.time()),
+        'model': 'stub',
+        'choices': [choice]
+    }
+
+
+def start_stub():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StubOpenAI)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    os.environ['OPENAI_BASE_URL'] = f'http://127.0.0.1:{server.server_port}/v1'
+    return server
+
+
+def test_concurrency_limit(client):
+    print("\n1. Concurrency limit...")
+    StubOpenAI.max_in_flight = 0
+    answers = []
+    calls = [threading.Thread(target=lambda: answers.append(
+        client.chat(model='fast', messages=[{'role': 'user', 'content': 'hi'}]).choices[0].message.content
+    )) for _ in range(MAX_CONCURRENCY * 3)]
+    for call in calls:
+        call.start()
+    for call in calls:
+        call.join()
+    assert len(answers) == len(calls), f"only {len(answers)} of {len(calls)} calls answered"
+    assert StubOpenAI.max_in_flight == MAX_CONCURRENCY, \
+        f"{StubOpenAI.max_in_flight} requests in flight, limit is {MAX_CONCURRENCY}"
+    print(f"✓ {len(calls)} calls, at most {StubOpenAI.max_in_flight} in flight")
+
+
+def test_read_timeout(client):
+    print("\n2. Read timeout...")
+    import openai
+    started = time.monotonic()
+    try:
+        client.chat(model='slow', messages=[{'role': 'user', 'content': 'hi'}])
+    except openai.APITimeoutError:
+        elapsed = time.monotonic() - started
+        assert elapsed < READ_TIMEOUT * 2, f"timed out after {elapsed:.1f}s"
+        print(f"✓ Timed out after {elapsed:.1f}s (OPENAI_READ_TIMEOUT={READ_TIMEOUT})")
+    else:
+        raise AssertionError("slow call did not time out")
+
+
+def test_stream_releases_slot(client, openai_client):
+    print("\n3. ChatStream releases its slot on close...")
+    stream = client.chat_stream(model='stream', messages=[{'role': 'user', 'content': 'hi'}])
+    assert openai_client._slots._value == MAX_CONCURRENCY - 1, "stream holds no slot"
+    first = next(iter(stream))
+    stream.close()
+    stream.close()  # closing twice must not release twice
+    assert openai_client._slots._value == MAX_CONCURRENCY, "slot not released on close"
+    print(f"✓ Got {first!r}, closed early, {MAX_CONCURRENCY} slots free again")
+
+
+def test_openai_client():
+    print("Testing shared OpenAI client against a stub server...")
+    print("=" * 50)
+    server = start_stub()
+    from services import openai_client
+    client = openai_client.get_openai_client()
+    if client is None:
+        print("❌ OpenAI client could not be created (is the openai package installed?)")
+        sys.exit(1)
+    try:
+        test_concurrency_limit(client)
+        test_read_timeout(client)
+        test_stream_releases_slot(client, openai_client)
+    except AssertionError as e:
+        print(f"❌ {e}")
+        sys.exit(1)
+    finally:
+        openai_client.reset_client()
+        server.shutdown()
+    print("\n" + "=" * 50)
+    print("✅ All OpenAI client checks passed")
+
+
+if __name__ == '__main__':
+    test_openai_client()